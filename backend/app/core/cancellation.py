@@ -0,0 +1,98 @@
+"""
+Propagation des annulations vers les générations en cours
+
+Quand le client HTTP se déconnecte (onglet fermé, requête abandonnée), la
+génération en cours est annulée : la tâche asyncio est interrompue et la
+connexion vers le fournisseur est fermée, ce qui arrête le décodage côté
+Ollama / OpenAI au lieu de le laisser tourner jusqu'au bout pour rien.
+
+Les secondes de génération économisées sont estimées à partir de la durée
+moyenne observée des générations menées à terme (moyenne mobile par clé).
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ClientDisconnected(Exception):
+    """Le client s'est déconnecté avant la fin de la génération"""
+
+
+class CancellationMetrics:
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._expected: Dict[str, float] = {}
+        self.cancelled = 0
+        self.seconds_saved = 0.0
+        self.seconds_discarded = 0.0
+        self.by_key: Dict[str, Dict[str, float]] = {}
+
+    def record_completed(self, key: str, duration: float):
+        previous = self._expected.get(key)
+        self._expected[key] = duration if previous is None else previous + self.alpha * (duration - previous)
+
+    def expected_duration(self, key: str) -> Optional[float]:
+        return self._expected.get(key)
+
+    def record_cancelled(self, key: str, elapsed: float, saved: Optional[float] = None) -> float:
+        """Enregistre une annulation ; retourne les secondes de génération évitées"""
+        if saved is None:
+            expected = self._expected.get(key)
+            saved = max(expected - elapsed, 0.0) if expected is not None else 0.0
+        self.cancelled += 1
+        self.seconds_saved += saved
+        self.seconds_discarded += elapsed
+        entry = self.by_key.setdefault(key, {"cancelled": 0, "seconds_saved": 0.0})
+        entry["cancelled"] += 1
+        entry["seconds_saved"] += saved
+        return saved
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cancelled": self.cancelled,
+            "generation_seconds_saved": round(self.seconds_saved, 2),
+            "generation_seconds_discarded": round(self.seconds_discarded, 2),
+            "by_key": {key: {**entry, "seconds_saved": round(entry["seconds_saved"], 2)}
+                       for key, entry in self.by_key.items()},
+        }
+
+
+cancellation_metrics = CancellationMetrics()
+
+
+async def run_until_disconnect(request, awaitable: Awaitable, key: str = "default",
+                               poll_interval: float = 0.25, metrics: CancellationMetrics = None) -> Any:
+    """
+    Exécute `awaitable` en surveillant la connexion du client (Starlette Request).
+    À la déconnexion, la tâche est annulée et ClientDisconnected est levée.
+    """
+    metrics = metrics or cancellation_metrics
+    task = asyncio.ensure_future(awaitable)
+    start = time.monotonic()
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                break
+            if await request.is_disconnected():
+                task.cancel()
+                try:
+                    await task
+                except BaseException:
+                    pass
+                elapsed = time.monotonic() - start
+                saved = metrics.record_cancelled(key, elapsed)
+                logger.info(f"🛑 Client déconnecté: génération [{key}] annulée après {elapsed:.1f}s (~{saved:.1f}s évitées)")
+                raise ClientDisconnected(key)
+    except asyncio.CancelledError:
+        # Requête elle-même annulée (arrêt du serveur) : ne pas laisser la génération orpheline
+        task.cancel()
+        raise
+
+    result = task.result()
+    metrics.record_completed(key, time.monotonic() - start)
+    return result
@@ -0,0 +1,94 @@
+"""
+Échéances de requête
+
+Le client indique combien de temps il accepte d'attendre (en-tête
+`X-Request-Timeout` en secondes, ou champ `timeout` de /chat) ; à défaut,
+l'échéance par défaut de la route s'applique. L'échéance suit la requête
+dans une ContextVar : le limiteur de générations refuse d'emblée une
+requête qui ne pourrait pas démarrer à temps, l'attente en file est bornée
+par elle, et le délai accordé à Ollama est le temps restant, pas un délai
+fixe. Une fois l'utilisateur parti, plus rien ne tourne pour lui.
+
+Les tâches de fond lancées par une requête (workflows) s'en détachent :
+elles n'héritent pas de son échéance.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+# Instant limite (time.monotonic) de la requête en cours, None : pas d'échéance
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def parse_route_timeouts(spec: str) -> Dict[str, float]:
+    """"/chat=120,/agent=180" -> {"/chat": 120.0, "/agent": 180.0}"""
+    rules = {}
+    for rule in filter(None, (part.strip() for part in (spec or "").split(","))):
+        route, _, seconds = rule.partition("=")
+        try:
+            rules[route.strip()] = float(seconds)
+        except ValueError:
+            raise ValueError(f"Échéance de route invalide: {rule}")
+    return rules
+
+
+def route_timeout(path: str, rules: Dict[str, float]) -> Optional[float]:
+    """Échéance par défaut de la route (préfixe le plus long), None si aucune"""
+    best, timeout = -1, None
+    for prefix, seconds in rules.items():
+        if path.startswith(prefix) and len(prefix) > best:
+            best, timeout = len(prefix), seconds
+    return timeout
+
+
+def parse_timeout(value: Optional[str]) -> Optional[float]:
+    """Valeur d'en-tête en secondes ; absente, invalide ou négative : None"""
+    try:
+        seconds = float(value) if value else None
+    except ValueError:
+        return None
+    return seconds if seconds is not None and seconds > 0 else None
+
+
+def remaining() -> Optional[float]:
+    """Secondes restantes avant l'échéance (négatif si dépassée), None sans échéance"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def narrow_deadline(seconds: Optional[float]):
+    """Rapproche l'échéance de la requête en cours (jamais ne la repousse)"""
+    if seconds is None or seconds <= 0:
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is None or deadline < current:
+        _deadline.set(deadline)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    """Échéance à `seconds` (ou plus tôt si déjà plus proche) le temps du bloc"""
+    token = _deadline.set(_deadline.get())
+    try:
+        narrow_deadline(seconds)
+        yield remaining()
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def detached_deadline() -> Iterator[None]:
+    """Travail qui survit à la requête (tâche de fond) : pas d'échéance"""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
@@ -0,0 +1,144 @@
+"""
+Politique de routage entre petit modèle (brouillon) et modèle spécialiste
+
+Pour chaque demande, un score de complexité est calculé à partir de la
+longueur du message, de l'agent et d'un classifieur léger (code, traces
+d'erreur, vocabulaire de conception ou d'optimisation). Au-dessous du seuil,
+le brouillon du petit modèle suffit et le gros modèle n'est jamais sollicité.
+
+Le classifieur est remplaçable : toute fonction (message, agent) -> (score,
+raisons) peut être passée à ModelRoutingPolicy.
+"""
+
+import logging
+import re
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Agents dont les réponses gagnent le plus au modèle spécialiste
+SPECIALIST_AGENTS = {
+    "code-assistant", "debugger", "reviewer", "optimizer",
+    "architecte", "frontend_engineer", "backend_engineer", "database_specialist", "critique", "optimiseur",
+}
+
+CODE_PATTERN = re.compile(r"```|\bdef \w+\(|\bclass \w+|\bfunction \w+\(|=>|\{\s*\n|;\s*\n")
+TRACEBACK_PATTERN = re.compile(r"Traceback \(most recent call last\)|\b\w+(Error|Exception)\b|\bat \S+:\d+")
+COMPLEX_PATTERN = re.compile(
+    r"\b(architecture|archi|refactor\w*|optimis\w*|optimiz\w*|performance|sécurité|securite|vulnérabilit\w*|"
+    r"concurren\w*|algorithm\w*|complexité|scalab\w*|migration|conçoi\w*|concevoir|compare\w*|pourquoi|"
+    r"debug\w*|bug|erreur|implémente\w*|implemente\w*)\b",
+    re.IGNORECASE
+)
+SIMPLE_PATTERN = re.compile(
+    r"^\s*(salut|bonjour|bonsoir|hello|merci|ok|d'accord|oui|non|qu'est-ce que|c'est quoi|que veut dire|définis)\b",
+    re.IGNORECASE
+)
+
+Classifier = Callable[[str, str], Tuple[float, List[str]]]
+
+
+def model_size_billions(model: str) -> Optional[float]:
+    """Taille annoncée dans le nom du modèle Ollama ("deepseek-r1:8b" -> 8.0), None si inconnue"""
+    match = re.search(r"(\d+(?:\.\d+)?)b\b", model.lower())
+    return float(match.group(1)) if match else None
+
+
+def heuristic_classifier(message: str, agent: str, long_prompt_chars: int = 600) -> Tuple[float, List[str]]:
+    """Score de complexité entre 0 et 1, avec les raisons qui l'ont produit"""
+    score, reasons = 0.0, []
+    length = len(message)
+    if length >= long_prompt_chars:
+        score += 0.4
+        reasons.append("demande longue")
+    elif length >= long_prompt_chars / 3:
+        score += 0.15
+        reasons.append("demande moyenne")
+    if CODE_PATTERN.search(message):
+        score += 0.3
+        reasons.append("contient du code")
+    if TRACEBACK_PATTERN.search(message):
+        score += 0.2
+        reasons.append("trace d'erreur")
+    if COMPLEX_PATTERN.search(message):
+        score += 0.3
+        reasons.append("sujet complexe")
+    if message.count("?") >= 2:
+        score += 0.1
+        reasons.append("plusieurs questions")
+    if agent in SPECIALIST_AGENTS:
+        score += 0.2
+        reasons.append(f"agent spécialiste {agent}")
+    if SIMPLE_PATTERN.search(message) and length < long_prompt_chars / 3:
+        score -= 0.3
+        reasons.append("question simple")
+    return max(0.0, min(score, 1.0)), reasons
+
+
+class ModelRoutingPolicy:
+    """Décide, par demande, si le modèle spécialiste doit affiner le brouillon"""
+
+    def __init__(self, draft_model: str, threshold: float = 0.5, long_prompt_chars: int = 600,
+                 classifier: Optional[Classifier] = None):
+        self.draft_model = draft_model
+        self.threshold = threshold
+        self.long_prompt_chars = long_prompt_chars
+        self.classifier = classifier or (
+            lambda message, agent: heuristic_classifier(message, agent, self.long_prompt_chars)
+        )
+        self.decisions = defaultdict(int)
+
+    def decide(self, agent: str, message: str, refine_model: str,
+               available_models: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Retourne {"refine", "score", "reasons", "draft_model", "refine_model"}.
+        Sans petit modèle installé (ou s'il est le modèle spécialiste), une seule génération.
+        """
+        draft_model = self.draft_model
+        score, reasons = self.classifier(message, agent)
+
+        if available_models is not None and draft_model not in available_models:
+            draft_model, refine = refine_model, False
+            reasons = reasons + [f"modèle brouillon {self.draft_model} absent"]
+        elif draft_model == refine_model:
+            refine = False
+            reasons = reasons + ["brouillon et spécialiste identiques"]
+        else:
+            draft_size, refine_size = model_size_billions(draft_model), model_size_billions(refine_model)
+            if draft_size and refine_size and refine_size <= draft_size:
+                refine = False
+                reasons = reasons + ["spécialiste pas plus gros que le brouillon"]
+            else:
+                refine = score >= self.threshold
+
+        self.decisions["refined" if refine else "draft_only"] += 1
+        return {
+            "refine": refine,
+            "score": round(score, 2),
+            "reasons": reasons,
+            "draft_model": draft_model,
+            "refine_model": refine_model if refine else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.decisions.values())
+        return {
+            "decisions": dict(self.decisions),
+            "draft_only_ratio": round(self.decisions["draft_only"] / total, 3) if total else None,
+            "threshold": self.threshold,
+            "draft_model": self.draft_model,
+        }
+
+
+def _create_default_policy() -> ModelRoutingPolicy:
+    from ..utils.config import SPECULATIVE_CONFIG
+
+    return ModelRoutingPolicy(
+        SPECULATIVE_CONFIG["draft_model"],
+        threshold=SPECULATIVE_CONFIG["refine_threshold"],
+        long_prompt_chars=SPECULATIVE_CONFIG["long_prompt_chars"],
+    )
+
+
+model_routing_policy = _create_default_policy()
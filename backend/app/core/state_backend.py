@@ -0,0 +1,479 @@
+"""
+Backend d'état partagé entre workers
+
+L'état applicatif (statuts de workflows, configuration modifiable, métriques
+agrégées) passe par une interface clé/valeur rangée par espace de noms :
+- MemoryStateBackend : dictionnaire du processus (un seul worker, tests),
+- SQLiteStateBackend : fichier SQLite en mode WAL, partagé par tous les
+  workers uvicorn d'une même machine (`uvicorn --workers N`).
+
+Les valeurs sont sérialisées en JSON dans les deux implémentations : ce qui
+fonctionne en mémoire fonctionne à l'identique une fois partagé.
+
+Un espace de noms peut déclarer des index secondaires (create_index) : des
+champs filtrables et un champ de tri. query() parcourt alors l'index du plus
+récent au plus ancien, par pages reliées par un curseur, sans relire tout
+l'espace de noms.
+"""
+
+import base64
+import bisect
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Entrée d'index commune à toutes les clés : listing sans filtre
+ALL_FIELD = ""
+
+
+def encode_cursor(sort_value: str, key: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, key]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        sort_value, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(sort_value), str(key)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Curseur invalide") from e
+
+
+class StateBackend:
+    """Interface commune : valeurs JSON indexées par (espace de noms, clé)"""
+
+    name = "base"
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value: Any):
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> bool:
+        raise NotImplementedError
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def count(self, namespace: str) -> int:
+        return len(self.items(namespace))
+
+    def modify(self, namespace: str, key: str, func: Callable[[Any], Any], default: Any = None) -> Any:
+        """Lecture-modification-écriture atomique ; retourne la nouvelle valeur"""
+        raise NotImplementedError
+
+    def update(self, namespace: str, key: str, **fields) -> Optional[Dict[str, Any]]:
+        """Fusionne des champs dans un dictionnaire existant (None si la clé est absente)"""
+        def merge(current):
+            if current is None:
+                return None
+            current.update(fields)
+            return current
+        return self.modify(namespace, key, merge)
+
+    def namespace(self, namespace: str) -> "StateNamespace":
+        return StateNamespace(self, namespace)
+
+    def create_index(self, namespace: str, fields: Tuple[str, ...] = (), sort_field: str = "created_at"):
+        """
+        Index secondaires d'un espace de noms (à déclarer par chaque processus
+        qui y écrit). Les valeurs déjà stockées sont indexées au premier appel.
+        """
+        raise NotImplementedError
+
+    def query(self, namespace: str, filters: Optional[Dict[str, Any]] = None, since: Optional[str] = None,
+              until: Optional[str] = None, cursor: Optional[str] = None,
+              limit: int = 50) -> Tuple[List[Tuple[str, Any]], Optional[str]]:
+        """
+        Page de (clé, valeur) triée par champ de tri décroissant, filtrée par
+        égalité sur des champs indexés et par intervalle [since, until[.
+        Retourne aussi le curseur de la page suivante (None en fin de liste).
+        """
+        raise NotImplementedError
+
+    def _index_entries(self, namespace: str, value: Any) -> Optional[Tuple[str, List[Tuple[str, str]]]]:
+        """(valeur de tri, [(champ, valeur)]) à indexer pour une valeur, None si non indexé"""
+        spec = self._indexes.get(namespace)
+        if spec is None or not isinstance(value, dict):
+            return None
+        fields, sort_field = spec
+        entries = [(ALL_FIELD, "")] + [(field, _index_value(value.get(field))) for field in fields]
+        return _index_value(value.get(sort_field)), entries
+
+    def _check_filters(self, namespace: str, filters: Dict[str, Any]) -> List[Tuple[str, str]]:
+        spec = self._indexes.get(namespace)
+        if spec is None:
+            raise ValueError(f"Espace de noms non indexé: {namespace}")
+        unknown = [field for field in filters if field not in spec[0]]
+        if unknown:
+            raise ValueError(f"Champs non indexés: {', '.join(unknown)}")
+        return [(field, _index_value(value)) for field, value in filters.items() if value is not None]
+
+    def close(self):
+        pass
+
+
+def _index_value(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+class MemoryStateBackend(StateBackend):
+    name = "memory"
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.RLock()
+        self._indexes: Dict[str, Tuple[Tuple[str, ...], str]] = {}
+        # (espace, champ, valeur) -> [(tri, clé)] trié ; (espace, clé) -> entrées posées
+        self._sorted: Dict[Tuple[str, str, str], List[Tuple[str, str]]] = {}
+        self._indexed: Dict[Tuple[str, str], Tuple[str, List[Tuple[str, str]]]] = {}
+
+    def get(self, namespace, key, default=None):
+        raw = self._data.get(namespace, {}).get(key)
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._data.setdefault(namespace, {})[key] = json.dumps(value)
+            if namespace in self._indexes:
+                self._unindex(namespace, key)
+                self._reindex(namespace, key, value)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._unindex(namespace, key)
+            return self._data.get(namespace, {}).pop(key, None) is not None
+
+    def _reindex(self, namespace, key, value):
+        indexed = self._index_entries(namespace, value)
+        if indexed is None:
+            return
+        sort_value, entries = indexed
+        for field, field_value in entries:
+            bisect.insort(self._sorted.setdefault((namespace, field, field_value), []), (sort_value, key))
+        self._indexed[(namespace, key)] = indexed
+
+    def _unindex(self, namespace, key):
+        indexed = self._indexed.pop((namespace, key), None)
+        if indexed is None:
+            return
+        sort_value, entries = indexed
+        for field, field_value in entries:
+            bucket = self._sorted[(namespace, field, field_value)]
+            del bucket[bisect.bisect_left(bucket, (sort_value, key))]
+
+    def create_index(self, namespace, fields=(), sort_field="created_at"):
+        with self._lock:
+            if self._indexes.get(namespace) == (tuple(fields), sort_field):
+                return
+            self._indexes[namespace] = (tuple(fields), sort_field)
+            for key in list(self._data.get(namespace, {})):
+                self._unindex(namespace, key)
+                self._reindex(namespace, key, self.get(namespace, key))
+
+    def query(self, namespace, filters=None, since=None, until=None, cursor=None, limit=50):
+        conditions = self._check_filters(namespace, filters or {})
+        driver = conditions[0] if conditions else (ALL_FIELD, "")
+        upper = decode_cursor(cursor) if cursor else None
+        page = []
+        with self._lock:
+            bucket = self._sorted.get((namespace, *driver), [])
+            position = bisect.bisect_left(bucket, upper) if upper else len(bucket)
+            if until is not None:
+                position = min(position, bisect.bisect_left(bucket, (until, "")))
+            for sort_value, key in reversed(bucket[:position]):
+                if since is not None and sort_value < since:
+                    break
+                entries = dict(self._indexed[(namespace, key)][1])
+                if all(entries.get(field) == value for field, value in conditions[1:]):
+                    page.append((sort_value, key))
+                    if len(page) > limit:
+                        break
+            values = [(key, self.get(namespace, key)) for _, key in page[:limit]]
+        next_cursor = encode_cursor(*page[limit - 1]) if len(page) > limit else None
+        return values, next_cursor
+
+    def items(self, namespace):
+        with self._lock:
+            entries = list(self._data.get(namespace, {}).items())
+        return {key: json.loads(raw) for key, raw in entries}
+
+    def count(self, namespace):
+        return len(self._data.get(namespace, {}))
+
+    def modify(self, namespace, key, func, default=None):
+        with self._lock:
+            value = func(self.get(namespace, key, default))
+            if value is not None:
+                self.set(namespace, key, value)
+            return value
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    État partagé via un fichier SQLite (WAL) : lectures concurrentes sans
+    blocage, écritures sérialisées par SQLite entre processus.
+    Une connexion par thread ; les opérations durent quelques centaines de µs.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " updated_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state_index ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL,"
+            " sort TEXT NOT NULL, PRIMARY KEY (namespace, key, field))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS state_index_lookup ON state_index (namespace, field, value, sort, key)"
+        )
+        self._indexes: Dict[str, Tuple[Tuple[str, ...], str]] = {}
+        logger.info(f"🗄️ État partagé SQLite: {self.path}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit : transactions explicites uniquement dans modify()
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def get(self, namespace, key, default=None):
+        row = self._conn().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value):
+        conn = self._conn()
+        if namespace not in self._indexes:
+            self._write(conn, namespace, key, value)
+            return
+        # Valeur et index écrits dans la même transaction
+        with self._transaction(conn):
+            self._write(conn, namespace, key, value)
+            self._write_index(conn, namespace, key, value)
+
+    def _write(self, conn, namespace, key, value):
+        conn.execute(
+            "INSERT INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (namespace, key, json.dumps(value), time.time())
+        )
+
+    def _write_index(self, conn, namespace, key, value):
+        conn.execute("DELETE FROM state_index WHERE namespace = ? AND key = ?", (namespace, key))
+        indexed = self._index_entries(namespace, value)
+        if indexed is not None:
+            sort_value, entries = indexed
+            conn.executemany(
+                "INSERT INTO state_index (namespace, key, field, value, sort) VALUES (?, ?, ?, ?, ?)",
+                [(namespace, key, field, field_value, sort_value) for field, field_value in entries]
+            )
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn):
+        """Transaction d'écriture, ou celle déjà ouverte par modify()"""
+        if conn.in_transaction:
+            yield
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def delete(self, namespace, key):
+        conn = self._conn()
+        with self._transaction(conn):
+            conn.execute("DELETE FROM state_index WHERE namespace = ? AND key = ?", (namespace, key))
+            cursor = conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+        return cursor.rowcount > 0
+
+    def create_index(self, namespace, fields=(), sort_field="created_at"):
+        spec = (tuple(fields), sort_field)
+        if self._indexes.get(namespace) == spec:
+            return
+        self._indexes[namespace] = spec
+        conn = self._conn()
+        with self._transaction(conn):
+            rows = conn.execute("SELECT key, value FROM state WHERE namespace = ?", (namespace,)).fetchall()
+            for key, value in rows:
+                self._write_index(conn, namespace, key, json.loads(value))
+
+    def query(self, namespace, filters=None, since=None, until=None, cursor=None, limit=50):
+        conditions = self._check_filters(namespace, filters or {})
+        driver = conditions[0] if conditions else (ALL_FIELD, "")
+        sql = ["SELECT i.sort, i.key, s.value FROM state_index i",
+               "JOIN state s ON s.namespace = i.namespace AND s.key = i.key"]
+        params: List[Any] = []
+        # Filtres supplémentaires : jointure sur la clé primaire de l'index
+        for position, (field, value) in enumerate(conditions[1:]):
+            sql.append(f"JOIN state_index f{position} ON f{position}.namespace = i.namespace"
+                       f" AND f{position}.key = i.key AND f{position}.field = ? AND f{position}.value = ?")
+            params += [field, value]
+        sql.append("WHERE i.namespace = ? AND i.field = ? AND i.value = ?")
+        params += [namespace, *driver]
+        if since is not None:
+            sql.append("AND i.sort >= ?")
+            params.append(since)
+        if until is not None:
+            sql.append("AND i.sort < ?")
+            params.append(until)
+        if cursor:
+            sort_value, key = decode_cursor(cursor)
+            sql.append("AND (i.sort < ? OR (i.sort = ? AND i.key < ?))")
+            params += [sort_value, sort_value, key]
+        sql.append("ORDER BY i.sort DESC, i.key DESC LIMIT ?")
+        params.append(limit + 1)
+        rows = self._conn().execute(" ".join(sql), params).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return [(key, json.loads(value)) for _, key, value in rows[:limit]], next_cursor
+
+    def items(self, namespace):
+        rows = self._conn().execute(
+            "SELECT key, value FROM state WHERE namespace = ? ORDER BY key", (namespace,)
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def count(self, namespace):
+        return self._conn().execute("SELECT COUNT(*) FROM state WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def modify(self, namespace, key, func, default=None):
+        conn = self._conn()
+        # BEGIN IMMEDIATE : verrou d'écriture pris avant la lecture, pas de mise à jour perdue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            value = func(self.get(namespace, key, default))
+            if value is not None:
+                self.set(namespace, key, value)
+            conn.execute("COMMIT")
+            return value
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class StateNamespace(MutableMapping):
+    """
+    Vue dict d'un espace de noms. Les valeurs lues sont des copies : toute
+    modification doit être réécrite (`ns[key] = value` ou `ns.update_item`).
+    """
+
+    def __init__(self, backend: StateBackend, namespace: str):
+        self.backend = backend
+        self.namespace = namespace
+
+    def __getitem__(self, key):
+        value = self.backend.get(self.namespace, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.backend.set(self.namespace, key, value)
+
+    def __delitem__(self, key):
+        if not self.backend.delete(self.namespace, key):
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.backend.items(self.namespace))
+
+    def __len__(self):
+        return self.backend.count(self.namespace)
+
+    def __contains__(self, key):
+        return self.backend.get(self.namespace, key) is not None
+
+    def update_item(self, key: str, **fields) -> Optional[Dict[str, Any]]:
+        return self.backend.update(self.namespace, key, **fields)
+
+    def modify(self, key: str, func: Callable[[Any], Any], default: Any = None) -> Any:
+        return self.backend.modify(self.namespace, key, func, default)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return self.backend.items(self.namespace)
+
+    def create_index(self, fields: Tuple[str, ...] = (), sort_field: str = "created_at") -> "StateNamespace":
+        self.backend.create_index(self.namespace, fields, sort_field)
+        return self
+
+    def query(self, filters: Optional[Dict[str, Any]] = None, since: Optional[str] = None,
+              until: Optional[str] = None, cursor: Optional[str] = None,
+              limit: int = 50) -> Tuple[List[Tuple[str, Any]], Optional[str]]:
+        return self.backend.query(self.namespace, filters, since, until, cursor, limit)
+
+
+def create_state_backend(kind: str = "memory", path: Optional[str] = None) -> StateBackend:
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        return SQLiteStateBackend(path or "./data/state.db")
+    raise ValueError(f"Backend d'état inconnu: {kind}")
+
+
+_default_backend: Optional[StateBackend] = None
+
+
+def get_state_backend() -> StateBackend:
+    """Backend partagé par le processus, choisi par STATE_BACKEND (memory | sqlite)"""
+    global _default_backend
+    if _default_backend is None:
+        from ..utils.config import STATE_CONFIG
+
+        _default_backend = create_state_backend(STATE_CONFIG["backend"], STATE_CONFIG["path"])
+    return _default_backend
+
+
+_checkpoint_backend: Optional[StateBackend] = None
+
+
+def get_checkpoint_backend() -> StateBackend:
+    """
+    Stockage durable des points de reprise (workflows) : le backend partagé
+    s'il est déjà sur disque, sinon un fichier SQLite dédié.
+    """
+    global _checkpoint_backend
+    if _checkpoint_backend is None:
+        from ..utils.config import STATE_CONFIG
+
+        shared = get_state_backend()
+        _checkpoint_backend = shared if shared.name == "sqlite" else SQLiteStateBackend(STATE_CONFIG["checkpoint_path"])
+    return _checkpoint_backend
@@ -0,0 +1,88 @@
+"""
+Mémoïsation des étapes de workflow entre workflows et relances
+
+Une étape est entièrement déterminée par l'agent, son modèle, la demande
+(normalisée) et ce qu'elle reçoit des étapes amont (sortie précédente et
+contexte). La même étape rencontrée dans un autre workflow - le
+`visionnaire` en tête de chaque modèle, l'`architecte` commun à backend_api
+et full_development - est servie depuis le cache au lieu d'être régénérée.
+
+Les entrées vivent dans le stockage durable des points de reprise et
+expirent après `ttl` secondes.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_input(text: str) -> str:
+    """Espaces superflus retirés : deux saisies identiques à la mise en forme près partagent une entrée"""
+    return WHITESPACE_PATTERN.sub(" ", text or "").strip()
+
+
+def content_hash(value: Any) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def step_key(agent_role: str, model: str, request: str, context: Optional[Dict[str, Any]] = None) -> str:
+    """Clé (agent, modèle, entrée normalisée, empreintes amont)"""
+    context = dict(context or {})
+    upstream = context.pop("last_output", None)
+    return content_hash({
+        "agent": agent_role,
+        "model": model,
+        "input": normalize_input(request),
+        "upstream": content_hash(upstream) if upstream is not None else None,
+        "context": content_hash(context) if context else None,
+    })
+
+
+class StepMemoStore:
+    """Résultats d'étapes réutilisables, indexés par step_key"""
+
+    def __init__(self, store, ttl: float = 7 * 24 * 3600):
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.store.get(key)
+        if entry is not None and self.ttl and time.time() - entry["created_at"] > self.ttl:
+            del self.store[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.seconds_saved += entry.get("duration") or 0.0
+        return entry
+
+    def put(self, key: str, agent_role: str, model: str, output: Any, duration: float):
+        self.store[key] = {
+            "agent_role": agent_role,
+            "model": model,
+            "output": output,
+            "duration": duration,
+            "created_at": time.time(),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "generation_seconds_saved": round(self.seconds_saved, 2),
+        }
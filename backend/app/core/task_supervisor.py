@@ -0,0 +1,123 @@
+"""
+Superviseur de tâches de fond à concurrence bornée
+
+Les exécutions longues (workflows, générations) sont soumises ici plutôt que
+lancées depuis un handler HTTP/WebSocket : un sémaphore limite le nombre de
+tâches actives, les identifiants sont dédupliqués, et timeouts comme
+annulations sont gérés au même endroit.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Statuts de fin transmis au callback on_finished
+COMPLETED = "completed"
+FAILED = "failed"
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+
+FinishedCallback = Callable[[str, str, Optional[str]], Any]
+
+
+class TaskSupervisor:
+    def __init__(self, max_workers: int = 4, default_timeout: Optional[float] = None, name: str = "tasks"):
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.name = name
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._states: Dict[str, Dict[str, Any]] = {}
+
+    def submit(
+        self,
+        task_id: str,
+        coro_factory: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+        on_finished: Optional[FinishedCallback] = None,
+    ) -> bool:
+        """
+        Soumet une tâche. Retourne False si une tâche de même identifiant
+        est déjà en file ou en cours (pas de double exécution).
+        """
+        if task_id in self._tasks:
+            return False
+
+        self._states[task_id] = {"status": "queued", "submitted_at": time.time()}
+        task = asyncio.create_task(
+            self._run(task_id, coro_factory, timeout or self.default_timeout, on_finished),
+            name=f"{self.name}:{task_id}",
+        )
+        self._tasks[task_id] = task
+        task.add_done_callback(lambda _: self._forget(task_id))
+        return True
+
+    def _forget(self, task_id: str):
+        self._tasks.pop(task_id, None)
+        self._states.pop(task_id, None)
+
+    async def _run(self, task_id, coro_factory, timeout, on_finished):
+        status, error = COMPLETED, None
+        try:
+            async with self._semaphore:
+                self._states[task_id].update(status="running", started_at=time.time())
+                if timeout:
+                    await asyncio.wait_for(coro_factory(), timeout)
+                else:
+                    await coro_factory()
+        except asyncio.TimeoutError:
+            status, error = TIMEOUT, f"Délai dépassé ({timeout:.0f}s)"
+            logger.warning(f"⏱️ [{self.name}] {task_id} interrompue: {error}")
+        except asyncio.CancelledError:
+            # Statut enregistré (bloc finally), puis l'annulation remonte : shutdown et
+            # annulations extérieures doivent voir la tâche annulée, pas terminée
+            status, error = CANCELLED, "Annulé"
+            logger.info(f"🛑 [{self.name}] {task_id} annulée")
+            raise
+        except Exception as e:
+            status, error = FAILED, str(e)
+            logger.error(f"❌ [{self.name}] {task_id} en échec: {e}")
+        finally:
+            self._states[task_id].update(status=status, finished_at=time.time(), error=error)
+            if on_finished:
+                try:
+                    result = on_finished(task_id, status, error)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"❌ [{self.name}] callback de fin {task_id}: {e}")
+
+    def cancel(self, task_id: str) -> bool:
+        """Annule une tâche en file ou en cours"""
+        task = self._tasks.get(task_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def is_active(self, task_id: str) -> bool:
+        return task_id in self._tasks
+
+    def get_state(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self._states.get(task_id)
+
+    def stats(self) -> Dict[str, Any]:
+        running = sum(1 for state in self._states.values() if state["status"] == "running")
+        queued = sum(1 for state in self._states.values() if state["status"] == "queued")
+        return {
+            "max_workers": self.max_workers,
+            "running": running,
+            "queued": queued,
+            "active": len(self._tasks),
+        }
+
+    async def shutdown(self):
+        """Annule toutes les tâches actives et attend leur fin"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
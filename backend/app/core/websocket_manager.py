@@ -0,0 +1,217 @@
+"""
+Hub pub/sub des événements de workflow (WebSocket)
+
+Chaque workflow possède un canal : les événements publiés reçoivent un numéro
+de séquence croissant et sont conservés dans un buffer de rejeu borné. Un
+abonné qui se (re)connecte indique le dernier numéro reçu et obtient d'abord
+les événements manquants depuis le buffer, puis le flux en direct.
+
+Les fragments de génération (agent_streaming) sont en outre cumulés par
+agent : si le buffer a déjà évincé une partie du flux, l'abonné reçoit à la
+place un instantané (agent_snapshot) du texte complet. Une longue génération
+ne rend donc jamais le rejeu incomplet ; seul l'éviction d'un autre type
+d'événement est signalée par replay_truncated.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Types d'événements qui terminent un flux
+TERMINAL_EVENTS = {"workflow_completed", "workflow_error", "workflow_cancelled"}
+
+# Fragments de texte cumulés par agent (champ content) et rejouables en instantané
+STREAM_EVENTS = {"agent_streaming"}
+
+
+class _Subscriber:
+    def __init__(self, max_pending: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.lagged = False
+
+
+class WorkflowChannel:
+    """Canal d'un workflow : séquence, buffer de rejeu et abonnés"""
+
+    def __init__(self, workflow_id: str, replay_size: int, max_pending: int):
+        self.workflow_id = workflow_id
+        self.max_pending = max_pending
+        self.last_seq = 0
+        self.closed = False
+        self.buffer: Deque[Dict[str, Any]] = deque(maxlen=replay_size)
+        self.subscribers: Set[_Subscriber] = set()
+        # agent -> (fragments cumulés, seq du dernier fragment)
+        self.streams: Dict[Any, Tuple[List[str], int]] = {}
+        # seq du dernier événement hors flux évincé du buffer (0 : aucun)
+        self.dropped_seq = 0
+
+    @property
+    def first_buffered_seq(self) -> int:
+        return self.buffer[0]["seq"] if self.buffer else self.last_seq + 1
+
+    def publish(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Numérote l'événement, l'ajoute au buffer et le distribue"""
+        if self.closed:
+            logger.warning(f"Événement ignoré sur canal fermé: {self.workflow_id}")
+            return event
+
+        self.last_seq += 1
+        event = {**event, "seq": self.last_seq}
+        if len(self.buffer) == self.buffer.maxlen and self.buffer[0].get("type") not in STREAM_EVENTS:
+            self.dropped_seq = self.buffer[0]["seq"]
+        self.buffer.append(event)
+        if event.get("type") in STREAM_EVENTS:
+            parts, _ = self.streams.get(event.get("agent"), ([], 0))
+            parts.append(event.get("content") or "")
+            self.streams[event.get("agent")] = (parts, self.last_seq)
+
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Abonné trop lent : on le déconnecte, il pourra reprendre via last_seq
+                subscriber.lagged = True
+                self.subscribers.discard(subscriber)
+                self._wake(subscriber)
+
+        if event.get("type") in TERMINAL_EVENTS:
+            self.close()
+        return event
+
+    def close(self):
+        """Ferme le canal et réveille tous les abonnés"""
+        if self.closed:
+            return
+        self.closed = True
+        for subscriber in list(self.subscribers):
+            self._wake(subscriber)
+        self.subscribers.clear()
+
+    def _wake(self, subscriber: _Subscriber):
+        # Sentinelle de fin : on libère une place si la file est pleine
+        if subscriber.queue.full():
+            try:
+                subscriber.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        subscriber.queue.put_nowait(None)
+
+    def replay(self, last_seq: int) -> List[Dict[str, Any]]:
+        """
+        Événements postérieurs à last_seq. Si des fragments manquants ont été
+        évincés, le flux de chaque agent est remplacé par son instantané,
+        placé à la séquence de son dernier fragment.
+        """
+        if last_seq + 1 >= self.first_buffered_seq:
+            return [event for event in self.buffer if event["seq"] > last_seq]
+
+        events = [
+            event for event in self.buffer
+            if event["seq"] > last_seq and event.get("type") not in STREAM_EVENTS
+        ]
+        for agent, (parts, seq) in self.streams.items():
+            if seq > last_seq:
+                content = "".join(parts)
+                events.append({
+                    "type": "agent_snapshot",
+                    "workflow_id": self.workflow_id,
+                    "agent": agent,
+                    "content": content,
+                    "accumulated_length": len(content),
+                    "seq": seq,
+                })
+        return sorted(events, key=lambda event: event["seq"])
+
+
+class WorkflowEventHub:
+    """Registre des canaux de workflow avec rétention bornée"""
+
+    def __init__(self, replay_size: int = 2000, max_pending: int = 1000, max_channels: int = 200):
+        self.replay_size = replay_size
+        self.max_pending = max_pending
+        self.max_channels = max_channels
+        self.channels: "OrderedDict[str, WorkflowChannel]" = OrderedDict()
+
+    def channel(self, workflow_id: str) -> WorkflowChannel:
+        """Retourne (ou crée) le canal d'un workflow"""
+        channel = self.channels.get(workflow_id)
+        if channel is None:
+            channel = WorkflowChannel(workflow_id, self.replay_size, self.max_pending)
+            self.channels[workflow_id] = channel
+            self._evict()
+        return channel
+
+    def _evict(self):
+        """Supprime les plus anciens canaux fermés au-delà de max_channels"""
+        excess = len(self.channels) - self.max_channels
+        if excess <= 0:
+            return
+        for workflow_id in [wid for wid, ch in self.channels.items() if ch.closed][:excess]:
+            del self.channels[workflow_id]
+
+    def publish(self, workflow_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        return self.channel(workflow_id).publish(event)
+
+    def close(self, workflow_id: str):
+        if workflow_id in self.channels:
+            self.channels[workflow_id].close()
+
+    def reopen(self, workflow_id: str):
+        """Rouvre le canal d'un workflow relancé ; la numérotation continue, le texte cumulé repart de zéro"""
+        channel = self.channel(workflow_id)
+        channel.closed = False
+        channel.streams.clear()
+
+    def subscriber_count(self, workflow_id: Optional[str] = None) -> int:
+        if workflow_id is not None:
+            channel = self.channels.get(workflow_id)
+            return len(channel.subscribers) if channel else 0
+        return sum(len(channel.subscribers) for channel in self.channels.values())
+
+    async def subscribe(self, workflow_id: str, last_seq: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itère sur les événements d'un workflow à partir de last_seq.
+
+        Le rejeu et l'inscription se font sans point d'attente entre les deux,
+        aucun événement ne peut donc être perdu ou dupliqué à la jonction.
+        """
+        channel = self.channel(workflow_id)
+
+        if last_seq < channel.dropped_seq:
+            yield {
+                "type": "replay_truncated",
+                "workflow_id": workflow_id,
+                "requested_seq": last_seq,
+                "first_available_seq": channel.first_buffered_seq,
+            }
+
+        backlog = channel.replay(last_seq)
+        subscriber = None
+        if not channel.closed:
+            subscriber = _Subscriber(self.max_pending)
+            channel.subscribers.add(subscriber)
+
+        try:
+            for event in backlog:
+                yield event
+
+            if subscriber is None:
+                return
+
+            while True:
+                event = await subscriber.queue.get()
+                if event is None:
+                    if subscriber.lagged:
+                        yield {
+                            "type": "subscriber_lagged",
+                            "workflow_id": workflow_id,
+                            "last_seq": channel.last_seq,
+                        }
+                    return
+                yield event
+        finally:
+            if subscriber is not None:
+                channel.subscribers.discard(subscriber)
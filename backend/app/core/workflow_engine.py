@@ -1,6 +1,17 @@
+import asyncio
+import logging
+import time
 import uuid
 from datetime import datetime
 from enum import Enum
+from typing import Any, AsyncIterator, Dict, Optional
+
+from ..services.llm_provider import FallbackResponse
+from ..utils.tracing import tracer
+from .deadlines import detached_deadline
+from .websocket_manager import WorkflowEventHub
+
+logger = logging.getLogger(__name__)
 
 # ---- ENUM ÉTATS ----
 class WorkflowStatus(Enum):
@@ -8,11 +19,13 @@ class WorkflowStatus(Enum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    INTERRUPTED = "interrupted"  # Arrêt ou redémarrage du processus : reprise possible
 
 # ---- STEP ----
 class WorkflowStep:
-    def __init__(self, agent_role, task_description):
+    def __init__(self, agent_role, task_description, index=0):
         self.id = str(uuid.uuid4())
+        self.index = index
         self.agent_role = agent_role
         self.task_description = task_description
         self.status = WorkflowStatus.PENDING
@@ -21,10 +34,13 @@ class WorkflowStep:
         self.end_time = None
         self.error_message = None
         self.output_data = None
+        self.memoized = False  # Sortie servie par le cache d'étapes
+        self.edited = False  # Sortie fournie par l'utilisateur (réexécution incrémentale)
 
     def to_dict(self):
         return {
             "id": self.id,
+            "index": self.index,
             "agent_role": self.agent_role,
             "task_description": self.task_description,
             "status": self.status.value,
@@ -33,12 +49,86 @@ class WorkflowStep:
             "end_time": self.end_time.isoformat() if self.end_time else None,
             "error_message": self.error_message,
             "output_data": self.output_data,
+            "memoized": self.memoized,
+            "edited": self.edited,
         }
 
+
+def strip_outputs(workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """Vue allégée d'un workflow (sans sorties ni contexte) pour les sondages fréquents"""
+    view = {key: value for key, value in workflow.items() if key not in ("results", "context", "input_context", "pinned")}
+    view["steps"] = [{k: v for k, v in step.items() if k != "output_data"} for step in workflow["steps"]]
+    return view
+
+
+def workflow_summary(workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """Projection de listing : état et avancement, sans étapes ni sorties"""
+    return {
+        "id": workflow["id"],
+        "type": workflow["type"],
+        "name": workflow["name"],
+        "status": workflow["status"],
+        "request": workflow["request"],
+        "next_step": workflow["next_step"],
+        "total_steps": workflow["total_steps"],
+        "resumed": workflow.get("resumed", 0),
+        "parent_id": workflow.get("parent_id"),
+        "memo": workflow.get("memo"),
+        "version": workflow.get("version", 0),
+        "start_time": workflow["start_time"],
+        "end_time": workflow["end_time"],
+        "error": workflow["error"],
+    }
+
+
+def first_affected_step(steps, request_changed: bool, edited_roles=()) -> int:
+    """
+    Première étape à recalculer. Chaque étape lit la demande et la sortie de
+    l'étape précédente : une demande modifiée invalide toute la chaîne, une
+    sortie modifiée invalide les étapes qui la suivent.
+    """
+    if request_changed:
+        return 0
+    indices = [steps.index(role) + 1 for role in edited_roles]
+    return min(indices) if indices else len(steps)
+
 # ---- ORCHESTRATEUR ----
 class WorkflowOrchestrator:
-    def __init__(self):
-        self.running_workflows = {}
+    """
+    Exécute les workflows d'agents étape par étape. Chaque étape terminée est
+    écrite aussitôt dans le stockage de reprise (sortie, contexte, étape
+    suivante) : après un échec, un arrêt ou un redémarrage, resume_workflow
+    repart de la première étape incomplète sans refaire les générations finies.
+
+    Une étape identique (agent, modèle, entrée, sorties amont) déjà calculée par
+    un autre workflow est servie par le cache d'étapes (memo=False le désactive).
+    rerun_workflow réexécute un workflow après modification de la demande ou
+    d'une sortie en ne recalculant que les étapes situées en aval.
+
+    La progression est poussée sur le hub d'événements (step_started,
+    step_progress, step_completed...) et chaque modification de l'état
+    incrémente sa `version`, attendue par wait_for_change (long-polling).
+    """
+
+    # Regroupement des fragments générés en événements step_progress
+    progress_interval = 0.1
+    progress_min_chars = 64
+    # Relecture du stockage pendant une attente (workflow exécuté par un autre worker)
+    change_poll_interval = 1.0
+
+    def __init__(self, store=None, agent_runner=None, memo=None, agent_models: Optional[Dict[str, str]] = None,
+                 events: Optional[WorkflowEventHub] = None):
+        self._store = store
+        self._indexed = False
+        self.events = events or WorkflowEventHub()
+        self._waiters: Dict[str, asyncio.Event] = {}
+        self._pollers: Dict[str, int] = {}  # Long-polls en attente par workflow
+        self._agent_runner = agent_runner
+        self._memo = memo
+        self._agent_models = agent_models
+        self._router = None
+        # Workflows exécutés par ce processus (les autres sont repris, jamais doublés)
+        self._tasks: Dict[str, asyncio.Task] = {}
         self.workflow_templates = {
             "full_development": {
                 "name": "Développement Complet",
@@ -70,95 +160,424 @@ class WorkflowOrchestrator:
             }
         }
 
+    @property
+    def running_workflows(self):
+        """Workflows et points de reprise (SQLite, ouvert au premier usage), indexés par statut et type"""
+        if self._store is None:
+            from .state_backend import get_checkpoint_backend
+            self._store = get_checkpoint_backend().namespace("agent_workflows")
+        if not self._indexed:
+            self._store.create_index(("status", "type"), sort_field="start_time")
+            self._indexed = True
+        return self._store
+
+    @property
+    def memo(self):
+        """Cache d'étapes partagé (None si désactivé par STEP_MEMO=false)"""
+        if self._memo is None:
+            from ..utils.config import STEP_MEMO_CONFIG
+            from .state_backend import get_checkpoint_backend
+            from .step_memo import StepMemoStore
+
+            self._memo = False
+            if STEP_MEMO_CONFIG["enabled"]:
+                self._memo = StepMemoStore(get_checkpoint_backend().namespace("step_memo"), ttl=STEP_MEMO_CONFIG["ttl"])
+        return self._memo or None
+
+    def _agent_model(self, agent_role: str) -> str:
+        if self._agent_models is not None:
+            return self._agent_models.get(agent_role, "")
+        from ..utils.config import get_agent_model
+        return get_agent_model(agent_role)
+
+    async def _query_agent(self, agent_role: str, message: str, context: dict, on_delta=None) -> str:
+        if self._agent_runner is None:
+            from ..services.ai_service import query_agent
+            self._agent_runner = query_agent
+        return await self._agent_runner(agent_role, message, context, on_delta=on_delta)
+
+    # ---- Événements et versions ----
+
+    def _publish(self, workflow_id: str, event_type: str, **data) -> Dict[str, Any]:
+        return self.events.publish(workflow_id, {
+            "type": event_type,
+            "workflow_id": workflow_id,
+            "timestamp": datetime.now().isoformat(),
+            **data
+        })
+
+    def _update(self, workflow_id: str, apply=None, **fields) -> Optional[Dict[str, Any]]:
+        """Modifie l'état sauvegardé, incrémente sa version et réveille les attentes"""
+        def change(workflow):
+            if workflow is None:
+                return None
+            if apply is not None:
+                apply(workflow)
+            workflow.update(fields)
+            workflow["version"] = workflow.get("version", 0) + 1
+            return workflow
+        workflow = self.running_workflows.modify(workflow_id, change)
+        waiter = self._waiters.pop(workflow_id, None)
+        if waiter is not None:
+            waiter.set()
+        return workflow
+
+    async def wait_for_change(self, workflow_id: str, since_version: int, timeout: float = 30.0) -> Optional[Dict[str, Any]]:
+        """
+        Long-polling : rend l'état dès que sa version dépasse `since_version`,
+        ou l'état courant à l'expiration de `timeout`.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            workflow = self.running_workflows.get(workflow_id)
+            remaining = deadline - time.monotonic()
+            if workflow is None or workflow.get("version", 0) > since_version or remaining <= 0:
+                return workflow
+            waiter = self._waiters.setdefault(workflow_id, asyncio.Event())
+            self._pollers[workflow_id] = self._pollers.get(workflow_id, 0) + 1
+            try:
+                await asyncio.wait_for(waiter.wait(), min(remaining, self.change_poll_interval))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._release_waiter(workflow_id, waiter)
+
+    def _release_waiter(self, workflow_id: str, waiter: asyncio.Event):
+        """Le dernier long-poll d'un workflow retire son événement (workflow terminé ou inconnu : rien ne reste)"""
+        pollers = self._pollers.get(workflow_id, 1) - 1
+        if pollers > 0:
+            self._pollers[workflow_id] = pollers
+            return
+        self._pollers.pop(workflow_id, None)
+        if self._waiters.get(workflow_id) is waiter:
+            del self._waiters[workflow_id]
+
+    async def stream_events(self, workflow_id: str, last_seq: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Événements d'un workflow à partir de `last_seq`. Un workflow inconnu de
+        ce processus (autre worker, redémarrage) ne produit que son état courant.
+        """
+        if workflow_id not in self.events.channels and workflow_id not in self._tasks:
+            workflow = self.running_workflows.get(workflow_id)
+            if workflow is not None:
+                yield {
+                    "type": "workflow_snapshot",
+                    "workflow_id": workflow_id,
+                    "status": workflow["status"],
+                    "version": workflow.get("version", 0),
+                    "next_step": workflow["next_step"],
+                    "total_steps": workflow["total_steps"],
+                }
+            return
+        async for event in self.events.subscribe(workflow_id, last_seq):
+            yield event
+
+    def _progress_publisher(self, workflow_id: str, step: "WorkflowStep"):
+        """Fragments regroupés (au plus un événement par intervalle) ; flush() vide le reste"""
+        pending, state = [], {"chars": 0, "last": time.monotonic()}
+
+        def flush():
+            if pending:
+                state["chars"] += sum(len(chunk) for chunk in pending)
+                self._publish(workflow_id, "step_progress", index=step.index, agent_role=step.agent_role,
+                              delta="".join(pending), chars=state["chars"])
+                pending.clear()
+            state["last"] = time.monotonic()
+
+        def on_delta(chunk: str):
+            pending.append(chunk)
+            if (time.monotonic() - state["last"] >= self.progress_interval
+                    or sum(len(c) for c in pending) >= self.progress_min_chars):
+                flush()
+
+        on_delta.flush = flush
+        return on_delta
+
     def get_available_workflows(self):
         return self.workflow_templates
 
+    @property
+    def router(self):
+        """Routeur construit au premier usage (branché sur les métriques et la configuration)"""
+        if self._router is None:
+            from .workflow_router import create_workflow_router
+            self._router = create_workflow_router(self.workflow_templates)
+        return self._router
+
     def suggest_workflow(self, user_request: str) -> str:
-        req = user_request.lower()
-        if "frontend" in req:
-            return "frontend_only"
-        elif "api" in req or "backend" in req:
-            return "backend_api"
-        elif "review" in req or "optimise" in req or "optimiser" in req or "analyse" in req:
-            return "code_review"
-        else:
-            return "full_development"
+        """Workflow le moins coûteux couvrant la demande (règles seules, sans appel au modèle)"""
+        return self.router.route(user_request, allow_agents=False)["workflow"]
 
-    async def execute_workflow(
-        self, workflow_type: str, user_request: str, context: dict = None,
-        workflow_id: str = None, results_dict: dict = None
-    ):
+    def create_workflow(self, workflow_type: str, user_request: str, context: dict = None,
+                        workflow_id: str = None, force_refresh: bool = False) -> str:
+        """
+        Enregistre un workflow à exécuter (point de reprise initial).
+        `force_refresh` régénère toutes les étapes sans consulter le cache d'étapes.
+        """
         if workflow_type not in self.workflow_templates:
             raise ValueError("Type de workflow inconnu")
 
         workflow_id = workflow_id or f"workflow_{uuid.uuid4().hex[:8]}"
-        print(f"[DEBUG] Workflow créé avec l'ID {workflow_id}")
-        context = context or {}
-        steps_data = []
-        agent_outputs = {}
-
-        workflow_data = {
+        logger.debug("Workflow créé", extra={"workflow_id": workflow_id, "workflow_type": workflow_type})
+        template = self.workflow_templates[workflow_type]
+        self.running_workflows[workflow_id] = {
             "id": workflow_id,
             "type": workflow_type,
-            "name": self.workflow_templates[workflow_type]["name"],
-            "description": self.workflow_templates[workflow_type]["description"],
-            "status": WorkflowStatus.RUNNING.value,
+            "name": template["name"],
+            "description": template["description"],
+            "status": WorkflowStatus.PENDING.value,
+            "request": user_request,
+            "context": dict(context or {}),
+            "input_context": dict(context or {}),
+            "next_step": 0,
+            "total_steps": len(template["steps"]),
             "steps": [],
             "results": {},
+            "resumed": 0,
+            "force_refresh": force_refresh,
+            "memo": {"reused_steps": 0, "seconds_saved": 0.0},
+            "pinned": {},
+            "parent_id": None,
+            "version": 1,
             "start_time": datetime.now().isoformat(),
             "end_time": None,
             "error": None
         }
+        # Canal ouvert dès la création : un client abonné avant le démarrage reçoit tout
+        self.events.channel(workflow_id)
+        return workflow_id
+
+    async def execute_workflow(
+        self, workflow_type: str, user_request: str, context: dict = None,
+        workflow_id: str = None, results_dict: dict = None, force_refresh: bool = False
+    ):
+        workflow_id = self.create_workflow(workflow_type, user_request, context, workflow_id, force_refresh)
+        return await self._run(workflow_id, results_dict)
+
+    def prepare_resume(self, workflow_id: str, force: bool = False) -> Dict[str, Any]:
+        """
+        Valide la reprise et remet le workflow en attente à partir de sa
+        première étape incomplète. `force` reprend un workflow resté "running"
+        (processus arrêté brutalement avant d'avoir pu le marquer interrompu).
+        """
+        workflow = self.running_workflows.get(workflow_id)
+        if workflow is None:
+            raise KeyError(workflow_id)
+        if workflow_id in self._tasks:
+            raise ValueError("Workflow déjà en cours d'exécution dans ce processus")
+        if workflow["status"] == WorkflowStatus.COMPLETED.value:
+            return workflow
+        if workflow["status"] == WorkflowStatus.RUNNING.value and not force:
+            raise ValueError("Workflow marqué en cours : utiliser force=true si son processus s'est arrêté")
+
+        def reset(current):
+            # Les étapes en échec seront rejouées ; les étapes terminées sont conservées
+            current["steps"] = [step for step in current["steps"] if step["status"] == WorkflowStatus.COMPLETED.value]
+            current.update(status=WorkflowStatus.PENDING.value, error=None, end_time=None,
+                           resumed=current.get("resumed", 0) + 1)
+        return self._update(workflow_id, reset)
+
+    async def resume_workflow(self, workflow_id: str, results_dict: dict = None, force: bool = False):
+        self.prepare_resume(workflow_id, force)
+        return await self._run(workflow_id, results_dict)
+
+    def prepare_rerun(self, workflow_id: str, user_request: str = None, edits: Dict[str, Any] = None,
+                      force_refresh: bool = False) -> Dict[str, Any]:
+        """
+        Crée un nouveau workflow dérivé de `workflow_id` : les étapes non
+        affectées par la nouvelle demande ou par les sorties éditées (`edits`,
+        rôle -> sortie) reprennent les sorties du précédent passage, seules
+        les étapes en aval sont à exécuter. Les sorties éditées sont conservées
+        telles quelles, jamais régénérées.
+        """
+        from .step_memo import normalize_input
+
+        parent = self.running_workflows.get(workflow_id)
+        if parent is None:
+            raise KeyError(workflow_id)
+        if workflow_id in self._tasks or parent["status"] == WorkflowStatus.RUNNING.value:
+            raise RuntimeError("Workflow en cours : attendre sa fin (ou l'arrêter) avant de le réexécuter")
+        steps = self.workflow_templates[parent["type"]]["steps"]
+        edits = dict(edits or {})
+        unknown = [role for role in edits if role not in steps]
+        if unknown:
+            raise ValueError(f"Étapes absentes du workflow {parent['type']}: {', '.join(unknown)}")
+
+        request = parent["request"] if user_request is None else user_request
+        request_changed = normalize_input(request) != normalize_input(parent["request"])
+        # Seules les étapes terminées lors du passage précédent sont réutilisables
+        start = min(first_affected_step(steps, request_changed, edits), parent["next_step"])
+
+        input_context = parent.get("input_context")
+        if input_context is None:
+            input_context = {k: v for k, v in parent["context"].items() if k != "last_output"}
+        reused_steps, results = [], {}
+        previous = {step["index"]: step for step in parent["steps"] if step["status"] == WorkflowStatus.COMPLETED.value}
+        for index in range(start):
+            role = steps[index]
+            step = dict(previous[index], reused=True)
+            if role in edits:
+                step.update(output_data=edits[role], edited=True, memoized=False)
+            reused_steps.append(step)
+            results[role] = step["output_data"]
+        context = dict(input_context)
+        if start:
+            context["last_output"] = results[steps[start - 1]]
+
+        rerun_id = self.create_workflow(parent["type"], request, input_context, force_refresh=force_refresh)
+        return self._update(
+            rerun_id, steps=reused_steps, results=results, next_step=start, context=context,
+            pinned=edits, parent_id=workflow_id,
+        )
+
+    async def rerun_workflow(self, workflow_id: str, user_request: str = None, edits: Dict[str, Any] = None,
+                             results_dict: dict = None, force_refresh: bool = False):
+        rerun = self.prepare_rerun(workflow_id, user_request, edits, force_refresh)
+        return await self._run(rerun["id"], results_dict)
+
+    def run_in_background(self, workflow_id: str, results_dict: dict = None) -> asyncio.Task:
+        """Lance l'exécution (ou la reprise) d'un workflow préparé sans l'attendre"""
+        # Enregistrée avant son démarrage : une seconde reprise immédiate est refusée
+        task = asyncio.create_task(self._run(workflow_id, results_dict))
+        self._tasks[workflow_id] = task
+        return task
+
+    def stop_workflow(self, workflow_id: str) -> bool:
+        """Interrompt un workflow de ce processus ; ses étapes terminées restent acquises"""
+        task = self._tasks.get(workflow_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def _checkpoint(self, workflow_id: str, step: WorkflowStep, context: Optional[dict] = None,
+                    seconds_saved: float = 0.0, **fields):
+        """Écrit l'étape terminée (et le contexte qui en découle) dès sa fin"""
+        def apply(workflow):
+            workflow["steps"].append(step.to_dict())
+            if step.status == WorkflowStatus.COMPLETED:
+                workflow["results"][step.agent_role] = step.output_data
+                workflow["next_step"] = step.index + 1
+                workflow["context"] = context
+            if step.memoized:
+                memo = workflow.setdefault("memo", {"reused_steps": 0, "seconds_saved": 0.0})
+                memo["reused_steps"] += 1
+                memo["seconds_saved"] = round(memo["seconds_saved"] + seconds_saved, 2)
+        workflow = self._update(workflow_id, apply, **fields)
+        if step.status == WorkflowStatus.COMPLETED:
+            self._publish(workflow_id, "step_completed", index=step.index, agent_role=step.agent_role,
+                          output=step.output_data, execution_time=step.execution_time,
+                          memoized=step.memoized, edited=step.edited, version=workflow["version"])
+        else:
+            self._publish(workflow_id, "step_failed", index=step.index, agent_role=step.agent_role,
+                          error=step.error_message, version=workflow["version"])
+
+    async def _run(self, workflow_id: str, results_dict: dict = None):
+        self._tasks.setdefault(workflow_id, asyncio.current_task())
+        # Trace propre au workflow, reliée à la requête qui l'a lancé
+        parent_trace = tracer.current_trace_id()
+        try:
+            # Tâche de fond : l'échéance de la requête qui l'a lancée ne s'applique pas aux étapes
+            with detached_deadline(), tracer.trace("workflow.run", workflow_id=workflow_id, parent_trace_id=parent_trace):
+                return await self._run_steps(workflow_id, results_dict)
+        finally:
+            self._tasks.pop(workflow_id, None)
+
+    async def _run_steps(self, workflow_id: str, results_dict: dict = None):
+        workflow = self._update(workflow_id, status=WorkflowStatus.RUNNING.value)
+        steps = self.workflow_templates[workflow["type"]]["steps"]
+        context = dict(workflow["context"])
+        # Un workflow repris ou réexécuté rouvre son canal (séquence conservée)
+        self.events.reopen(workflow_id)
+        self._publish(workflow_id, "workflow_started", workflow_type=workflow["type"], next_step=workflow["next_step"],
+                      total_steps=workflow["total_steps"], version=workflow["version"])
 
         try:
-            for agent_role in self.workflow_templates[workflow_type]["steps"]:
-                step = WorkflowStep(agent_role, user_request)
+            for index in range(workflow["next_step"], len(steps)):
+                step = WorkflowStep(steps[index], workflow["request"], index=index)
                 step.status = WorkflowStatus.RUNNING
                 step.start_time = datetime.now()
+                self._publish(workflow_id, "step_started", index=index, agent_role=step.agent_role)
 
-                try:
-                    from services.ai_service import query_agent
-                    result = await query_agent(agent_role, user_request, context)
-                    step.output_data = result
+                pinned = workflow.get("pinned") or {}
+                memo, memo_key, cached = self.memo, None, None
+                if memo is not None and step.agent_role not in pinned:
+                    from .step_memo import step_key
+                    memo_key = step_key(step.agent_role, self._agent_model(step.agent_role), workflow["request"], context)
+                    cached = None if workflow.get("force_refresh") else memo.get(memo_key)
+
+                if step.agent_role in pinned:
+                    # Sortie éditée par l'utilisateur : ni régénérée ni mise en cache
+                    memo = None
+                    step.output_data = pinned[step.agent_role]
                     step.status = WorkflowStatus.COMPLETED
-                    step.error_message = None
-                except Exception as e:
-                    step.output_data = None
-                    step.status = WorkflowStatus.FAILED
-                    step.error_message = str(e)
-                    workflow_data["status"] = WorkflowStatus.FAILED.value
-                    workflow_data["error"] = str(e)
-                    step.end_time = datetime.now()
-                    step.execution_time = (step.end_time - step.start_time).total_seconds()
-                    steps_data.append(step.to_dict())
-                    break
+                    step.edited = True
+                elif cached is not None:
+                    step.output_data = cached["output"]
+                    step.status = WorkflowStatus.COMPLETED
+                    step.memoized = True
+                else:
+                    on_delta = self._progress_publisher(workflow_id, step)
+                    try:
+                        with tracer.span("workflow.step", agent=step.agent_role, index=index):
+                            output = await self._query_agent(step.agent_role, workflow["request"], context,
+                                                             on_delta=on_delta)
+                        on_delta.flush()
+                        if isinstance(output, FallbackResponse):
+                            # Texte de repli (Ollama absent, modèle en erreur) : étape à rejouer, jamais mise en cache
+                            raise RuntimeError(f"{step.agent_role}: {output.reason}")
+                        step.output_data = output
+                        step.status = WorkflowStatus.COMPLETED
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        step.status = WorkflowStatus.FAILED
+                        step.error_message = str(e)
 
                 step.end_time = datetime.now()
                 step.execution_time = (step.end_time - step.start_time).total_seconds()
-                steps_data.append(step.to_dict())
-                agent_outputs[agent_role] = step.output_data
+                if step.status == WorkflowStatus.FAILED:
+                    self._checkpoint(workflow_id, step, status=WorkflowStatus.FAILED.value,
+                                     error=step.error_message, end_time=datetime.now().isoformat())
+                    self._publish(workflow_id, "workflow_error", error=step.error_message, failed_step=step.index)
+                    break
+
+                if memo is not None and cached is None:
+                    memo.put(memo_key, step.agent_role, self._agent_model(step.agent_role),
+                             step.output_data, step.execution_time)
                 context["last_output"] = step.output_data
+                self._checkpoint(workflow_id, step, context=dict(context),
+                                 seconds_saved=cached["duration"] if cached else 0.0)
 
             else:
-                workflow_data["status"] = WorkflowStatus.COMPLETED.value
-
-            workflow_data["steps"] = steps_data
-            workflow_data["results"] = agent_outputs
-            workflow_data["end_time"] = datetime.now().isoformat()
+                workflow = self._update(workflow_id, status=WorkflowStatus.COMPLETED.value,
+                                        end_time=datetime.now().isoformat())
+                self._publish(workflow_id, "workflow_completed", version=workflow["version"])
 
+        except asyncio.CancelledError:
+            workflow = self._update(workflow_id, status=WorkflowStatus.INTERRUPTED.value,
+                                    end_time=datetime.now().isoformat())
+            self._publish(workflow_id, "workflow_cancelled", status=WorkflowStatus.INTERRUPTED.value,
+                          next_step=workflow["next_step"], version=workflow["version"])
+            raise
         except Exception as e:
-            workflow_data["status"] = WorkflowStatus.FAILED.value
-            workflow_data["error"] = str(e)
-            workflow_data["end_time"] = datetime.now().isoformat()
+            self._update(workflow_id, status=WorkflowStatus.FAILED.value, error=str(e),
+                         end_time=datetime.now().isoformat())
+            self._publish(workflow_id, "workflow_error", error=str(e))
 
-        self.running_workflows[workflow_id] = workflow_data
         if results_dict is not None:
-            results_dict[workflow_id] = agent_outputs
+            results_dict[workflow_id] = self.running_workflows[workflow_id]["results"]
         return workflow_id
 
+    def list_workflows(self, status: str = None, workflow_type: str = None, since: str = None, until: str = None,
+                       cursor: str = None, limit: int = 50):
+        """Page de résumés (plus récents d'abord) lue par l'index ; curseur de la page suivante"""
+        page, next_cursor = self.running_workflows.query(
+            {"status": status, "type": workflow_type}, since=since, until=until, cursor=cursor, limit=limit
+        )
+        return [workflow_summary(workflow) for _, workflow in page], next_cursor
+
     def get_workflow_status(self, workflow_id: str):
-        print("[DEBUG] IDs actuellement stockés :", list(self.running_workflows.keys()))
-        print(f"[DEBUG] Demande de status pour workflow_id: {workflow_id}")
         return self.running_workflows.get(workflow_id)
 
 # --- Singleton global ---
@@ -166,5 +585,5 @@ workflow_orchestrator = WorkflowOrchestrator()
 
 # --- Dispatcher pour main.py ---
 async def mastermind_dispatch(agent: str, message: str, context: dict) -> str:
-    from services.ai_service import query_agent
+    from ..services.ai_service import query_agent
     return await query_agent(agent_role=agent, message=message, context=context)
@@ -0,0 +1,369 @@
+"""
+Routage des demandes vers le workflow (ou l'agent seul) le moins coûteux qui suffit
+
+1. Un trie de mots-clés compilé (plus quelques expressions régulières)
+   extrait de la demande les capacités nécessaires : frontend, backend,
+   base de données, revue, optimisation...
+2. Chaque workflow et chaque agent couvre un ensemble de capacités ; parmi
+   ceux qui couvrent toute la demande, on retient le moins coûteux.
+3. Coût estimé = somme, sur les étapes, de la latence attendue de chaque
+   agent : moyenne historique du PerformanceMonitor, sinon estimation
+   d'après la taille du modèle.
+4. Si aucune règle ne tranche, un petit modèle peut classer la demande ;
+   ses décisions sont mises en cache.
+
+full_development n'est plus le choix par défaut : il n'est retenu que si
+la demande couvre vraiment frontend, backend et base de données.
+"""
+
+import logging
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from .model_routing import model_size_billions
+
+logger = logging.getLogger(__name__)
+
+# Agents capables de répondre à chaque besoin
+CAPABILITY_AGENTS: Dict[str, Set[str]] = {
+    "vision": {"visionnaire"},
+    "architecture": {"architecte"},
+    "frontend": {"frontend_engineer"},
+    "design": {"designer_ui_ux"},
+    "backend": {"backend_engineer"},
+    "database": {"database_specialist"},
+    "review": {"critique"},
+    "optimization": {"optimiseur"},
+    # Une demande de construction exige au moins un ingénieur
+    "implementation": {"frontend_engineer", "backend_engineer"},
+}
+
+# Mots-clés (sans accents, en minuscules) -> capacités. Un "*" final accepte tout suffixe.
+KEYWORD_RULES: Dict[str, Iterable[str]] = {
+    # Frontend / design
+    "frontend": ["frontend"], "front end": ["frontend"], "front": ["frontend"], "react": ["frontend"],
+    "vue": ["frontend"], "angular": ["frontend"], "svelte": ["frontend"], "next.js": ["frontend"],
+    "interface": ["frontend"], "composant*": ["frontend"], "component*": ["frontend"], "page*": ["frontend"],
+    "css": ["frontend"], "html": ["frontend"], "tailwind": ["frontend"], "formulaire*": ["frontend"],
+    "ui": ["design"], "ux": ["design"], "design": ["design"], "maquette*": ["design"], "wireframe*": ["design"],
+    "ergonomie": ["design"], "charte graphique": ["design"],
+    # Backend / données
+    "backend": ["backend"], "back end": ["backend"], "api": ["backend"], "apis": ["backend"],
+    "endpoint*": ["backend"], "serveur": ["backend"], "server": ["backend"], "fastapi": ["backend"],
+    "django": ["backend"], "flask": ["backend"], "express": ["backend"], "graphql": ["backend"],
+    "rest": ["backend"], "authentification": ["backend"], "webhook*": ["backend"],
+    "base de donnees": ["database"], "bases de donnees": ["database"], "database*": ["database"],
+    "bdd": ["database"], "sql": ["database"], "postgres*": ["database"], "mysql": ["database"],
+    "mongodb": ["database"], "sqlite": ["database"], "schema*": ["database"], "migration*": ["database"],
+    # Conception
+    "architecture": ["architecture"], "archi": ["architecture"], "microservice*": ["architecture"],
+    "scalab*": ["architecture"], "infrastructure": ["architecture"],
+    "vision": ["vision"], "cahier des charges": ["vision"], "mvp": ["vision"], "user stor*": ["vision"],
+    "specification*": ["vision"], "besoins": ["vision"],
+    # Existant
+    "review": ["review"], "relis": ["review"], "relecture": ["review"], "audit*": ["review"],
+    "analyse*": ["review"], "critique*": ["review"], "qualite": ["review"], "bug*": ["review"],
+    "corrige*": ["review"], "debug*": ["review"],
+    "optimis*": ["optimization"], "optimiz*": ["optimization"], "performance*": ["optimization"],
+    "lent*": ["optimization"], "lenteur*": ["optimization"], "accelere*": ["optimization"],
+    # Projet complet
+    "full stack": ["frontend", "backend", "database"], "fullstack": ["frontend", "backend", "database"],
+    "application complete": ["frontend", "backend", "database"],
+    "frontend et backend": ["frontend", "backend", "database"],
+}
+
+# Verbes de construction : la demande vise un livrable, pas une réponse ponctuelle
+BUILD_KEYWORDS = [
+    "cree*", "creer", "developpe*", "construis", "construire", "build", "genere*", "generer",
+    "implemente*", "monte*", "realise*", "coder",
+]
+
+# Agent des questions ponctuelles sans domaine reconnu
+GENERAL_AGENT = "assistant"
+
+REGEX_RULES = [
+    (re.compile(r"\.(tsx|jsx|vue|css|scss|html)\b", re.IGNORECASE), ["frontend"]),
+    (re.compile(r"\.(sql)\b|\bselect\b.+\bfrom\b|\bcreate table\b", re.IGNORECASE), ["database"]),
+    (re.compile(r"/api/|\b(get|post|put|delete)\s+/", re.IGNORECASE), ["backend"]),
+    (re.compile(r"traceback|exception|error:", re.IGNORECASE), ["review"]),
+]
+
+# Latence par défaut d'une étape, faute d'historique : proportionnelle à la taille du modèle
+DEFAULT_SECONDS_PER_BILLION = 2.0
+DEFAULT_STEP_SECONDS = 10.0
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#.]*")
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules sans accents (les mots-clés sont stockés sous cette forme)"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    return [token.rstrip(".") for token in TOKEN_PATTERN.findall(normalize_text(text))]
+
+
+class KeywordTrie:
+    """
+    Trie de mots (pas de caractères) : une expression de plusieurs mots est un
+    chemin, la demande est parcourue une fois quel que soit le nombre de règles.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Iterable[Any]]] = None):
+        self._root: Dict[str, Any] = {}
+        for phrase, values in (rules or {}).items():
+            self.add(phrase, values)
+
+    def add(self, phrase: str, values: Iterable[Any]):
+        node = self._root
+        words = tokenize(phrase) if not phrase.endswith("*") else tokenize(phrase[:-1])
+        for word in words[:-1]:
+            node = node.setdefault(word, {})
+        last = words[-1]
+        if phrase.endswith("*"):
+            # Préfixe : comparé au mot courant au moment du parcours
+            node.setdefault("*", []).append((last, phrase, list(values)))
+        else:
+            node.setdefault(last, {}).setdefault("$", []).append((phrase, list(values)))
+
+    def match(self, tokens: List[str]) -> List[tuple]:
+        """Toutes les règles trouvées dans la suite de mots : [(règle, valeurs)]"""
+        matches = []
+        for start in range(len(tokens)):
+            node = self._root
+            for token in tokens[start:]:
+                for prefix, phrase, values in node.get("*", ()):
+                    if token.startswith(prefix):
+                        matches.append((phrase, values))
+                node = node.get(token)
+                if node is None:
+                    break
+                matches.extend(node.get("$", ()))
+        return matches
+
+
+class WorkflowRouter:
+    """Choisit le workflow (ou l'agent seul) le moins coûteux couvrant la demande"""
+
+    def __init__(
+        self,
+        templates: Dict[str, Dict[str, Any]],
+        latency_source: Optional[Callable[[str], Optional[float]]] = None,
+        agent_models: Optional[Dict[str, str]] = None,
+        classifier: Optional[Callable[[str, List[str]], Awaitable[Optional[str]]]] = None,
+        cache_size: int = 512,
+    ):
+        self.templates = templates
+        self.latency_source = latency_source
+        self.agent_models = agent_models or {}
+        self.classifier = classifier
+        self.cache_size = cache_size
+        self._trie = KeywordTrie(KEYWORD_RULES)
+        self._build_trie = KeywordTrie({keyword: ["build"] for keyword in BUILD_KEYWORDS})
+        self._classifier_cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self.stats = {"rules": 0, "classifier": 0, "default": 0, "classifier_cache_hits": 0}
+
+    # ---- Analyse ----
+
+    def analyze(self, request: str) -> Dict[str, Any]:
+        tokens = tokenize(request)
+        capabilities: Set[str] = set()
+        matched = []
+        for phrase, values in self._trie.match(tokens):
+            capabilities.update(values)
+            matched.append(phrase)
+        for pattern, values in REGEX_RULES:
+            if pattern.search(request):
+                capabilities.update(values)
+                matched.append(pattern.pattern)
+        build = bool(self._build_trie.match(tokens))
+        if build:
+            capabilities.add("implementation")
+        return {"capabilities": capabilities, "build": build, "matched": sorted(set(matched))}
+
+    # ---- Coûts ----
+
+    def step_latency(self, agent: str) -> tuple:
+        """(secondes attendues, origine) pour une étape confiée à `agent`"""
+        observed = self.latency_source(agent) if self.latency_source else None
+        if observed:
+            return observed, "history"
+        size = model_size_billions(self.agent_models.get(agent, ""))
+        if size:
+            return size * DEFAULT_SECONDS_PER_BILLION, "model_size"
+        return DEFAULT_STEP_SECONDS, "default"
+
+    def estimate_cost(self, steps: List[str]) -> Dict[str, Any]:
+        by_agent, sources = {}, set()
+        for agent in steps:
+            seconds, source = self.step_latency(agent)
+            by_agent[agent] = round(by_agent.get(agent, 0.0) + seconds, 2)
+            sources.add(source)
+        return {
+            "steps": len(steps),
+            "estimated_seconds": round(sum(by_agent.values()), 2),
+            "by_agent": by_agent,
+            "latency_source": sources.pop() if len(sources) == 1 else "mixed",
+        }
+
+    # ---- Candidats ----
+
+    @staticmethod
+    def coverage(steps: Iterable[str], capabilities: Set[str]) -> int:
+        """Nombre de capacités demandées qu'au moins une étape sait traiter"""
+        steps = set(steps)
+        return sum(1 for capability in capabilities if CAPABILITY_AGENTS.get(capability, set()) & steps)
+
+    def agents(self) -> List[str]:
+        return sorted({agent for agents in CAPABILITY_AGENTS.values() for agent in agents} | {GENERAL_AGENT})
+
+    def candidates(self, capabilities: Set[str], allow_agents: bool) -> List[Dict[str, Any]]:
+        """Options couvrant toutes les capacités, de la moins coûteuse à la plus coûteuse"""
+        options = [
+            {"kind": "workflow", "workflow": name, "steps": list(template["steps"])}
+            for name, template in self.templates.items()
+        ]
+        if allow_agents:
+            options += [{"kind": "agent", "agent": agent, "steps": [agent]} for agent in self.agents()]
+        for option in options:
+            option["coverage"] = self.coverage(option["steps"], capabilities)
+            option["cost"] = self.estimate_cost(option["steps"])
+        best_coverage = max((option["coverage"] for option in options), default=0)
+        # Combinaison qu'aucune option ne couvre entièrement : les plus complètes, puis la moins chère
+        options = [option for option in options if option["coverage"] == best_coverage]
+        return sorted(options, key=lambda option: (option["cost"]["estimated_seconds"], option["cost"]["steps"]))
+
+    # ---- Décision ----
+
+    def _select(self, analysis: Dict[str, Any], allow_agents: bool) -> tuple:
+        """(option retenue, origine, alternatives) à partir des règles seules"""
+        # Une demande de construction se traite en workflow, une question peut aller à un seul agent
+        allow_agents = allow_agents and not analysis["build"]
+        if analysis["capabilities"] - {"implementation"}:
+            options = self.candidates(analysis["capabilities"], allow_agents)
+            return options[0], "rules", options
+        if allow_agents:
+            option = {"kind": "agent", "agent": GENERAL_AGENT, "steps": [GENERAL_AGENT]}
+            option["cost"] = self.estimate_cost(option["steps"])
+            return option, "default", []
+        # Construction sans domaine reconnu : le workflow le moins coûteux qui compte un ingénieur
+        options = self.candidates({"implementation"}, False)
+        return options[0], "default", options
+
+    def _decision(self, option: Dict[str, Any], source: str, analysis: Dict[str, Any],
+                  alternatives: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self.stats[source] += 1
+        return {
+            "kind": option["kind"],
+            "workflow": option.get("workflow"),
+            "agent": option.get("agent"),
+            "steps": option["steps"],
+            "estimated_cost": option["cost"],
+            "source": source,
+            "capabilities": sorted(analysis["capabilities"]),
+            "matched": analysis["matched"],
+            "alternatives": [
+                {"name": alt.get("workflow") or alt.get("agent"), "kind": alt["kind"],
+                 "estimated_seconds": alt["cost"]["estimated_seconds"]}
+                for alt in alternatives if alt is not option
+            ][:3],
+        }
+
+    def route(self, request: str, allow_agents: bool = True) -> Dict[str, Any]:
+        """Décision par règles uniquement (synchrone, sans appel au modèle)"""
+        analysis = self.analyze(request)
+        option, source, alternatives = self._select(analysis, allow_agents)
+        return self._decision(option, source, analysis, alternatives)
+
+    async def aroute(self, request: str, allow_agents: bool = True) -> Dict[str, Any]:
+        """Comme route(), en consultant le petit modèle quand aucune règle ne tranche"""
+        analysis = self.analyze(request)
+        option, source, alternatives = self._select(analysis, allow_agents)
+        if source == "default" and self.classifier is not None:
+            labels = list(self.templates) + (self.agents() if allow_agents and not analysis["build"] else [])
+            label = await self._classify(request, labels)
+            if label in self.templates:
+                steps = list(self.templates[label]["steps"])
+                option = {"kind": "workflow", "workflow": label, "steps": steps}
+            elif label is not None:
+                option = {"kind": "agent", "agent": label, "steps": [label]}
+            if label is not None:
+                option["cost"] = self.estimate_cost(option["steps"])
+                source, alternatives = "classifier", []
+        return self._decision(option, source, analysis, alternatives)
+
+    async def _classify(self, request: str, labels: List[str]) -> Optional[str]:
+        key = f"{','.join(labels)}|{' '.join(tokenize(request))}"
+        if key in self._classifier_cache:
+            self._classifier_cache.move_to_end(key)
+            self.stats["classifier_cache_hits"] += 1
+            return self._classifier_cache[key]
+        try:
+            label = await self.classifier(request, labels)
+        except Exception as e:
+            # Erreur passagère : pas mise en cache, la règle par défaut s'applique
+            logger.warning(f"⚠️ Classifieur de routage indisponible: {e}")
+            return None
+        label = label if label in labels else None
+        self._classifier_cache[key] = label
+        if len(self._classifier_cache) > self.cache_size:
+            self._classifier_cache.popitem(last=False)
+        return label
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "classifier_cache_size": len(self._classifier_cache)}
+
+
+class LLMRouteClassifier:
+    """Classifieur par petit modèle : répond par une seule étiquette parmi celles proposées"""
+
+    def __init__(self, model: str, provider=None):
+        self.model = model
+        self._provider = provider
+
+    @property
+    def provider(self):
+        if self._provider is None:
+            from ..services.llm_provider import get_default_provider
+
+            self._provider = get_default_provider()
+        return self._provider
+
+    async def __call__(self, request: str, labels: List[str]) -> Optional[str]:
+        answer = await self.provider.generate(
+            self.model,
+            f"Demande: {request}\n\nÉtiquettes possibles: {', '.join(labels)}\nÉtiquette:",
+            system=(
+                "Tu routes des demandes de développement. Réponds uniquement par l'étiquette la moins "
+                "coûteuse qui suffit à traiter la demande : un agent seul plutôt qu'un workflow quand c'est possible."
+            ),
+            options={"temperature": 0, "num_predict": 12},
+            agent="router",
+        )
+        answer = normalize_text(answer or "")
+        # Étiquettes les plus longues d'abord : une étiquette contenue dans une autre ne l'emporte pas
+        for label in sorted(labels, key=len, reverse=True):
+            if label in answer:
+                return label
+        return None
+
+
+def create_workflow_router(templates: Dict[str, Dict[str, Any]]) -> WorkflowRouter:
+    """Routeur branché sur les métriques du PerformanceMonitor et la configuration"""
+    from ..utils.config import AGENT_ROLES, WORKFLOW_ROUTING_CONFIG
+    from ..utils.monitoring import performance_monitor
+
+    classifier = None
+    if WORKFLOW_ROUTING_CONFIG["classifier"]:
+        classifier = LLMRouteClassifier(WORKFLOW_ROUTING_CONFIG["classifier_model"])
+    return WorkflowRouter(
+        templates,
+        latency_source=performance_monitor.get_agent_latency,
+        agent_models={agent: role["model"] for agent, role in AGENT_ROLES.items()},
+        classifier=classifier,
+        cache_size=WORKFLOW_ROUTING_CONFIG["cache_size"],
+    )
@@ -5,22 +5,39 @@ Supporte: workflows, chat agent avec mémoire, upload fichiers, multi-agent, Oll
 VERSION STABLE CORRIGÉE AVEC OLLAMA — 2024
 """
 
-from fastapi import FastAPI, HTTPException, Request, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime
-import time, uuid, os, traceback, logging, shutil, asyncio, json
-try:
-    import httpx
-except ImportError:
-    httpx = None
+import time, uuid, os, sys, traceback, logging, shutil, asyncio, json, math
+from pathlib import Path
 
-logging.basicConfig(level=logging.INFO)
+# Lancement depuis backend/app (`uvicorn main:app`) : rendre le package `app` importable
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.llm_provider import (
+    ConcurrencyLimitMiddleware, LLMProvider, LLMProviderError, LLMRequestRejected, LLMTimeoutError,
+    find_middleware, get_default_provider, normalize_history
+)
+from app.utils.config import COMPRESSION_CONFIG, DEADLINE_CONFIG, OLLAMA_CONFIG, get_generation_profile
+from app.core.state_backend import get_state_backend
+from app.core.cancellation import ClientDisconnected, cancellation_metrics, run_until_disconnect
+from app.core.deadlines import deadline_scope, narrow_deadline, parse_route_timeouts, parse_timeout, route_timeout
+from app.core.model_routing import model_routing_policy
+from app.core.workflow_engine import strip_outputs, workflow_orchestrator as agent_workflow_engine
+from app.utils.monitoring import performance_monitor, prefix_reuse_tracker
+from app.utils.logger import parse_sampling, setup_logging
+from app.utils.tracing import parse_traceparent, tracer, valid_trace_id
+from app.utils.responses import CompressionMiddleware, FastJSONResponse, dumps_json
+
+logging_pipeline = setup_logging()
 logger = logging.getLogger("atelier-backend")
+access_logger = logging.getLogger("atelier-backend.access")
 
-app = FastAPI(title="Backend Atelier IA Unifié", version="1.4.0")
+app = FastAPI(title="Backend Atelier IA Unifié", version="1.4.0", default_response_class=FastJSONResponse)
 
 # ---- CORS
 app.add_middleware(
@@ -31,12 +48,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---- Compression des réponses volumineuses (brotli/gzip)
+if COMPRESSION_CONFIG["enabled"]:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_CONFIG["minimum_size"],
+        gzip_level=COMPRESSION_CONFIG["gzip_level"],
+        brotli_quality=COMPRESSION_CONFIG["brotli_quality"],
+    )
+
 # ===================
 # == CONFIGURATION ==
 # ===================
 
-OLLAMA_URL = "http://localhost:11434"
+OLLAMA_URL = OLLAMA_CONFIG["base_url"]
 DEFAULT_MODEL = "llama3-chatqa:latest"
+
+# Configuration modifiable à chaud (/models/switch), partagée entre workers
+runtime_config = get_state_backend().namespace("config")
+performance_monitor.state = get_state_backend()
+
+def get_default_model() -> str:
+    return runtime_config.get("default_model", DEFAULT_MODEL)
 UPLOAD_DIR = "./uploaded_files"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
@@ -45,83 +78,68 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 # ===================
 
 class OllamaService:
-    def __init__(self, base_url: str = OLLAMA_URL):
-        self.base_url = base_url
+    """Façade historique au-dessus du fournisseur LLM partagé (pool, cache, limites)"""
+
+    def __init__(self, provider: Optional[LLMProvider] = None):
+        self._provider = provider
+        self.base_url = OLLAMA_URL
         self.available_models = []
-        
+
+    @property
+    def provider(self) -> LLMProvider:
+        """Fournisseur résolu au premier appel (client HTTP créé à la demande)"""
+        if self._provider is None:
+            self._provider = get_default_provider()
+        return self._provider
+
     async def check_connection(self) -> bool:
         """Vérifie si Ollama est accessible"""
-        if not httpx:
-            logger.warning("httpx non installé - Ollama désactivé")
-            return False
-            
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/api/tags", timeout=5.0)
-                if response.status_code == 200:
-                    data = response.json()
-                    self.available_models = [model["name"] for model in data.get("models", [])]
-                    return True
-                return False
-        except Exception as e:
+            self.available_models = await self.provider.list_models()
+            return True
+        except LLMProviderError as e:
             logger.error(f"Ollama connection failed: {e}")
             return False
     
-    async def generate(self, model: str, prompt: str, stream: bool = False) -> str:
-        """Génère une réponse avec Ollama"""
-        if not httpx:
-            return f"[Mock] Réponse pour le modèle {model}: {prompt[:50]}..."
-            
+    async def generate(self, model: str, prompt: str, stream: bool = False, agent: Optional[str] = None,
+                       system: Optional[str] = None, history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Génère une réponse avec Ollama (API chat si `history`/`system` sont fournis par l'appelant)"""
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                payload = {
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": stream,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                        "num_ctx": 4096
-                    }
-                }
-                
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json=payload
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return data.get("response", "Pas de réponse générée")
-                else:
-                    logger.error(f"Ollama error: {response.status_code} - {response.text}")
-                    return f"Erreur Ollama: {response.status_code}"
+            response = await self.provider.generate(
+                model,
+                prompt,
+                system=system,
+                history=history,
+                options=get_generation_profile(agent),
+                agent=agent
+            )
+            return response or "Pas de réponse générée"
                     
-        except asyncio.TimeoutError:
+        except LLMRequestRejected:
+            # Surcharge ou échéance : remonte jusqu'au client (503/504)
+            raise
+        except LLMTimeoutError:
             return "Timeout: La génération a pris trop de temps"
-        except Exception as e:
+        except LLMProviderError as e:
             logger.error(f"Ollama generation error: {e}")
             return f"Erreur de génération: {str(e)}"
     
     async def get_models(self) -> List[str]:
         """Récupère la liste des modèles disponibles"""
-        if not httpx:
-            return ["llama3.1", "codellama", "mistral"]  # Mock models
-            
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/api/tags", timeout=10.0)
-                if response.status_code == 200:
-                    data = response.json()
-                    return [model["name"] for model in data.get("models", [])]
-                return []
-        except Exception as e:
+            return await self.provider.list_models()
+        except LLMProviderError as e:
             logger.error(f"Failed to get models: {e}")
             return []
 
 # Instance globale Ollama
 ollama_service = OllamaService()
 
+def admission_stats() -> Dict[str, Any]:
+    """File des générations : attente estimée, rejets à l'admission, échéances atteintes"""
+    limiter = find_middleware(ollama_service.provider, ConcurrencyLimitMiddleware)
+    return limiter.stats() if limiter else {"enabled": False}
+
 # ===================
 # == AGENT SERVICES ==
 # ===================
@@ -130,25 +148,38 @@ def get_available_agents():
     """Retourne la liste des agents disponibles"""
     return ["assistant", "code-assistant", "debugger", "reviewer", "optimizer", "documentation"]
 
-async def query_agent(agent_role: str, message: str, context: Dict[str, Any] = None) -> str:
-    """Service principal pour interroger les agents IA via Ollama"""
+async def query_agent(agent_role: str, message: str, context: Dict[str, Any] = None,
+                      shared: Optional[Tuple[str, List[Dict[str, str]]]] = None) -> str:
+    """
+    Service principal pour interroger les agents IA via Ollama.
+    `shared` : contexte déjà construit par build_conversation_context (batch multi-agents).
+    """
     try:
         # Vérifier la connexion Ollama
-        if not await ollama_service.check_connection():
+        with tracer.span("ollama.health_probe"):
+            connected = await ollama_service.check_connection()
+        if not connected:
             logger.warning("Ollama non disponible, utilisation du mode mock")
             return await query_agent_mock(agent_role, message, context)
         
         # Sélectionner le modèle selon l'agent
         model = get_model_for_agent(agent_role)
         
-        # Construire le prompt spécialisé selon l'agent
-        specialized_prompt = build_agent_prompt(agent_role, message, context)
+        # Conversation structurée : système + contexte stable, historique, demande
+        with tracer.span("prompt.build", agent=agent_role) as span:
+            system_prompt, history, prompt = build_agent_messages(agent_role, message, context, shared)
+            span.set(history_messages=len(history), prompt_chars=len(system_prompt) + len(prompt))
         
-        # Générer la réponse avec Ollama
-        response = await ollama_service.generate(model, specialized_prompt)
+        # Générer la réponse avec Ollama (/api/chat, repli texte géré par le fournisseur)
+        with tracer.span("llm.generate", model=model, agent=agent_role):
+            response = await ollama_service.generate(
+                model, prompt, agent=agent_role, system=system_prompt, history=history
+            )
         
         return response
         
+    except LLMRequestRejected:
+        raise
     except Exception as e:
         logger.error(f"Erreur query_agent: {e}")
         # Fallback vers le mock en cas d'erreur
@@ -156,87 +187,103 @@ async def query_agent(agent_role: str, message: str, context: Dict[str, Any] = N
 
 def get_model_for_agent(agent_role: str) -> str:
     """Sélectionne le modèle optimal selon l'agent"""
+    default_model = get_default_model()
     model_mapping = {
-        "code-assistant": DEFAULT_MODEL,
-        "debugger": DEFAULT_MODEL,
-        "reviewer": DEFAULT_MODEL,
-        "optimizer": DEFAULT_MODEL,
-        "documentation": DEFAULT_MODEL,
-        "assistant": DEFAULT_MODEL
+        "code-assistant": default_model,
+        "debugger": default_model,
+        "reviewer": default_model,
+        "optimizer": default_model,
+        "documentation": default_model,
+        "assistant": default_model
     }
-    return model_mapping.get(agent_role, DEFAULT_MODEL)
-
-def build_agent_prompt(agent_role: str, message: str, context: Dict[str, Any] = None) -> str:
-    """Construit un prompt spécialisé selon le rôle de l'agent"""
+    return model_mapping.get(agent_role, default_model)
+
+ANALYSIS_PROMPTS = {
+    "review": "REVIEW DE CODE:\nAnalyse ce code {language} ci-dessus et donne tes recommandations pour l'améliorer.",
+    "optimize": "OPTIMISATION:\nComment optimiser ce code {language} ci-dessus pour de meilleures performances ?",
+    "debug": "DEBUG:\nAnalyse ce code {language} ci-dessus et identifie les problèmes potentiels.",
+    "explain": "EXPLICATION:\nExplique ce code {language} ci-dessus de manière détaillée."
+}
+
+def build_analysis_prompt(analysis_type: str, language: str, code: str) -> str:
+    """Prompt d'analyse de code : le code d'abord (commun à toutes les analyses), la consigne ensuite"""
+    template = ANALYSIS_PROMPTS.get(analysis_type, ANALYSIS_PROMPTS["review"])
+    return f"```{language}\n{code}\n```\n\n" + template.format(language=language)
+
+# Prompts système selon l'agent
+AGENT_SYSTEM_PROMPTS = {
+    "assistant": "Tu es un assistant IA utile et bienveillant. Réponds de manière claire et précise.",
     
-    # Prompts système selon l'agent
-    system_prompts = {
-        "assistant": "Tu es un assistant IA utile et bienveillant. Réponds de manière claire et précise.",
-        
-        "code-assistant": """Tu es un expert en développement logiciel. Tu aides à:
+    "code-assistant": """Tu es un expert en développement logiciel. Tu aides à:
 - Générer du code propre et fonctionnel
 - Résoudre des problèmes de programmation
 - Expliquer des concepts techniques
 - Optimiser les performances
 Réponds toujours avec du code commenté et des explications claires.""",
 
-        "debugger": """Tu es un expert en debugging. Tu aides à:
+    "debugger": """Tu es un expert en debugging. Tu aides à:
 - Identifier les bugs dans le code
 - Analyser les erreurs et exceptions
 - Proposer des solutions de correction
 - Optimiser le code pour éviter les erreurs
 Sois méthodique et précis dans tes analyses.""",
 
-        "reviewer": """Tu es un expert en review de code. Tu évalues:
+    "reviewer": """Tu es un expert en review de code. Tu évalues:
 - La qualité du code et les bonnes pratiques
 - La sécurité et les vulnérabilités
 - Les performances et l'optimisation
 - La lisibilité et la maintenabilité
 Donne des commentaires constructifs et des suggestions d'amélioration.""",
 
-        "optimizer": """Tu es un expert en optimisation. Tu te concentres sur:
+    "optimizer": """Tu es un expert en optimisation. Tu te concentres sur:
 - L'amélioration des performances
 - La réduction de la complexité
 - L'optimisation des ressources
 - Les algorithmes plus efficaces
 Propose des solutions concrètes et mesurables.""",
 
-        "documentation": """Tu es un expert en documentation technique. Tu aides à:
+    "documentation": """Tu es un expert en documentation technique. Tu aides à:
 - Créer une documentation claire et complète
 - Rédiger des commentaires de code
 - Expliquer des architectures complexes
 - Créer des guides d'utilisation
 Écris de manière structurée et accessible."""
-    }
-    
-    system_prompt = system_prompts.get(agent_role, system_prompts["assistant"])
-    
-    # Construire le prompt final
-    prompt_parts = [system_prompt, "\n"]
+}
+
+def build_agent_prompt(agent_role: str, message: str, context: Dict[str, Any] = None) -> str:
+    """Construit un prompt spécialisé selon le rôle de l'agent (format texte, /api/generate)"""
+    system_prompt = AGENT_SYSTEM_PROMPTS.get(agent_role, AGENT_SYSTEM_PROMPTS["assistant"])
     
-    # Ajouter le contexte si disponible
-    if context:
-        if context.get("recentMessages"):
-            prompt_parts.append("HISTORIQUE DE LA CONVERSATION:")
-            for msg in context["recentMessages"][-3:]:  # 3 derniers messages
-                if isinstance(msg, dict):
-                    role = msg.get('role', 'user')
-                    content = msg.get('content', '')
-                    prompt_parts.append(f"{role.upper()}: {content}")
-            prompt_parts.append("")
-        
-        if context.get("codeContext"):
-            prompt_parts.append(f"FICHIERS DE CODE: {', '.join(context['codeContext'])}")
-        
-        if context.get("projectId"):
-            prompt_parts.append(f"PROJET: {context['projectId']}")
-        
-        prompt_parts.append("")
+    # Prompt système en tête (fixe par agent), puis contexte stable, puis la demande :
+    # d'un tour à l'autre seul la fin change et Ollama réutilise son cache KV
+    return f"{system_prompt}\n\n{build_contextual_prompt(message, context)}"
+
+def build_conversation_context(context: Dict[str, Any] = None) -> Tuple[str, List[Dict[str, str]]]:
+    """Partie de la conversation commune à tous les agents : (contexte stable, historique normalisé)"""
+    context_dict = safe_get_context_dict(context)
     
-    # Ajouter la demande actuelle
-    prompt_parts.append(f"DEMANDE:\n{message}")
+    stable_parts = build_project_context(context_dict)
+    if context_dict.get("summary"):
+        stable_parts.append(f"CONTEXTE DE LA CONVERSATION:\n{context_dict['summary']}")
     
-    return "\n".join(prompt_parts)
+    history = context_dict.get("recentMessages", [])
+    history = normalize_history(history if isinstance(history, list) else [])
+    return "\n".join(stable_parts), history
+
+def build_agent_messages(agent_role: str, message: str, context: Dict[str, Any] = None,
+                         shared: Optional[Tuple[str, List[Dict[str, str]]]] = None) -> Tuple[str, List[Dict[str, str]], str]:
+    """
+    Construit la conversation structurée d'un agent : (système, historique, demande).
+
+    Le système porte le rôle et le contexte stable (projet, fichiers, objectifs,
+    résumé) ; l'historique garde ses rôles user/assistant, si bien que le modèle
+    applique son propre gabarit de chat au lieu de lire un texte aplati.
+    """
+    system_prompt = AGENT_SYSTEM_PROMPTS.get(agent_role, AGENT_SYSTEM_PROMPTS["assistant"])
+    stable_context, history = shared if shared is not None else build_conversation_context(context)
+    if stable_context:
+        system_prompt = f"{system_prompt}\n\n{stable_context}"
+    return system_prompt, history, message
 
 async def query_agent_mock(agent_role: str, message: str, context: Dict[str, Any] = None) -> str:
     """Service mock pour les agents (fallback)"""
@@ -264,8 +311,13 @@ async def query_agent_mock(agent_role: str, message: str, context: Dict[str, Any
 # ===================
 
 class WorkflowOrchestrator:
+    step_delay = 2  # Durée simulée d'une étape (s)
+    
     def __init__(self):
-        self.running_workflows = {}
+        # Statuts visibles de tous les workers (voir STATE_BACKEND), indexés pour le listing
+        self.running_workflows = get_state_backend().namespace("main_workflows").create_index(("status", "type"))
+        # Tâches exécutées par ce worker, annulées par stop_workflow
+        self._tasks: Dict[str, asyncio.Task] = {}
     
     def get_available_workflows(self):
         return [
@@ -289,31 +341,53 @@ class WorkflowOrchestrator:
         }
         
         # Simuler l'exécution du workflow
-        asyncio.create_task(self._execute_workflow(workflow_id, workflow_type, description))
+        task = asyncio.create_task(self._execute_workflow(workflow_id, workflow_type, description))
+        self._tasks[workflow_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(workflow_id, None))
         
         return workflow_id
     
     async def _execute_workflow(self, workflow_id: str, workflow_type: str, description: str):
         """Exécute un workflow de manière asynchrone"""
+        steps = self._get_workflow_steps(workflow_type)
+        completed_steps = 0
         try:
             # Simuler des étapes de workflow
-            steps = self._get_workflow_steps(workflow_type)
-            
             for i, step in enumerate(steps):
-                await asyncio.sleep(2)  # Simulation délai
-                self.running_workflows[workflow_id]["steps"].append({
+                # Arrêt demandé depuis un autre worker : plus aucune étape lancée
+                if (self.running_workflows.get(workflow_id) or {}).get("status") == "stopped":
+                    self._mark_stopped(workflow_id, len(steps) - completed_steps)
+                    return
+                await asyncio.sleep(self.step_delay)  # Simulation délai
+                step_data = {
                     "step": i + 1,
                     "name": step,
                     "status": "completed",
                     "timestamp": datetime.now().isoformat()
-                })
+                }
+                self.running_workflows.modify(
+                    workflow_id,
+                    lambda workflow: workflow and {**workflow, "steps": workflow["steps"] + [step_data]}
+                )
+                completed_steps += 1
             
-            self.running_workflows[workflow_id]["status"] = "completed"
+            self.running_workflows.update_item(workflow_id, status="completed")
             
+        except asyncio.CancelledError:
+            # Arrêt sur ce worker (stop_workflow) ou arrêt du serveur
+            self._mark_stopped(workflow_id, len(steps) - completed_steps)
+            raise
         except Exception as e:
             logger.error(f"Workflow {workflow_id} failed: {e}")
-            self.running_workflows[workflow_id]["status"] = "failed"
-            self.running_workflows[workflow_id]["error"] = str(e)
+            self.running_workflows.update_item(workflow_id, status="failed", error=str(e))
+    
+    def _mark_stopped(self, workflow_id: str, skipped_steps: int):
+        """
+        Statut "stopped" et étapes évitées. Les étapes sont simulées (asyncio.sleep) :
+        rien n'est compté dans cancellation_metrics, qui ne mesure que du temps de génération.
+        """
+        logger.info(f"🛑 Workflow {workflow_id} arrêté: {skipped_steps} étapes simulées évitées")
+        self.running_workflows.update_item(workflow_id, status="stopped", skipped_steps=skipped_steps)
     
     def _get_workflow_steps(self, workflow_type: str) -> List[str]:
         """Retourne les étapes d'un type de workflow"""
@@ -329,15 +403,17 @@ class WorkflowOrchestrator:
         return steps_mapping.get(workflow_type, ["Étape 1", "Étape 2", "Finalisation"])
     
     async def get_workflow_status(self, workflow_id: str):
-        if workflow_id in self.running_workflows:
-            return self.running_workflows[workflow_id]
+        workflow = self.running_workflows.get(workflow_id)
+        if workflow is not None:
+            return workflow
         raise Exception("Workflow not found")
     
     async def stop_workflow(self, workflow_id: str):
-        if workflow_id in self.running_workflows:
-            self.running_workflows[workflow_id]["status"] = "stopped"
-            return True
-        return False
+        stopped = self.running_workflows.update_item(workflow_id, status="stopped") is not None
+        task = self._tasks.get(workflow_id)
+        if task is not None:
+            task.cancel()
+        return stopped
 
 workflow_orchestrator = WorkflowOrchestrator()
 
@@ -349,6 +425,22 @@ class WorkflowRequest(BaseModel):
     workflow_type: str
     description: str
 
+class AgentWorkflowRequest(BaseModel):
+    request: str
+    workflow_type: Optional[str] = None  # Choisi par le routeur si absent
+    context: Optional[Dict[str, Any]] = None
+    force_refresh: bool = False  # Ignore le cache d'étapes et régénère tout
+
+class WorkflowRerunRequest(BaseModel):
+    request: Optional[str] = None  # Nouvelle demande (inchangée si absente)
+    edits: Dict[str, str] = {}  # Sorties éditées par agent, conservées telles quelles
+    force_refresh: bool = False
+
+class WorkflowRouteRequest(BaseModel):
+    request: str
+    allow_agents: Optional[bool] = True  # Un agent seul peut suffire pour une question ponctuelle
+    use_classifier: Optional[bool] = True  # Petit modèle consulté si aucune règle ne tranche
+
 class ConversationContext(BaseModel):
     summary: Optional[str] = None
     recentMessages: Optional[List[Dict[str, Any]]] = []
@@ -360,27 +452,32 @@ class ConversationContext(BaseModel):
     messageCount: Optional[int] = 0
     lastInteraction: Optional[str] = None
 
+# Dans tous les modèles de requête ci-dessous, le contexte de conversation (clés de
+# ConversationContext) est validé comme un simple dict : une union obligeait Pydantic
+# à essayer les deux formes, et le dict gagnait toujours
 class AgentChatRequest(BaseModel):
     message: str
     agent: Optional[str] = "assistant"
-    context: Optional[Union[Dict[str, Any], ConversationContext]] = None
+    context: Optional[Dict[str, Any]] = None
     project_id: Optional[str] = None
     conversation_id: Optional[str] = None
 
 class ChatMessage(BaseModel):
     message: str
     agent: Optional[str] = "assistant"
-    context: Optional[Union[Dict[str, Any], ConversationContext]] = None
+    context: Optional[Dict[str, Any]] = None
     project_id: Optional[str] = None
     conversation_id: Optional[str] = None
     execute_code: Optional[bool] = False
     language: Optional[str] = None
+    speculative: Optional[bool] = False  # Brouillon immédiat du petit modèle, remplacé par la réponse affinée
+    timeout: Optional[float] = None  # Secondes que le client accepte d'attendre (comme X-Request-Timeout)
 
 class CodeExecutionRequest(BaseModel):
     code: str
     language: str
     agent: Optional[str] = "code-assistant"
-    context: Optional[Union[Dict[str, Any], ConversationContext]] = None
+    context: Optional[Dict[str, Any]] = None
 
 class CodeAnalysisRequest(BaseModel):
     code: str
@@ -390,11 +487,23 @@ class CodeAnalysisRequest(BaseModel):
 class CodeGenerationRequest(BaseModel):
     description: str
     language: str
-    context: Optional[Union[Dict[str, Any], ConversationContext]] = None
+    context: Optional[Dict[str, Any]] = None
 
 class ModelSwitchRequest(BaseModel):
     model: str
 
+class LoggingSettingsRequest(BaseModel):
+    level: Optional[str] = None  # DEBUG | INFO | WARNING | ERROR
+    sampling: Optional[str] = None  # "/health=0.01,/system/status=0.1"
+
+class BatchAgentRequest(BaseModel):
+    message: Optional[str] = ""
+    code: Optional[str] = None
+    language: Optional[str] = "python"
+    agents: List[str] = []
+    analysis_types: List[str] = []
+    context: Optional[Dict[str, Any]] = None
+
 # ===================
 # == UTILS CONTEXTE ==
 # ===================
@@ -415,50 +524,55 @@ def safe_get_context_dict(context: Union[Dict, ConversationContext, None]) -> Di
         logger.error(f"Erreur conversion contexte: {e}")
         return {}
 
-def build_contextual_prompt(message: str, context: Union[Dict, ConversationContext, None] = None) -> str:
-    """Construit un prompt enrichi avec le contexte conversationnel"""
-    if not context:
-        return message
+def build_project_context(context_dict: Dict[str, Any]) -> List[str]:
+    """Lignes de contexte projet (projet, fichiers, objectifs), stables d'un tour à l'autre"""
+    lines = []
+    if context_dict.get("projectId"):
+        lines.append(f"PROJET: {context_dict['projectId']}")
     
+    code_context = context_dict.get("codeContext", [])
+    if code_context and isinstance(code_context, list):
+        lines.append(f"FICHIERS DE CODE ACTUELS: {', '.join(code_context)}")
+    
+    objectives = context_dict.get("objectives", [])
+    if objectives and isinstance(objectives, list):
+        lines.append(f"OBJECTIFS: {', '.join(objectives)}")
+    return lines
+
+def build_contextual_prompt(message: str, context: Union[Dict, ConversationContext, None] = None) -> str:
+    """
+    Construit un prompt enrichi avec le contexte conversationnel.
+
+    Ordre du plus stable au plus volatil : projet, résumé, historique
+    (chronologique, seule la fin grandit), puis numéro de message et demande.
+    Deux tours consécutifs partagent ainsi le plus long préfixe possible.
+    """
     try:
         context_dict = safe_get_context_dict(context)
-        prompt_parts = []
+        # Informations projet : identiques pendant toute la conversation
+        prompt_parts = build_project_context(context_dict)
         
-        # Ajouter le résumé de la conversation
+        if prompt_parts:
+            prompt_parts.append("")
+        
+        # Résumé de la conversation : change rarement
         if context_dict.get("summary"):
             prompt_parts.append(f"CONTEXTE DE LA CONVERSATION:\n{context_dict['summary']}\n")
         
-        # Ajouter les messages récents
+        # Historique complet (déjà borné par update_context_with_response), dans l'ordre
         recent_messages = context_dict.get("recentMessages", [])
-        if recent_messages and isinstance(recent_messages, list) and len(recent_messages) > 0:
+        if recent_messages and isinstance(recent_messages, list):
             prompt_parts.append("HISTORIQUE RÉCENT:")
-            for msg in recent_messages[-5:]:  # 5 derniers messages
-                if isinstance(msg, dict):
-                    role = msg.get('role', 'user')
-                    content = msg.get('content', '')
-                    if content:
-                        prompt_parts.append(f"{role.upper()}: {content}")
+            for msg in recent_messages:
+                if isinstance(msg, dict) and msg.get('content'):
+                    prompt_parts.append(f"{msg.get('role', 'user').upper()}: {msg['content']}")
             prompt_parts.append("")
         
-        # Ajouter le contexte de code
-        code_context = context_dict.get("codeContext", [])
-        if code_context and isinstance(code_context, list) and len(code_context) > 0:
-            prompt_parts.append(f"FICHIERS DE CODE ACTUELS: {', '.join(code_context)}")
-        
-        # Ajouter les objectifs
-        objectives = context_dict.get("objectives", [])
-        if objectives and isinstance(objectives, list) and len(objectives) > 0:
-            prompt_parts.append(f"OBJECTIFS: {', '.join(objectives)}")
-        
-        # Ajouter les métadonnées
-        if context_dict.get("projectId"):
-            prompt_parts.append(f"PROJET: {context_dict['projectId']}")
-        
+        # Parties volatiles en dernier
         if context_dict.get("messageCount"):
             prompt_parts.append(f"MESSAGE #{context_dict['messageCount']} de cette conversation")
         
-        # Ajouter le message actuel
-        prompt_parts.append(f"\nDEMANDE ACTUELLE:\n{message}")
+        prompt_parts.append(f"DEMANDE ACTUELLE:\n{message}")
         
         return "\n".join(prompt_parts)
         
@@ -466,6 +580,9 @@ def build_contextual_prompt(message: str, context: Union[Dict, ConversationConte
         logger.error(f"Erreur build_contextual_prompt: {e}")
         return message
 
+HISTORY_MAX_MESSAGES = 10
+HISTORY_TRIM_TO = 6
+
 def update_context_with_response(context: Union[Dict, ConversationContext, None], user_message: str, ai_response: str) -> Dict[str, Any]:
     """Met à jour le contexte avec la nouvelle interaction"""
     try:
@@ -496,8 +613,11 @@ def update_context_with_response(context: Union[Dict, ConversationContext, None]
         
         context_dict["recentMessages"].extend(new_messages)
         
-        # Garder seulement les 10 derniers messages
-        context_dict["recentMessages"] = context_dict["recentMessages"][-10:]
+        # Historique borné par blocs : au-delà de HISTORY_MAX_MESSAGES on ne garde que les
+        # HISTORY_TRIM_TO derniers. Le début de l'historique ne bouge donc pas à chaque tour
+        # (une fenêtre glissante casserait le préfixe commun des prompts à chaque message)
+        if len(context_dict["recentMessages"]) > HISTORY_MAX_MESSAGES:
+            context_dict["recentMessages"] = context_dict["recentMessages"][-HISTORY_TRIM_TO:]
         
         # Mettre à jour les métadonnées
         context_dict["lastInteraction"] = datetime.now().isoformat()
@@ -521,19 +641,120 @@ def update_context_with_response(context: Union[Dict, ConversationContext, None]
 # == MIDDLEWARE ====
 # ===================
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    logger.info(f"➡️ {request.method} {request.url}")
-    try:
-        response = await call_next(request)
-        duration = time.time() - start_time
-        logger.info(f"✅ {request.method} {request.url} [{response.status_code}] {duration:.2f}s")
-        return response
-    except Exception as e:
-        duration = time.time() - start_time
-        logger.error(f"❌ {request.method} {request.url} ERROR: {str(e)} {duration:.2f}s")
-        return JSONResponse(status_code=500, content={"detail": str(e)})
+# Relecture des réglages de log partagés (/system/logging) par chaque worker (s)
+LOG_SETTINGS_SYNC_INTERVAL = 5.0
+
+class RequestLoggingMiddleware:
+    """
+    Journalise chaque requête HTTP : un enregistrement structuré par requête
+    (route sans query string, statut, durée), échantillonné par route. Middleware
+    ASGI pur (et non @app.middleware) : le canal `receive` n'est pas enveloppé,
+    les endpoints voient donc la déconnexion du client et peuvent annuler la
+    génération en cours.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._settings_synced_at = 0.0
+        self._applied_settings = None
+
+    def _sync_log_settings(self):
+        now = time.monotonic()
+        if now - self._settings_synced_at < LOG_SETTINGS_SYNC_INTERVAL:
+            return
+        self._settings_synced_at = now
+        settings = runtime_config.get("logging")
+        if settings and settings != self._applied_settings:
+            self._applied_settings = settings
+            logging_pipeline.configure(level=settings.get("level"), sampling=settings.get("sampling"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        self._sync_log_settings()
+        start_time = time.perf_counter()
+        status = {"code": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        method, path = scope["method"], scope["path"]
+        try:
+            await self.app(scope, receive, send_wrapper)
+            access_logger.info(f"{method} {path} {status['code']}", extra={
+                "route": path, "method": method, "status": status["code"],
+                "duration_ms": round((time.perf_counter() - start_time) * 1000, 1),
+                "trace_id": tracer.current_trace_id()
+            })
+        except Exception as e:
+            access_logger.error(f"{method} {path} ERROR: {e}", exc_info=True, extra={
+                "route": path, "method": method, "status": status["code"] or 500,
+                "duration_ms": round((time.perf_counter() - start_time) * 1000, 1),
+                "trace_id": tracer.current_trace_id()
+            })
+            if status["code"] is None:
+                await JSONResponse(status_code=500, content={"detail": str(e)})(scope, receive, send)
+
+class TracingMiddleware:
+    """
+    Ouvre une trace par requête HTTP (identifiant repris de `traceparent` ou
+    `X-Trace-Id`, renvoyé dans `X-Trace-Id`). Ajouté après le middleware de
+    logs, il l'enveloppe : l'enregistrement d'accès porte le trace_id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        # Identifiant fourni par le client repris seulement s'il est valide pour OTLP, sinon nouvelle trace
+        trace_id = (parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+                    or valid_trace_id(headers.get(b"x-trace-id", b"").decode("latin-1")))
+
+        with tracer.trace(f"{scope['method']} {scope['path']}", trace_id=trace_id) as root:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    root.set(status=message["status"])
+                    if root.trace_id:
+                        message.setdefault("headers", []).append((b"x-trace-id", root.trace_id.encode()))
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+class DeadlineMiddleware:
+    """
+    Échéance de la requête : en-tête `X-Request-Timeout` (secondes, plafonné
+    à REQUEST_TIMEOUT_MAX) ou défaut de la route (REQUEST_TIMEOUTS). Elle
+    borne l'attente dans la file des générations et l'appel à Ollama.
+    """
+
+    def __init__(self, app, route_timeouts: Dict[str, float], max_timeout: float):
+        self.app = app
+        self.route_timeouts = route_timeouts
+        self.max_timeout = max_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        requested = parse_timeout(dict(scope["headers"]).get(b"x-request-timeout", b"").decode("latin-1"))
+        timeout = min(requested, self.max_timeout) if requested else route_timeout(scope["path"], self.route_timeouts)
+        with deadline_scope(timeout):
+            await self.app(scope, receive, send)
+
+app.add_middleware(
+    DeadlineMiddleware,
+    route_timeouts=parse_route_timeouts(DEADLINE_CONFIG["route_timeouts"]),
+    max_timeout=DEADLINE_CONFIG["max_timeout"],
+)
+app.add_middleware(RequestLoggingMiddleware)
+app.add_middleware(TracingMiddleware)
 
 # ===================
 # == ROUTES API ====
@@ -560,9 +781,10 @@ async def root():
         ],
         "routes": [
             "/health", "/test", "/agents", "/agent", "/chat",
-            "/agent/execute", "/agent/analyze", "/agent/generate",
+            "/agent/execute", "/agent/analyze", "/agent/generate", "/agent/batch",
             "/models/available", "/models/switch",
-            "/workflows/available", "/workflows/start", "/workflows/{id}/status", 
+            "/workflows/available", "/workflows/route", "/workflows/start", "/workflows/execute",
+            "/workflows/{id}/status", "/workflows/{id}/resume", 
             "/workflows", "/kb/upload"
         ],
         "agents_available": len(get_available_agents()),
@@ -618,7 +840,7 @@ async def get_available_models():
         return {
             "success": True,
             "models": models,
-            "default_model": DEFAULT_MODEL,
+            "default_model": get_default_model(),
             "count": len(models),
             "timestamp": datetime.now().isoformat()
         }
@@ -638,12 +860,11 @@ async def switch_model(request: ModelSwitchRequest):
         if request.model not in available_models:
             raise HTTPException(status_code=400, detail=f"Modèle '{request.model}' non disponible")
         
-        global DEFAULT_MODEL
-        DEFAULT_MODEL = request.model
+        runtime_config["default_model"] = request.model
         
         return {
             "success": True,
-            "new_default_model": DEFAULT_MODEL,
+            "new_default_model": request.model,
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -728,14 +949,15 @@ async def chat_info():
             "Contexte de code",
             "Multi-agents spécialisés",
             "Intégration Ollama",
-            "Persistance des conversations"
+            "Persistance des conversations",
+            "Mode spéculatif (\"speculative\": true) : brouillon rapide puis réponse affinée, en NDJSON"
         ],
         "available_agents": get_available_agents(),
         "timestamp": datetime.now().isoformat()
     }
 
 @app.post("/chat")
-async def chat(message: ChatMessage):
+async def chat(message: ChatMessage, http_request: Request):
     """Endpoint principal pour le chat avec mémoire conversationnelle"""
     try:
         # Validation
@@ -748,36 +970,41 @@ async def chat(message: ChatMessage):
             raise HTTPException(status_code=400, detail=f"Agent '{agent}' non disponible. Agents: {available_agents}")
 
         start_time = time.time()
-        
-        # Construire le prompt avec contexte
-        contextual_prompt = build_contextual_prompt(message.message, message.context)
+        # Champ `timeout` : rapproche l'échéance de la requête (jamais ne la repousse)
+        narrow_deadline(message.timeout)
         
         logger.info(f"🤖 Chat avec contexte: [{agent}] {message.message[:50]}...")
-        if message.context:
+
+        if message.speculative:
+            return StreamingResponse(speculative_chat_stream(message, agent), media_type="application/x-ndjson")
+
+        # Contexte converti une seule fois, mis en forme ensuite par build_agent_messages
+        with tracer.span("context.convert"):
             context_dict = safe_get_context_dict(message.context)
-            if context_dict.get("conversationId"):
-                logger.info(f"📝 Conversation: {context_dict['conversationId']}")
-
-        # Appel à l'agent avec le prompt contextualisé
-        context_dict = safe_get_context_dict(message.context)
-        result = await query_agent(
-            agent_role=agent,
-            message=contextual_prompt,
-            context=context_dict
-        )
+        if context_dict.get("conversationId"):
+            logger.info(f"📝 Conversation: {context_dict['conversationId']}")
+
+        with tracer.span("agent.query", agent=agent):
+            result = await run_until_disconnect(
+                http_request,
+                query_agent(agent_role=agent, message=message.message, context=context_dict),
+                key=agent
+            )
 
         duration = time.time() - start_time
         
         # Mettre à jour le contexte avec la nouvelle interaction
-        updated_context = update_context_with_response(
-            message.context,
-            message.message,
-            result
-        )
+        with tracer.span("context.update"):
+            updated_context = update_context_with_response(
+                message.context,
+                message.message,
+                result
+            )
 
         logger.info(f"✅ Agent [{agent}] responded in {duration:.2f}s")
 
-        return {
+        # Réponse sérialisée directement : le contexte renvoyé peut peser des centaines de Ko
+        return FastJSONResponse({
             "success": True,
             "response": result,
             "agent": agent,
@@ -791,29 +1018,138 @@ async def chat(message: ChatMessage):
                 "model_used": get_model_for_agent(agent)
             },
             "timestamp": datetime.now().isoformat()
-        }
+        })
 
-    except HTTPException:
+    except (HTTPException, ClientDisconnected, LLMRequestRejected):
         raise
     except Exception as e:
         logger.error(f"❌ Chat endpoint error: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Erreur chat: {str(e)}")
 
+async def speculative_chat_stream(message: ChatMessage, agent: str):
+    """
+    Chat en deux temps (NDJSON) : le petit modèle diffuse un brouillon tout de
+    suite ; si la politique de routage le juge utile, le modèle spécialiste
+    génère en parallèle la réponse affinée qui remplace le brouillon.
+
+    Événements : route, draft_delta*, draft_done, final (+ error éventuels).
+    """
+    start_time = time.time()
+    context_dict = safe_get_context_dict(message.context)
+    refine_model = get_model_for_agent(agent)
+
+    def line(event: Dict[str, Any]) -> bytes:
+        return dumps_json(event) + b"\n"
+
+    def final_event(response: str, source: str, model: str) -> bytes:
+        updated_context = update_context_with_response(message.context, message.message, response)
+        return line({
+            "type": "final",
+            "source": source,
+            "replaces_draft": source == "refined",
+            "response": response,
+            "agent": agent,
+            "context": updated_context,
+            "metadata": {
+                "response_time": f"{time.time() - start_time:.2f}s",
+                "message_count": updated_context.get("messageCount", 0),
+                "model_used": model
+            },
+            "timestamp": datetime.now().isoformat()
+        })
+
+    if not await ollama_service.check_connection():
+        logger.warning("Ollama non disponible, utilisation du mode mock")
+        yield line({"type": "route", "refine": False, "reasons": ["Ollama non disponible"]})
+        yield final_event(await query_agent_mock(agent, message.message, context_dict), "mock", "mock")
+        return
+
+    decision = model_routing_policy.decide(agent, message.message, refine_model, ollama_service.available_models)
+    yield line({"type": "route", **decision})
+    logger.info(f"🧭 [{agent}] score {decision['score']} -> "
+                f"{'brouillon + ' + refine_model if decision['refine'] else 'brouillon seul'}")
+
+    system_prompt, history, prompt = build_agent_messages(agent, message.message, context_dict)
+    provider = ollama_service.provider
+    options = get_generation_profile(agent)
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def run_draft():
+        try:
+            async for chunk in provider.stream(decision["draft_model"], prompt, system=system_prompt, history=history,
+                                               options=options, agent=f"{agent}:draft"):
+                await events.put(("draft_delta", chunk))
+            await events.put(("draft_done", None))
+        except LLMProviderError as e:
+            await events.put(("draft_error", str(e)))
+
+    async def run_refine():
+        try:
+            await events.put(("refined", await provider.generate(
+                refine_model, prompt, system=system_prompt, history=history, options=options, agent=agent
+            )))
+        except LLMProviderError as e:
+            await events.put(("refine_error", str(e)))
+
+    tasks = {"draft": asyncio.create_task(run_draft())}
+    if decision["refine"]:
+        tasks["refine"] = asyncio.create_task(run_refine())
+
+    draft_parts: List[str] = []
+    draft_finished, refine_pending = False, decision["refine"]
+    try:
+        while True:
+            kind, payload = await events.get()
+            if kind == "draft_delta":
+                draft_parts.append(payload)
+                yield line({"type": "draft_delta", "content": payload})
+            elif kind in ("draft_done", "draft_error"):
+                draft_finished = True
+                if kind == "draft_error":
+                    yield line({"type": "error", "source": "draft", "error": payload})
+                else:
+                    cancellation_metrics.record_completed(f"{agent}:draft", time.time() - start_time)
+                    yield line({"type": "draft_done", "model": decision["draft_model"]})
+                if not refine_pending:
+                    # Flux déjà ouvert : un échec est signalé dans la réponse finale, pas par un statut HTTP
+                    fallback = f"Erreur de génération: {payload}" if payload else "Pas de réponse générée"
+                    yield final_event("".join(draft_parts) or fallback, "draft", decision["draft_model"])
+                    return
+            elif kind == "refined":
+                # La réponse affinée arrive : le brouillon encore en cours est annulé en sortie
+                cancellation_metrics.record_completed(agent, time.time() - start_time)
+                yield final_event(payload or "Pas de réponse générée", "refined", refine_model)
+                return
+            elif kind == "refine_error":
+                refine_pending = False
+                yield line({"type": "error", "source": "refined", "error": payload})
+                if draft_finished:
+                    fallback = f"Erreur de génération: {payload}"
+                    yield final_event("".join(draft_parts) or fallback, "draft", decision["draft_model"])
+                    return
+    finally:
+        # Client déconnecté ou fin : aucune génération ne continue pour rien
+        for name, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                cancellation_metrics.record_cancelled(agent if name == "refine" else f"{agent}:draft",
+                                                      time.time() - start_time)
+
 # ---- LEGACY SUPPORT ----
 
 @app.post("/agent")
-async def agent_chat_legacy(body: AgentChatRequest):
+async def agent_chat_legacy(body: AgentChatRequest, http_request: Request):
     """Endpoint legacy pour compatibilité"""
     try:
         start_time = time.time()
         logger.info(f"🤖 Agent chat legacy: [{body.agent}] {body.message[:60]}...")
 
         context_dict = safe_get_context_dict(body.context)
-        result = await query_agent(
-            agent_role=body.agent,
-            message=body.message,
-            context=context_dict
+        result = await run_until_disconnect(
+            http_request,
+            query_agent(agent_role=body.agent, message=body.message, context=context_dict),
+            key=body.agent
         )
 
         duration = time.time() - start_time
@@ -827,6 +1163,8 @@ async def agent_chat_legacy(body: AgentChatRequest):
             "response_time": f"{duration:.2f}s"
         }
 
+    except (ClientDisconnected, LLMRequestRejected):
+        raise
     except Exception as e:
         logger.error(f"❌ Agent chat failed: {str(e)}")
         logger.error(traceback.format_exc())
@@ -835,7 +1173,7 @@ async def agent_chat_legacy(body: AgentChatRequest):
 # ---- ENDPOINTS SPÉCIALISÉS ----
 
 @app.post("/agent/execute")
-async def execute_code(request: CodeExecutionRequest):
+async def execute_code(request: CodeExecutionRequest, http_request: Request):
     """Exécution de code avec contexte"""
     try:
         prompt = f"""
@@ -848,15 +1186,12 @@ Code à exécuter:
 
 Instructions: Analyse ce code, explique ce qu'il fait, et retourne le résultat attendu. Si il y a des erreurs, explique-les et propose des corrections.
 """
-        
-        if request.context:
-            prompt = build_contextual_prompt(prompt, request.context)
 
         context_dict = safe_get_context_dict(request.context)
-        result = await query_agent(
-            agent_role=request.agent,
-            message=prompt,
-            context=context_dict
+        result = await run_until_disconnect(
+            http_request,
+            query_agent(agent_role=request.agent, message=prompt, context=context_dict),
+            key=request.agent
         )
 
         return {
@@ -872,28 +1207,22 @@ Instructions: Analyse ce code, explique ce qu'il fait, et retourne le résultat
             "timestamp": datetime.now().isoformat()
         }
 
+    except (ClientDisconnected, LLMRequestRejected):
+        raise
     except Exception as e:
         logger.error(f"❌ Code execution error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur exécution: {str(e)}")
 
 @app.post("/agent/analyze")
-async def analyze_code(request: CodeAnalysisRequest):
+async def analyze_code(request: CodeAnalysisRequest, http_request: Request):
     """Analyse de code (review, debug, optimize, explain)"""
     try:
-        analysis_prompts = {
-            "review": f"REVIEW DE CODE:\nAnalyse ce code {request.language} et donne tes recommandations pour l'améliorer:",
-            "optimize": f"OPTIMISATION:\nComment optimiser ce code {request.language} pour de meilleures performances:",
-            "debug": f"DEBUG:\nAnalyse ce code {request.language} et identifie les problèmes potentiels:",
-            "explain": f"EXPLICATION:\nExplique ce code {request.language} de manière détaillée:"
-        }
-        
-        prompt = analysis_prompts.get(request.analysis_type, analysis_prompts["review"])
-        prompt += f"\n\n```{request.language}\n{request.code}\n```"
+        prompt = build_analysis_prompt(request.analysis_type, request.language, request.code)
 
-        result = await query_agent(
-            agent_role="code-assistant",
-            message=prompt,
-            context={}
+        result = await run_until_disconnect(
+            http_request,
+            query_agent(agent_role="code-assistant", message=prompt, context={}),
+            key="code-assistant"
         )
 
         return {
@@ -905,12 +1234,14 @@ async def analyze_code(request: CodeAnalysisRequest):
             "timestamp": datetime.now().isoformat()
         }
 
+    except (ClientDisconnected, LLMRequestRejected):
+        raise
     except Exception as e:
         logger.error(f"❌ Code analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur analyse: {str(e)}")
 
 @app.post("/agent/generate")
-async def generate_code(request: CodeGenerationRequest):
+async def generate_code(request: CodeGenerationRequest, http_request: Request):
     """Génération de code avec contexte"""
     try:
         prompt = f"""
@@ -920,15 +1251,12 @@ Description: {request.description}
 
 Instructions: Génère du code {request.language} propre, bien commenté et fonctionnel selon cette description. Inclus des exemples d'utilisation si pertinent.
 """
-        
-        if request.context:
-            prompt = build_contextual_prompt(prompt, request.context)
 
         context_dict = safe_get_context_dict(request.context)
-        result = await query_agent(
-            agent_role="code-assistant",
-            message=prompt,
-            context=context_dict
+        result = await run_until_disconnect(
+            http_request,
+            query_agent(agent_role="code-assistant", message=prompt, context=context_dict),
+            key="code-assistant"
         )
 
         return {
@@ -940,10 +1268,108 @@ Instructions: Génère du code {request.language} propre, bien commenté et fonc
             "timestamp": datetime.now().isoformat()
         }
 
+    except (ClientDisconnected, LLMRequestRejected):
+        raise
     except Exception as e:
         logger.error(f"❌ Code generation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur génération: {str(e)}")
 
+# ---- BATCH MULTI-AGENTS ----
+
+MAX_BATCH_JOBS = int(os.getenv("MAX_BATCH_JOBS", "8"))
+
+async def _run_batch_job(job: Dict[str, Any], context_dict: Dict[str, Any],
+                         shared: Tuple[str, List[Dict[str, str]]]) -> Dict[str, Any]:
+    start_time = time.time()
+    try:
+        response = await query_agent(agent_role=job["agent"], message=job["prompt"], context=context_dict,
+                                     shared=shared)
+        success = True
+    except Exception as e:
+        response, success = f"Erreur: {e}", False
+    return {
+        "type": "agent_result",
+        "agent": job["agent"],
+        "analysis_type": job.get("analysis_type"),
+        "success": success,
+        "response": response,
+        "model_used": get_model_for_agent(job["agent"]),
+        "response_time": f"{time.time() - start_time:.2f}s"
+    }
+
+@app.post("/agent/batch")
+async def agent_batch(request: BatchAgentRequest):
+    """
+    Une demande, plusieurs agents : le contexte et le code ne sont construits
+    qu'une fois, les agents tournent en parallèle sous le limiteur global et
+    chaque résultat est renvoyé (NDJSON) dès qu'il est prêt.
+    """
+    available_agents = get_available_agents()
+    unknown = [agent for agent in request.agents if agent not in available_agents]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Agents non disponibles: {unknown}. Agents: {available_agents}")
+    unknown = [kind for kind in request.analysis_types if kind not in ANALYSIS_PROMPTS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Analyses inconnues: {unknown}. Types: {list(ANALYSIS_PROMPTS)}")
+    if request.analysis_types and not request.code:
+        raise HTTPException(status_code=400, detail="Le code est requis pour les analyses")
+    if request.agents and not (request.message or "").strip() and not (request.code or "").strip():
+        raise HTTPException(status_code=400, detail="Un message ou du code est requis pour interroger les agents")
+
+    jobs_count = len(request.agents) + len(request.analysis_types)
+    if jobs_count == 0:
+        raise HTTPException(status_code=400, detail="Aucun agent ni type d'analyse demandé")
+    if jobs_count > MAX_BATCH_JOBS:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BATCH_JOBS} agents par batch")
+
+    # Parties communes construites une seule fois pour tous les agents :
+    # contexte stable, historique normalisé et message (demande + code)
+    context_dict = safe_get_context_dict(request.context)
+    shared = build_conversation_context(context_dict)
+    shared_message = request.message or ""
+    if request.code:
+        shared_message += f"\n\n```{request.language}\n{request.code}\n```"
+
+    jobs = [{"agent": agent, "prompt": shared_message} for agent in request.agents]
+    jobs += [
+        {
+            "agent": "code-assistant",
+            "analysis_type": kind,
+            "prompt": build_analysis_prompt(kind, request.language, request.code)
+        }
+        for kind in request.analysis_types
+    ]
+
+    batch_id = f"batch_{uuid.uuid4().hex[:8]}"
+    logger.info(f"🧩 Batch {batch_id}: {len(jobs)} agents en parallèle")
+
+    async def stream_results():
+        start_time = time.time()
+        tasks = [asyncio.create_task(_run_batch_job(job, context_dict, shared)) for job in jobs]
+        completed = 0
+        try:
+            yield dumps_json({"type": "batch_started", "batch_id": batch_id, "jobs": len(jobs)}) + b"\n"
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                completed += 1
+                yield dumps_json(result) + b"\n"
+            yield dumps_json({
+                "type": "batch_completed",
+                "batch_id": batch_id,
+                "completed": completed,
+                "duration": f"{time.time() - start_time:.2f}s"
+            }) + b"\n"
+        finally:
+            # Client déconnecté : les agents encore en cours sont annulés
+            pending = [(task, job) for task, job in zip(tasks, jobs) if not task.done()]
+            for task, job in pending:
+                task.cancel()
+                cancellation_metrics.record_cancelled(job["agent"], time.time() - start_time)
+            if pending:
+                logger.info(f"🛑 Batch {batch_id}: {len(pending)} agents annulés")
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 # ---- WORKFLOWS ----
 
 @app.get("/workflows/available")
@@ -961,6 +1387,27 @@ async def get_available_workflows():
         logger.error(f"Erreur workflows disponibles: {e}")
         return {"success": False, "workflows": [], "error": str(e)}
 
+@app.post("/workflows/route")
+async def route_workflow(request: WorkflowRouteRequest):
+    """
+    Workflow (ou agent seul) le moins coûteux couvrant la demande, avec son coût
+    estimé : étapes x latence attendue de chaque agent (historique ou taille du modèle).
+    """
+    if not request.request.strip():
+        raise HTTPException(status_code=400, detail="La demande ne peut pas être vide")
+    router = agent_workflow_engine.router
+    if request.use_classifier:
+        decision = await router.aroute(request.request, allow_agents=request.allow_agents)
+    else:
+        decision = router.route(request.request, allow_agents=request.allow_agents)
+    logger.info(f"🧭 Routage [{decision['source']}] -> {decision['workflow'] or decision['agent']} "
+                f"(~{decision['estimated_cost']['estimated_seconds']:.0f}s)")
+    return {
+        "success": True,
+        "decision": decision,
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.post("/workflows/start")
 async def start_workflow(request: WorkflowRequest):
     """Démarre un nouveau workflow"""
@@ -981,11 +1428,128 @@ async def start_workflow(request: WorkflowRequest):
         logger.error(f"❌ Erreur démarrage workflow: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur workflow: {str(e)}")
 
+@app.post("/workflows/execute")
+async def execute_agent_workflow(request: AgentWorkflowRequest):
+    """
+    Lance un workflow d'agents (core/workflow_engine) en arrière-plan. Chaque
+    étape terminée est sauvegardée : /workflows/{id}/resume repart de là.
+    """
+    if not request.request.strip():
+        raise HTTPException(status_code=400, detail="La demande ne peut pas être vide")
+    workflow_type = request.workflow_type or agent_workflow_engine.suggest_workflow(request.request)
+    try:
+        workflow_id = agent_workflow_engine.create_workflow(
+            workflow_type, request.request, request.context, force_refresh=request.force_refresh
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e}: {workflow_type}")
+    agent_workflow_engine.run_in_background(workflow_id)
+    logger.info(f"🔄 Workflow d'agents {workflow_type} démarré: {workflow_id}")
+    return {
+        "success": True,
+        "workflow_id": workflow_id,
+        "type": workflow_type,
+        "steps": agent_workflow_engine.workflow_templates[workflow_type]["steps"],
+        "status": "started",
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/workflows/{workflow_id}/resume")
+async def resume_agent_workflow(workflow_id: str, force: bool = False):
+    """Reprend un workflow d'agents à sa première étape incomplète, avec le contexte sauvegardé"""
+    try:
+        workflow = agent_workflow_engine.prepare_resume(workflow_id, force=force)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Workflow {workflow_id} non trouvé")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if workflow["status"] == "completed":
+        return {
+            "success": True,
+            "workflow_id": workflow_id,
+            "status": "completed",
+            "message": "Workflow déjà terminé, rien à reprendre",
+            "timestamp": datetime.now().isoformat()
+        }
+    agent_workflow_engine.run_in_background(workflow_id)
+    logger.info(f"▶️ Workflow {workflow_id} repris à l'étape {workflow['next_step'] + 1}/{workflow['total_steps']}")
+    return {
+        "success": True,
+        "workflow_id": workflow_id,
+        "status": "resumed",
+        "resume_from_step": workflow["next_step"],
+        "completed_steps": workflow["next_step"],
+        "total_steps": workflow["total_steps"],
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/workflows/{workflow_id}/rerun")
+async def rerun_agent_workflow(workflow_id: str, request: WorkflowRerunRequest):
+    """
+    Réexécution incrémentale : nouveau workflow qui reprend les sorties du
+    précédent passage et ne recalcule que les étapes en aval de la modification
+    (toutes si la demande change, celles après l'agent édité sinon).
+    """
+    try:
+        rerun = agent_workflow_engine.prepare_rerun(
+            workflow_id, request.request, request.edits, force_refresh=request.force_refresh
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Workflow {workflow_id} non trouvé")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    agent_workflow_engine.run_in_background(rerun["id"])
+    logger.info(f"🔁 Workflow {workflow_id} réexécuté depuis l'étape {rerun['next_step'] + 1}/{rerun['total_steps']}: {rerun['id']}")
+    return {
+        "success": True,
+        "workflow_id": rerun["id"],
+        "parent_id": workflow_id,
+        "status": "started",
+        "rerun_from_step": rerun["next_step"],
+        "reused_steps": rerun["next_step"],
+        "steps_to_run": rerun["total_steps"] - rerun["next_step"],
+        "timestamp": datetime.now().isoformat()
+    }
+
+# Attente maximale d'un long-polling et intervalle des commentaires keep-alive SSE (s)
+MAX_LONG_POLL_SECONDS = 60.0
+SSE_KEEPALIVE_SECONDS = 15.0
+
 @app.get("/workflows/{workflow_id}/status")
-async def get_workflow_status(workflow_id: str):
-    """Statut d'un workflow"""
+async def get_workflow_status(workflow_id: str, since_version: Optional[int] = None, timeout: float = 30.0,
+                              include_outputs: bool = True):
+    """
+    Statut d'un workflow (simulé ou d'agents). Avec `since_version`, la requête
+    attend (long-polling, au plus `timeout` s) que l'état d'un workflow
+    d'agents dépasse cette version ; `include_outputs=false` omet les sorties.
+    """
+    if since_version is not None:
+        workflow = await agent_workflow_engine.wait_for_change(
+            workflow_id, since_version, max(0.0, min(timeout, MAX_LONG_POLL_SECONDS))
+        )
+        if workflow is None:
+            raise HTTPException(status_code=404, detail=f"Workflow {workflow_id} non trouvé")
+        return {
+            "success": True,
+            "workflow_id": workflow_id,
+            "version": workflow.get("version", 0),
+            "changed": workflow.get("version", 0) > since_version,
+            "workflow_data": workflow if include_outputs else strip_outputs(workflow),
+            "timestamp": datetime.now().isoformat()
+        }
     try:
-        status = await workflow_orchestrator.get_workflow_status(workflow_id)
+        try:
+            status = await workflow_orchestrator.get_workflow_status(workflow_id)
+        except Exception:
+            status = agent_workflow_engine.get_workflow_status(workflow_id)
+            if status is None:
+                raise
+        if not include_outputs and "steps" in status and "results" in status:
+            status = strip_outputs(status)
         return {
             "success": True,
             "workflow_id": workflow_id,
@@ -996,11 +1560,79 @@ async def get_workflow_status(workflow_id: str):
         logger.error(f"❌ Erreur statut workflow: {e}")
         raise HTTPException(status_code=404, detail=f"Workflow {workflow_id} non trouvé")
 
+@app.get("/workflows/{workflow_id}/events")
+async def workflow_events_sse(workflow_id: str, request: Request, last_seq: int = 0):
+    """
+    Flux SSE des événements d'un workflow d'agents (step_started,
+    step_progress, step_completed...). Reprise via ?last_seq=N ou l'en-tête
+    Last-Event-ID renvoyé automatiquement par EventSource.
+    """
+    if agent_workflow_engine.get_workflow_status(workflow_id) is None:
+        raise HTTPException(status_code=404, detail=f"Workflow {workflow_id} non trouvé")
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        last_seq = max(last_seq, int(last_event_id))
+
+    async def event_stream():
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def forward_events():
+            try:
+                async for event in agent_workflow_engine.stream_events(workflow_id, last_seq):
+                    await queue.put(event)
+            finally:
+                await queue.put(None)
+
+        forward_task = asyncio.create_task(forward_events())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                event_id = f"id: {event['seq']}\n" if "seq" in event else ""
+                yield f"{event_id}event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            forward_task.cancel()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/ws/workflows/{workflow_id}")
+async def workflow_events_websocket(websocket: WebSocket, workflow_id: str, last_seq: int = 0):
+    """Événements d'un workflow d'agents sur WebSocket (reprise via ?last_seq=N)"""
+    await websocket.accept()
+    if agent_workflow_engine.get_workflow_status(workflow_id) is None:
+        await websocket.send_json({"type": "workflow_error", "workflow_id": workflow_id, "error": "Workflow non trouvé"})
+        await websocket.close()
+        return
+
+    async def forward_events():
+        async for event in agent_workflow_engine.stream_events(workflow_id, last_seq):
+            await websocket.send_json(event)
+        await websocket.close()
+
+    forward_task = asyncio.create_task(forward_events())
+    try:
+        logger.info(f"🌊 WebSocket workflow connecté: {workflow_id} (last_seq={last_seq})")
+        while True:
+            message = await websocket.receive_text()
+            if message == "ping":
+                await websocket.send_json({"type": "pong"})
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError : socket déjà fermée par forward_events en fin de flux
+        pass
+    finally:
+        forward_task.cancel()
+
 @app.post("/workflows/{workflow_id}/stop")
 async def stop_workflow(workflow_id: str):
     """Arrête un workflow"""
     try:
-        success = await workflow_orchestrator.stop_workflow(workflow_id)
+        success = await workflow_orchestrator.stop_workflow(workflow_id) or agent_workflow_engine.stop_workflow(workflow_id)
         if success:
             return {
                 "success": True,
@@ -1014,20 +1646,77 @@ async def stop_workflow(workflow_id: str):
         logger.error(f"❌ Erreur arrêt workflow: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur arrêt workflow: {str(e)}")
 
+# Taille de page des listings de workflows
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
 @app.get("/workflows")
-async def list_running_workflows():
-    """Liste des workflows en cours"""
+async def list_running_workflows(status: Optional[str] = None, type: Optional[str] = None,
+                                 since: Optional[str] = None, until: Optional[str] = None,
+                                 cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    Workflows simulés, plus récents d'abord, par pages (`cursor` = next_cursor
+    de la page précédente). Filtres : statut, type, intervalle ISO [since, until[.
+    Résumés seulement : le détail est sur /workflows/{id}/status.
+    """
     try:
-        workflows = workflow_orchestrator.running_workflows
-        return {
-            "success": True,
-            "running_workflows": workflows,
-            "count": len(workflows),
-            "timestamp": datetime.now().isoformat()
-        }
-    except Exception as e:
-        logger.error(f"❌ Erreur liste workflows: {e}")
-        return {"success": False, "workflows": [], "error": str(e)}
+        page, next_cursor = workflow_orchestrator.running_workflows.query(
+            {"status": status, "type": type}, since=since, until=until, cursor=cursor, limit=page_size(limit)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    workflows = [
+        {"id": workflow_id, **{k: v for k, v in workflow.items() if k != "steps"}, "steps_completed": len(workflow["steps"])}
+        for workflow_id, workflow in page
+    ]
+    return FastJSONResponse({
+        "success": True,
+        "workflows": workflows,
+        "count": len(workflows),
+        "next_cursor": next_cursor,
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.get("/workflows/agents")
+async def list_agent_workflows(status: Optional[str] = None, type: Optional[str] = None,
+                               since: Optional[str] = None, until: Optional[str] = None,
+                               cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Workflows d'agents (résumés paginés, mêmes filtres que /workflows) ; sorties sur /workflows/{id}/outputs"""
+    try:
+        workflows, next_cursor = agent_workflow_engine.list_workflows(
+            status, type, since=since, until=until, cursor=cursor, limit=page_size(limit)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({
+        "success": True,
+        "workflows": workflows,
+        "count": len(workflows),
+        "next_cursor": next_cursor,
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.get("/workflows/{workflow_id}/outputs")
+async def get_agent_workflow_outputs(workflow_id: str, agent: Optional[str] = None):
+    """Sorties d'un workflow d'agents, chargées à la demande (toutes, ou celle d'un agent)"""
+    workflow = agent_workflow_engine.get_workflow_status(workflow_id)
+    if workflow is None:
+        raise HTTPException(status_code=404, detail=f"Workflow {workflow_id} non trouvé")
+    outputs = workflow["results"]
+    if agent is not None:
+        if agent not in outputs:
+            raise HTTPException(status_code=404, detail=f"Pas de sortie pour {agent} dans {workflow_id}")
+        outputs = {agent: outputs[agent]}
+    return {
+        "success": True,
+        "workflow_id": workflow_id,
+        "status": workflow["status"],
+        "outputs": outputs,
+        "timestamp": datetime.now().isoformat()
+    }
 
 # ---- UPLOAD FILES ----
 
@@ -1068,6 +1757,36 @@ async def upload_kb_files(files: List[UploadFile] = File(...)):
 
 # ---- SYSTEM ENDPOINTS ----
 
+@app.get("/debug/traces/recent")
+async def recent_traces(min_ms: Optional[float] = None, limit: int = 20, name: Optional[str] = None):
+    """
+    Traces récentes les plus lentes d'abord (au-dessus de TRACE_SLOW_MS par
+    défaut, `min_ms=0` pour toutes), avec leurs spans par phase.
+    """
+    return {
+        "success": True,
+        "traces": tracer.recent_traces(min_ms, max(1, min(limit, 200)), name),
+        "stats": tracer.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/system/logging")
+async def get_logging_settings():
+    """Niveau, échantillonnage et compteurs du pipeline de logs de ce worker"""
+    return {"success": True, "logging": logging_pipeline.stats(), "timestamp": datetime.now().isoformat()}
+
+@app.post("/system/logging")
+async def update_logging_settings(request: LoggingSettingsRequest):
+    """Change niveau et échantillonnage à chaud (repris par les autres workers sous quelques secondes)"""
+    try:
+        sampling = parse_sampling(request.sampling) if request.sampling is not None else None
+        settings = logging_pipeline.configure(level=request.level, sampling=sampling)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    runtime_config["logging"] = {"level": settings["level"], "sampling": settings["sampling"]}
+    logger.info(f"📝 Logs: niveau {settings['level']}, échantillonnage {settings['sampling']}")
+    return {"success": True, "logging": settings, "timestamp": datetime.now().isoformat()}
+
 @app.get("/system/status")
 async def system_status():
     """Statut détaillé du système"""
@@ -1087,7 +1806,7 @@ async def system_status():
                     "connected": ollama_connected,
                     "url": OLLAMA_URL,
                     "models": models,
-                    "default_model": DEFAULT_MODEL
+                    "default_model": get_default_model()
                 },
                 "agents": {
                     "available": get_available_agents(),
@@ -1095,8 +1814,17 @@ async def system_status():
                 },
                 "workflows": {
                     "running": len(workflow_orchestrator.running_workflows),
-                    "available_types": workflow_orchestrator.get_available_workflows()
+                    "available_types": workflow_orchestrator.get_available_workflows(),
+                    "event_subscribers": agent_workflow_engine.events.subscriber_count()
                 },
+                "workers": performance_monitor.get_cluster_stats(),
+                "cancellation": cancellation_metrics.stats(),
+                "prompt_cache": prefix_reuse_tracker.get_stats(),
+                "model_routing": model_routing_policy.stats(),
+                "workflow_routing": agent_workflow_engine.router.get_stats(),
+                "step_memo": agent_workflow_engine.memo.stats() if agent_workflow_engine.memo else {"enabled": False},
+                "tracing": tracer.get_stats(),
+                "admission": admission_stats(),
                 "storage": {
                     "upload_dir": UPLOAD_DIR,
                     "files": len(os.listdir(UPLOAD_DIR)) if os.path.exists(UPLOAD_DIR) else 0
@@ -1117,6 +1845,21 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         content={"detail": exc.detail, "timestamp": datetime.now().isoformat()}
     )
 
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # 499 (convention nginx) : personne ne lira cette réponse, la génération a été annulée
+    return JSONResponse(status_code=499, content={"detail": "Client déconnecté"})
+
+@app.exception_handler(LLMRequestRejected)
+async def request_rejected_handler(request: Request, exc: LLMRequestRejected):
+    # 503 : surcharge, rejet immédiat plutôt qu'une réponse trop tardive ; 504 : échéance atteinte
+    headers = {"Retry-After": str(max(1, math.ceil(exc.retry_after)))} if exc.retry_after else None
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "retry_after": exc.retry_after, "timestamp": datetime.now().isoformat()},
+        headers=headers
+    )
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logger.error(f"General Exception: {str(exc)}")
@@ -1136,7 +1879,7 @@ async def startup_event():
     ollama_connected = await ollama_service.check_connection()
     if ollama_connected:
         logger.info(f"✅ Ollama connecté: {len(ollama_service.available_models)} modèles disponibles")
-        logger.info(f"🤖 Modèle par défaut: {DEFAULT_MODEL}")
+        logger.info(f"🤖 Modèle par défaut: {get_default_model()}")
     else:
         logger.warning("⚠️ Ollama non connecté - mode fallback activé")
     
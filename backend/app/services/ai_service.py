@@ -1,12 +1,12 @@
 # backend/app/services/ai_service.py - VERSION SIMPLE QUI MARCHE
-import asyncio
-import httpx
-from typing import Dict, List, Any
-from ..utils.config import AGENT_ROLES
+from typing import Callable, Dict, List, Any, Optional
+from ..utils.config import AGENT_ROLES, get_generation_profile
+from ..utils.tracing import tracer
+from .llm_provider import FallbackResponse, LLMProvider, LLMProviderError, get_default_provider
 
 class SimpleOllamaService:
-    def __init__(self):
-        self.base_url = "http://localhost:11434"
+    def __init__(self, provider: Optional[LLMProvider] = None):
+        self._provider = provider
         
         # Modèles spécialisés
         self.agent_models = {
@@ -21,20 +21,29 @@ class SimpleOllamaService:
             "assistant": "qwen2.5:3b"
         }
 
+    @property
+    def provider(self) -> LLMProvider:
+        """Fournisseur résolu au premier appel (client HTTP créé à la demande)"""
+        if self._provider is None:
+            self._provider = get_default_provider()
+        return self._provider
+
     async def is_available(self) -> bool:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/api/tags", timeout=5.0)
-                return response.status_code == 200
-        except:
-            return False
+        return await self.provider.is_available()
 
-    async def query_agent(self, agent_role: str, message: str, context: Dict[str, Any] = None) -> str:
+    async def query_agent(self, agent_role: str, message: str, context: Dict[str, Any] = None,
+                          on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """
+        `on_delta` reçoit les fragments au fil de la génération (réponse en streaming).
+        Sans génération réelle, le texte de repli est une FallbackResponse.
+        """
         context = context or {}
         
-        if not await self.is_available():
+        with tracer.span("ollama.health_probe"):
+            available = await self.is_available()
+        if not available:
             model_name = self.agent_models.get(agent_role, "qwen2.5:3b")
-            return f"""⚠️ **[Mode Simulation - {agent_role.title()}]**
+            return FallbackResponse(f"""⚠️ **[Mode Simulation - {agent_role.title()}]**
 
 Ollama non disponible. Pour activer l'IA réelle:
 1. Installez Ollama: https://ollama.ai
@@ -42,34 +51,31 @@ Ollama non disponible. Pour activer l'IA réelle:
 3. Installez: ollama pull {model_name}
 
 Message: "{message}"
-*Réponse simulée - sera remplacée par l'IA réelle*"""
+*Réponse simulée - sera remplacée par l'IA réelle*""", reason="Ollama non disponible")
         
         # IA réelle avec Ollama
         model_name = self.agent_models.get(agent_role, "qwen2.5:3b")
-        prompt = f"Tu es un {agent_role} expert. {message}"
-        
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": model_name,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {"temperature": 0.7, "max_tokens": 1500}
-                    }
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    generated_text = result.get("response", "Erreur: réponse vide")
-                    emoji = {"visionnaire": "🔮", "architecte": "🏗️", "frontend_engineer": "⚛️"}.get(agent_role, "🤖")
-                    return f"{emoji} **[{agent_role.title()}]**\n\n{generated_text}"
+            request = dict(
+                system=f"Tu es un {agent_role} expert.",
+                options=get_generation_profile(agent_role),
+                agent=agent_role
+            )
+            if on_delta is None:
+                with tracer.span("llm.generate", model=model_name, agent=agent_role):
+                    generated_text = await self.provider.generate(model_name, message, **request)
+            else:
+                chunks = []
+                async for chunk in self.provider.stream(model_name, message, **request):
+                    chunks.append(chunk)
+                    on_delta(chunk)
+                generated_text = "".join(chunks)
+            emoji = {"visionnaire": "🔮", "architecte": "🏗️", "frontend_engineer": "⚛️"}.get(agent_role, "🤖")
+            return f"{emoji} **[{agent_role.title()}]**\n\n{generated_text or 'Erreur: réponse vide'}"
                     
-        except Exception as e:
-            pass
-            
-        return f"❌ Erreur avec {agent_role}: {model_name} non disponible"
+        except LLMProviderError as e:
+            return FallbackResponse(f"❌ Erreur avec {agent_role}: {model_name} non disponible",
+                                    reason=f"{model_name}: {e}")
 
 # Instance globale
 simple_ollama_service = SimpleOllamaService()
@@ -78,8 +84,9 @@ simple_ollama_service = SimpleOllamaService()
 def get_available_agents() -> List[str]:
     return list(AGENT_ROLES.keys())
 
-async def query_agent(agent_role: str, message: str, context: Dict[str, Any] = None) -> str:
-    return await simple_ollama_service.query_agent(agent_role, message, context)
+async def query_agent(agent_role: str, message: str, context: Dict[str, Any] = None,
+                      on_delta: Optional[Callable[[str], None]] = None) -> str:
+    return await simple_ollama_service.query_agent(agent_role, message, context, on_delta=on_delta)
 
 def get_agent_capabilities(agent_role: str) -> Dict[str, Any]:
     return AGENT_ROLES.get(agent_role, {})
@@ -0,0 +1,407 @@
+"""
+Écriture asynchrone des fichiers générés dans le workspace
+
+Les écritures disque sont exécutées sur un pool de threads pour ne jamais
+bloquer la boucle d'événements. Chaque lot crée ses répertoires une seule fois,
+écrit de façon atomique (fichier temporaire + rename) et ignore les fichiers
+dont le contenu est inchangé. Des quotas par workflow bornent l'espace occupé.
+
+La lecture se fait en flux : archives zip / tar.gz construites à la volée et
+lectures partielles (Range) fichier par fichier, en mémoire O(chunk).
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import queue
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+ARCHIVE_FORMATS = {
+    "zip": ("application/zip", "zip"),
+    "tar.gz": ("application/gzip", "tar.gz"),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class WorkspaceQuotaExceeded(Exception):
+    """Le lot dépasse le quota de fichiers ou d'octets du workflow"""
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Temporaire de WorkspaceWriter._atomic_write : mkstemp(prefix=".<cible>.", suffix=".tmp")
+_WRITER_TMP_RE = re.compile(r"^\.(?P<target>.+)\.[a-z0-9_]{8}\.tmp$")
+
+
+def _is_writer_tmp(filename: str, siblings: set) -> bool:
+    match = _WRITER_TMP_RE.match(filename)
+    return match is not None and match.group("target") in siblings
+
+
+def iter_workspace_files(base: Path) -> Iterator[Tuple[Path, str]]:
+    """(chemin absolu, chemin relatif POSIX) des fichiers, temporaires d'écriture exclus, ordre stable"""
+    if not base.is_dir():
+        return
+    for directory, dirnames, filenames in os.walk(base):
+        dirnames.sort()
+        siblings = set(filenames)
+        for filename in sorted(filenames):
+            if _is_writer_tmp(filename, siblings):
+                continue
+            path = Path(directory) / filename
+            yield path, path.relative_to(base).as_posix()
+
+
+class WorkspaceWriter:
+    def __init__(
+        self,
+        root: str,
+        max_files_per_workflow: int = 200,
+        max_bytes_per_workflow: int = 20 * 1024 * 1024,
+        max_workers: int = 4,
+    ):
+        self.root = Path(root).resolve()
+        self.max_files_per_workflow = max_files_per_workflow
+        self.max_bytes_per_workflow = max_bytes_per_workflow
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="workspace-writer")
+        # workflow_id -> {chemin relatif: (taille, hash ; "" tant que non calculé)}
+        self._index: Dict[str, Dict[str, Tuple[int, str]]] = {}
+        self._index_lock = threading.Lock()
+
+    def workflow_dir(self, workflow_id: str) -> Path:
+        path = (self.root / workflow_id).resolve()
+        if path.parent != self.root:
+            raise ValueError(f"Identifiant de workflow invalide: {workflow_id}")
+        return path
+
+    def resolve(self, workflow_id: str, relative_path: str) -> Path:
+        """Chemin absolu d'un fichier, confiné au répertoire du workflow"""
+        base = self.workflow_dir(workflow_id)
+        target = (base / relative_path.lstrip("/\\")).resolve()
+        if base != target and base not in target.parents:
+            raise ValueError(f"Chemin hors du workspace: {relative_path}")
+        return target
+
+    def _workflow_index(self, workflow_id: str) -> Dict[str, Tuple[int, str]]:
+        """
+        Index du workflow, amorcé depuis le disque au premier accès : fichiers
+        écrits avant un redémarrage ou par un autre worker comptent dans le quota.
+        Seules les tailles sont lues, les hash sont calculés à la demande.
+        """
+        with self._index_lock:
+            index = self._index.get(workflow_id)
+            if index is None:
+                base = self.workflow_dir(workflow_id)
+                index = {
+                    relative_path: (path.stat().st_size, "")
+                    for path, relative_path in iter_workspace_files(base)
+                }
+                self._index[workflow_id] = index
+            return index
+
+    def list_files(self, workflow_id: str) -> List[Dict]:
+        """Métadonnées (chemin, taille, hash) des fichiers présents sur disque"""
+        base = self.workflow_dir(workflow_id)
+        index = self._workflow_index(workflow_id)
+        entries = []
+        for path, relative_path in iter_workspace_files(base):
+            known = index.get(relative_path)
+            size = path.stat().st_size
+            if known is None or known[0] != size or not known[1]:
+                known = (size, file_hash(path))
+                index[relative_path] = known
+            entries.append({
+                "name": path.name,
+                "path": relative_path,
+                "size": known[0],
+                "hash": known[1],
+            })
+        return entries
+
+    async def list_files_async(self, workflow_id: str) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.list_files, workflow_id)
+
+    def usage(self, workflow_id: str) -> Dict[str, int]:
+        entries = self._workflow_index(workflow_id)
+        return {"files": len(entries), "bytes": sum(size for size, _ in entries.values())}
+
+    async def write_files(self, workflow_id: str, files: List[Tuple[str, str]]) -> List[Dict]:
+        """
+        Écrit un lot de fichiers (chemin relatif, contenu) sans bloquer la boucle.
+        Retourne pour chaque fichier son chemin, sa taille, son hash et s'il a été réécrit.
+        Un fichier au chemin invalide ou hors quota est écarté seul (`rejected` : motif),
+        le reste du lot est écrit.
+        """
+        if not files:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._write_batch, workflow_id, files)
+
+    def _write_batch(self, workflow_id: str, files: List[Tuple[str, str]]) -> List[Dict]:
+        # Dernière version gagnante si un même chemin apparaît plusieurs fois
+        batch: Dict[str, bytes] = {}
+        for relative_path, content in files:
+            batch[relative_path] = content.encode("utf-8")
+
+        # Validation fichier par fichier, dans l'ordre du lot : le quota retient les premiers
+        index = self._workflow_index(workflow_id)
+        base = self.workflow_dir(workflow_id)
+        accepted = dict(index)
+        # chemin demandé -> (chemin absolu, clé d'index normalisée)
+        targets: Dict[str, Tuple[Path, str]] = {}
+        rejected: Dict[str, str] = {}
+        for relative_path, data in batch.items():
+            try:
+                target = self.resolve(workflow_id, relative_path)
+                if target == base:
+                    raise ValueError(f"Chemin de fichier vide: {relative_path}")
+                key = target.relative_to(base).as_posix()
+                self._check_quota(workflow_id, accepted, key, len(data))
+            except (ValueError, WorkspaceQuotaExceeded) as e:
+                rejected[relative_path] = str(e)
+                continue
+            targets[relative_path] = (target, key)
+            accepted[key] = (len(data), "")
+
+        # Création des répertoires : une seule fois par répertoire distinct
+        for directory in sorted({target.parent for target, _ in targets.values()}):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        results = []
+        for relative_path, data in batch.items():
+            if relative_path in rejected:
+                results.append({
+                    "path": relative_path,
+                    "size": len(data),
+                    "written": False,
+                    "rejected": rejected[relative_path],
+                })
+                continue
+
+            target, key = targets[relative_path]
+            digest = content_hash(data)
+
+            written = not self._is_unchanged(index.get(key), target, digest)
+            if written:
+                self._atomic_write(target, data)
+            index[key] = (len(data), digest)
+
+            results.append({
+                "path": relative_path,
+                "size": len(data),
+                "hash": digest,
+                "written": written,
+            })
+
+        rewritten = sum(1 for result in results if result["written"])
+        logger.info(f"💾 Workspace {workflow_id}: {rewritten}/{len(results)} fichiers écrits")
+        if rejected:
+            logger.warning(f"⚠️ Workspace {workflow_id}: {len(rejected)} fichiers écartés", extra={
+                "workflow_id": workflow_id, "rejected": rejected
+            })
+        return results
+
+    def _check_quota(self, workflow_id: str, entries: Dict[str, Tuple[int, str]], relative_path: str, size: int):
+        """Lève WorkspaceQuotaExceeded si ajouter (ou remplacer) ce fichier dépasse le quota"""
+        files = len(entries) + (0 if relative_path in entries else 1)
+        total_bytes = sum(known for known, _ in entries.values()) - entries.get(relative_path, (0, ""))[0] + size
+        if files > self.max_files_per_workflow:
+            raise WorkspaceQuotaExceeded(
+                f"Quota de fichiers dépassé pour {workflow_id}: {files}/{self.max_files_per_workflow}"
+            )
+        if total_bytes > self.max_bytes_per_workflow:
+            raise WorkspaceQuotaExceeded(
+                f"Quota d'espace dépassé pour {workflow_id}: {total_bytes}/{self.max_bytes_per_workflow} octets"
+            )
+
+    @staticmethod
+    def _is_unchanged(known, target: Path, digest: str) -> bool:
+        if known is not None and known[1]:
+            return known[1] == digest and target.exists()
+        if not target.exists():
+            return False
+        return file_hash(target) == digest
+
+    @staticmethod
+    def _atomic_write(target: Path, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# ==================== LECTURE EN FLUX ====================
+
+_DONE = object()
+
+
+class _ArchiveAborted(Exception):
+    """Le client a abandonné le téléchargement"""
+
+
+class _QueueSink:
+    """
+    Flux d'écriture non seekable : les octets sont regroupés par chunk et
+    transmis au consommateur par une file bornée (contre-pression).
+    """
+
+    def __init__(self, chunk_size: int, max_pending: int):
+        self.chunk_size = chunk_size
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self.aborted = threading.Event()
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        self._put(_DONE)
+
+    def _put(self, item):
+        while not self.aborted.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise _ArchiveAborted()
+
+
+def _write_zip(base: Path, sink: _QueueSink, chunk_size: int):
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for path, relative_path in iter_workspace_files(base):
+            info = zipfile.ZipInfo.from_file(path, relative_path)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, "rb") as src, archive.open(info, "w") as dest:
+                shutil.copyfileobj(src, dest, chunk_size)
+
+
+def _write_tar_gz(base: Path, sink: _QueueSink, chunk_size: int):
+    with tarfile.open(fileobj=sink, mode="w|gz", copybufsize=chunk_size) as archive:
+        for path, relative_path in iter_workspace_files(base):
+            archive.add(str(path), arcname=relative_path, recursive=False)
+
+
+def iter_archive(base: Path, fmt: str = "zip", chunk_size: int = CHUNK_SIZE, max_pending: int = 8) -> Iterator[bytes]:
+    """
+    Construit une archive zip ou tar.gz à la volée et la produit par chunks.
+
+    L'archive est écrite par un thread dédié dans une file bornée : la mémoire
+    reste O(chunk_size * max_pending) quelle que soit la taille du projet.
+    Fermer le générateur (client déconnecté) interrompt la production.
+    """
+    writers = {"zip": _write_zip, "tar.gz": _write_tar_gz}
+    if fmt not in writers:
+        raise ValueError(f"Format d'archive non supporté: {fmt}")
+
+    sink = _QueueSink(chunk_size, max_pending)
+
+    def produce():
+        try:
+            writers[fmt](base, sink, chunk_size)
+            sink.finish()
+        except _ArchiveAborted:
+            pass
+        except Exception as e:
+            logger.error(f"❌ Erreur construction archive {base.name}: {e}")
+            try:
+                sink._put(e)
+            except _ArchiveAborted:
+                pass
+
+    threading.Thread(target=produce, name=f"archive-{base.name}", daemon=True).start()
+
+    try:
+        while True:
+            item = sink.queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        sink.aborted.set()
+
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interprète un en-tête Range à intervalle unique (bytes=a-b, a-, -n).
+    Retourne (début, fin incluse), None si absent, ValueError si non satisfaisable.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        raise ValueError(f"Range invalide: {header}")
+
+    start_text, end_text = match.groups()
+    if start_text == "":
+        length = int(end_text)
+        if length == 0:
+            raise ValueError(f"Range invalide: {header}")
+        start, end = max(size - length, 0), size - 1
+    else:
+        start = int(start_text)
+        end = min(int(end_text), size - 1) if end_text else size - 1
+
+    if start >= size or start > end:
+        raise ValueError(f"Range non satisfaisable: {header}")
+    return start, end
+
+
+def iter_file_range(path: Path, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Lit les octets [start, end] d'un fichier par chunks"""
+    remaining = end - start + 1
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,260 @@
+"""
+Passerelle vers l'API OpenAI (ou tout serveur compatible)
+
+Un seul client AsyncOpenAI est partagé. Autour de lui :
+- un limiteur à seaux de jetons sur les requêtes/min et les tokens/min,
+- une limite de concurrence par agent,
+- des retries avec backoff exponentiel à jitter, bornés par un budget global
+  pour éviter les tempêtes de retries quand le fournisseur sature.
+
+OPENAI_BASE_URL permet de viser un serveur local compatible (tests, stub).
+Le client n'est construit qu'au premier appel (client_factory) : le SDK openai
+n'est pas importé au démarrage.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Seau de jetons rechargé en continu (capacité = débit par minute)"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Attend que `amount` jetons soient disponibles ; retourne le temps attendu"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def refund(self, amount: float):
+        """Restitue des jetons réservés en trop (estimation > consommation réelle)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RetryBudget:
+    """
+    Budget global de retries : chaque requête dépose `ratio` jeton, chaque retry
+    en consomme un. Un plancher `min_per_second` garantit quelques retries à faible trafic.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 0.5, capacity: float = 20.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.min_per_second)
+        self.updated_at = now
+
+    def record_request(self):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+def estimate_tokens(request: Dict[str, Any]) -> int:
+    """Estimation grossière (≈ 4 caractères par token) prompt + complétion maximale"""
+    prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+    return prompt_chars // 4 + int(request.get("max_tokens") or 1024)
+
+
+def is_retryable(error: Exception) -> bool:
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+class ProviderGateway:
+    def __init__(
+        self,
+        client=None,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 150_000,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        agent_concurrency: int = 4,
+        agent_limits: Optional[Dict[str, int]] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        client_factory: Optional[Callable[[], Any]] = None,
+    ):
+        self._client = client
+        self.client_factory = client_factory
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.agent_concurrency = agent_concurrency
+        self.agent_limits = agent_limits or {}
+        self.retry_budget = retry_budget or RetryBudget()
+        self._agent_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.metrics = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "retry_budget_exhausted": 0,
+            "throttle_wait_seconds": 0.0,
+        }
+
+    @property
+    def client(self):
+        """Client construit à la première utilisation"""
+        if self._client is None and self.client_factory is not None:
+            self._client = self.client_factory()
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    def _semaphore(self, agent: str) -> asyncio.Semaphore:
+        if agent not in self._agent_semaphores:
+            limit = self.agent_limits.get(agent, self.agent_concurrency)
+            self._agent_semaphores[agent] = asyncio.Semaphore(limit)
+        return self._agent_semaphores[agent]
+
+    async def _admit(self, estimated_tokens: int):
+        waited = await self.request_bucket.acquire(1)
+        waited += await self.token_bucket.acquire(estimated_tokens)
+        self.metrics["throttle_wait_seconds"] += waited
+        self.metrics["requests"] += 1
+        self.retry_budget.record_request()
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Backoff exponentiel « full jitter », Retry-After prioritaire s'il est fourni"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def _should_retry(self, attempt: int, error: Exception) -> bool:
+        if getattr(error, "status_code", None) == 429:
+            self.metrics["rate_limited"] += 1
+        if attempt >= self.max_retries or not is_retryable(error):
+            return False
+        if not self.retry_budget.try_spend():
+            self.metrics["retry_budget_exhausted"] += 1
+            logger.warning("⚠️ Budget de retries épuisé, échec immédiat")
+            return False
+
+        delay = self._backoff(attempt, error)
+        self.metrics["retries"] += 1
+        logger.warning(f"🔁 Retry {attempt + 1}/{self.max_retries} dans {delay:.2f}s: {error}")
+        await asyncio.sleep(delay)
+        return True
+
+    async def chat_completion(self, agent: str = "default", **request) -> Any:
+        """Complétion non streamée, avec limitation et retries"""
+        estimated = estimate_tokens(request)
+        async with self._semaphore(agent):
+            attempt = 0
+            while True:
+                await self._admit(estimated)
+                try:
+                    response = await self.client.chat.completions.create(**request)
+                except Exception as e:
+                    self.token_bucket.refund(estimated)
+                    if await self._should_retry(attempt, e):
+                        attempt += 1
+                        continue
+                    raise
+
+                usage = getattr(response, "usage", None)
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    self.token_bucket.refund(max(estimated - usage.total_tokens, 0))
+                return response
+
+    async def stream_chat_completion(self, agent: str = "default", **request) -> AsyncIterator[Any]:
+        """
+        Complétion streamée. Les retries ne s'appliquent qu'avant le premier chunk :
+        une fois le flux commencé, une erreur est remontée telle quelle.
+
+        La réservation TPM est ajustée en fin de flux sur l'usage réel (dernier
+        chunk, stream_options.include_usage) ou, à défaut, sur la longueur
+        générée. Un consommateur qui s'arrête avant la fin ferme le flux HTTP.
+        """
+        request["stream"] = True
+        request["stream_options"] = {**(request.get("stream_options") or {}), "include_usage": True}
+        estimated = estimate_tokens(request)
+        async with self._semaphore(agent):
+            attempt = 0
+            while True:
+                await self._admit(estimated)
+                try:
+                    stream = await self.client.chat.completions.create(**request)
+                    break
+                except Exception as e:
+                    self.token_bucket.refund(estimated)
+                    if await self._should_retry(attempt, e):
+                        attempt += 1
+                        continue
+                    raise
+
+            used_tokens = None
+            completion_chars = 0
+            try:
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None)
+                    if usage is not None and getattr(usage, "total_tokens", None):
+                        used_tokens = usage.total_tokens
+                    for choice in getattr(chunk, "choices", None) or ():
+                        completion_chars += len(getattr(choice.delta, "content", None) or "")
+                    yield chunk
+            finally:
+                if used_tokens is None:
+                    used_tokens = estimated - int(request.get("max_tokens") or 1024) + completion_chars // 4
+                self.token_bucket.refund(max(estimated - used_tokens, 0))
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    await close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "request_tokens_available": round(self.request_bucket.tokens, 1),
+            "tpm_tokens_available": round(self.token_bucket.tokens, 1),
+            "retry_budget": round(self.retry_budget.tokens, 2),
+        }
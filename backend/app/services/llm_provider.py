@@ -0,0 +1,830 @@
+"""
+Abstraction unique des fournisseurs LLM
+
+Une seule interface (generate, stream, embed, list_models) et trois
+implémentations : Ollama, serveur compatible OpenAI et stub local.
+Les tours précédents d'une conversation passent en messages structurés
+(`history`) : API chat d'Ollama ou d'OpenAI, texte aplati en repli.
+Le pooling de connexions vit dans le fournisseur ; cache, métriques et
+limites de concurrence sont des middlewares empilés autour de lui, si bien
+qu'une optimisation faite ici profite à tous les chemins d'appel.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from ..core import deadlines
+from ..utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class LLMProviderError(Exception):
+    """Erreur générique d'un fournisseur LLM"""
+
+
+class LLMUnavailableError(LLMProviderError):
+    """Fournisseur injoignable"""
+
+
+class LLMTimeoutError(LLMProviderError):
+    """Génération trop longue"""
+
+
+class LLMRequestRejected(LLMProviderError):
+    """Requête abandonnée côté serveur (surcharge, échéance) : renvoyée au client, pas de repli"""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMOverloadedError(LLMRequestRejected):
+    """Rejet à l'admission : la requête ne pourrait pas démarrer avant son échéance"""
+
+
+class DeadlineExceeded(LLMRequestRejected):
+    """Échéance de la requête atteinte (en file ou pendant la génération)"""
+
+    status_code = 504
+
+
+class ChatEndpointMissing(LLMProviderError):
+    """Le serveur ne propose pas d'API chat (repli sur l'API texte)"""
+
+
+class FallbackResponse(str):
+    """
+    Texte de repli (mode simulation, modèle indisponible) renvoyé à la place
+    d'une génération. Se lit comme une réponse pour l'affichage, mais le
+    moteur de workflows le traite comme un échec : ni mémoïsé ni conservé
+    comme étape terminée.
+    """
+
+    def __new__(cls, text: str, reason: str):
+        response = super().__new__(cls, text)
+        response.reason = reason
+        return response
+
+
+class GenerationResult(str):
+    """
+    Texte généré, accompagné des compteurs du fournisseur quand il les
+    renvoie : tokens produits et troncature par la limite de sortie
+    (None si inconnus).
+    """
+
+    def __new__(cls, text: str, output_tokens: Optional[int] = None, truncated: Optional[bool] = None):
+        result = super().__new__(cls, text)
+        result.output_tokens = output_tokens
+        result.truncated = truncated
+        return result
+
+
+Message = Dict[str, str]
+
+CHAT_ROLES = ("system", "user", "assistant")
+
+
+def normalize_history(history: Optional[List[Dict[str, Any]]]) -> List[Message]:
+    """Tours précédents -> messages {role, content} valides (rôles inconnus traités comme user)"""
+    messages = []
+    for message in history or []:
+        if not isinstance(message, dict) or not message.get("content"):
+            continue
+        role = message.get("role", "user")
+        messages.append({"role": role if role in CHAT_ROLES else "user", "content": str(message["content"])})
+    return messages
+
+
+def build_messages(prompt: str, system: Optional[str] = None,
+                   history: Optional[List[Dict[str, Any]]] = None) -> List[Message]:
+    """Liste de messages chat : système, tours précédents, puis la demande courante"""
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.extend(normalize_history(history))
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def flatten_history(prompt: str, history: Optional[List[Dict[str, Any]]] = None) -> str:
+    """Repli texte (/api/generate) : historique en "ROLE: contenu" puis la demande"""
+    lines = [f"{message['role'].upper()}: {message['content']}" for message in normalize_history(history)]
+    return "\n".join(lines) + f"\n\n{prompt}" if lines else prompt
+
+
+class LLMProvider:
+    """Interface commune à tous les fournisseurs"""
+
+    name = "base"
+
+    async def generate(
+        self, model: str, prompt: str, *, system: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None, agent: Optional[str] = None,
+        history: Optional[List[Message]] = None
+    ) -> str:
+        raise NotImplementedError
+
+    async def stream(
+        self, model: str, prompt: str, *, system: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None, agent: Optional[str] = None,
+        history: Optional[List[Message]] = None
+    ) -> AsyncIterator[str]:
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def embed(self, model: str, text: str) -> List[float]:
+        raise NotImplementedError
+
+    async def list_models(self) -> List[str]:
+        raise NotImplementedError
+
+    async def is_available(self) -> bool:
+        try:
+            await self.list_models()
+            return True
+        except LLMProviderError:
+            return False
+
+    async def aclose(self):
+        pass
+
+
+# ==================== FOURNISSEURS ====================
+
+# Alias acceptés dans les options -> nom d'option Ollama (Ollama ignore silencieusement max_tokens)
+OLLAMA_OPTION_ALIASES = {
+    "max_tokens": "num_predict",
+}
+
+
+class OllamaProvider(LLMProvider):
+    """
+    Ollama via /api/chat (gabarit de chat du modèle appliqué par le serveur).
+    /api/generate et un prompt aplati restent le repli : use_chat=False, ou
+    automatiquement si le serveur ne connaît pas /api/chat (Ollama < 0.1.14).
+    """
+
+    name = "ollama"
+
+    def __init__(self, base_url: str, timeout: float = 120.0, max_connections: int = 20, use_chat: bool = True):
+        try:
+            import httpx
+        except ImportError:
+            raise LLMUnavailableError("httpx non installé - Ollama désactivé")
+        self._httpx = httpx
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.use_chat = use_chat
+        # Client partagé : connexions keep-alive réutilisées entre les requêtes
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    @staticmethod
+    def _options(options) -> Dict[str, Any]:
+        return {OLLAMA_OPTION_ALIASES.get(key, key): value for key, value in (options or {}).items()}
+
+    def _payload(self, model, prompt, system, options, stream, history=None) -> Dict[str, Any]:
+        payload = {"model": model, "prompt": flatten_history(prompt, history), "stream": stream,
+                   "options": self._options(options)}
+        if system:
+            payload["system"] = system
+        return payload
+
+    def _chat_payload(self, model, prompt, system, options, stream, history=None) -> Dict[str, Any]:
+        return {"model": model, "messages": build_messages(prompt, system, history), "stream": stream,
+                "options": self._options(options)}
+
+    def _deadline_timeout(self):
+        """
+        Délai accordé à l'appel : le temps restant avant l'échéance de la
+        requête s'il est plus court que le délai configuré, None sinon.
+        """
+        budget = deadlines.remaining()
+        if budget is None or budget >= self.timeout:
+            return None
+        if budget <= 0:
+            raise DeadlineExceeded("Échéance dépassée avant l'appel à Ollama")
+        return self._httpx.Timeout(budget, connect=min(5.0, budget))
+
+    @staticmethod
+    def _result(text: str, data: Dict[str, Any]) -> GenerationResult:
+        """eval_count et done_reason de la réponse finale (absents sur les anciens serveurs)"""
+        done_reason = data.get("done_reason")
+        return GenerationResult(text, output_tokens=data.get("eval_count"),
+                                truncated=None if done_reason is None else done_reason == "length")
+
+    def _disable_chat(self):
+        if self.use_chat:
+            self.use_chat = False
+            logger.warning("⚠️ /api/chat indisponible sur ce serveur Ollama - repli sur /api/generate")
+
+    async def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        with tracer.span("ollama.request", path=path):
+            deadline_timeout = None if "timeout" in kwargs else self._deadline_timeout()
+            if deadline_timeout is not None:
+                kwargs["timeout"] = deadline_timeout
+            try:
+                response = await self._client.request(method, path, **kwargs)
+            except self._httpx.TimeoutException as e:
+                if deadline_timeout is not None:
+                    raise DeadlineExceeded(f"Échéance atteinte pendant la génération ({path})") from e
+                raise LLMTimeoutError(f"Timeout Ollama ({path}): {e}") from e
+            except self._httpx.HTTPError as e:
+                raise LLMUnavailableError(f"Ollama injoignable: {e}") from e
+            if response.status_code == 404 and path == "/api/chat" and "model" not in response.text:
+                raise ChatEndpointMissing(path)
+            if response.status_code != 200:
+                raise LLMProviderError(f"Erreur Ollama {response.status_code}: {response.text[:200]}")
+            data = response.json()
+            # Chargement du modèle, prefill et décodage mesurés par Ollama
+            tracer.record_ollama_timings(data)
+            return data
+
+    async def generate(self, model, prompt, *, system=None, options=None, agent=None, history=None) -> str:
+        if self.use_chat:
+            try:
+                data = await self._request(
+                    "POST", "/api/chat", json=self._chat_payload(model, prompt, system, options, False, history)
+                )
+                return self._result((data.get("message") or {}).get("content", ""), data)
+            except ChatEndpointMissing:
+                self._disable_chat()
+        data = await self._request(
+            "POST", "/api/generate", json=self._payload(model, prompt, system, options, False, history)
+        )
+        return self._result(data.get("response", ""), data)
+
+    async def stream(self, model, prompt, *, system=None, options=None, agent=None, history=None) -> AsyncIterator[str]:
+        if self.use_chat:
+            try:
+                async for chunk in self._stream(
+                    "/api/chat", self._chat_payload(model, prompt, system, options, True, history)
+                ):
+                    yield chunk
+                return
+            except ChatEndpointMissing:
+                # Levée avant le premier fragment : rien n'a encore été envoyé à l'appelant
+                self._disable_chat()
+        async for chunk in self._stream("/api/generate", self._payload(model, prompt, system, options, True, history)):
+            yield chunk
+
+    async def _stream(self, path: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        # Pas de span actif à travers les yield : bornes enregistrées en fin de flux
+        start = time.perf_counter()
+        deadline_timeout = self._deadline_timeout()
+        kwargs = {"timeout": deadline_timeout} if deadline_timeout is not None else {}
+        try:
+            # Annulation ou abandon du flux : la sortie du bloc ferme la connexion
+            # et Ollama arrête le décodage
+            async with self._client.stream("POST", path, json=payload, **kwargs) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    if response.status_code == 404 and path == "/api/chat" and b"model" not in body:
+                        raise ChatEndpointMissing(path)
+                    raise LLMProviderError(f"Erreur Ollama {response.status_code}: {body[:200]!r}")
+                # Dernier fragment retenu jusqu'à la ligne suivante : la ligne finale
+                # (done) lui attache les compteurs, même quand elle n'a pas de texte
+                pending = ""
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    # /api/chat : {"message": {"content": ...}} ; /api/generate : {"response": ...}
+                    text = (data.get("message") or {}).get("content") or data.get("response")
+                    if data.get("done"):
+                        tracer.record("ollama.stream", start, time.perf_counter(), path=path)
+                        tracer.record_ollama_timings(data)
+                        yield self._result(pending + (text or ""), data)
+                        return
+                    if text:
+                        if pending:
+                            yield pending
+                        pending = text
+                    if deadlines.expired():
+                        # Délai de lecture par fragment : l'échéance globale est vérifiée ici
+                        raise DeadlineExceeded("Échéance atteinte pendant la génération (stream)")
+                if pending:
+                    yield pending
+        except self._httpx.TimeoutException as e:
+            if deadline_timeout is not None:
+                raise DeadlineExceeded("Échéance atteinte pendant la génération (stream)") from e
+            raise LLMTimeoutError(f"Timeout Ollama (stream): {e}") from e
+        except self._httpx.HTTPError as e:
+            raise LLMUnavailableError(f"Ollama injoignable: {e}") from e
+
+    async def embed(self, model, text) -> List[float]:
+        data = await self._request("POST", "/api/embeddings", json={"model": model, "prompt": text})
+        return data.get("embedding", [])
+
+    async def list_models(self) -> List[str]:
+        data = await self._request("GET", "/api/tags", timeout=10.0)
+        return [model["name"] for model in data.get("models", [])]
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+# Noms d'options Ollama -> paramètres de l'API chat OpenAI
+OPENAI_OPTION_MAP = {
+    "temperature": "temperature",
+    "top_p": "top_p",
+    "num_predict": "max_tokens",
+    "max_tokens": "max_tokens",
+    "stop": "stop",
+}
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Fournisseur OpenAI (ou compatible) adossé à la ProviderGateway"""
+
+    name = "openai"
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    @staticmethod
+    def _request(model, prompt, system, options, history=None) -> Dict[str, Any]:
+        request = {"model": model, "messages": build_messages(prompt, system, history)}
+        for key, value in (options or {}).items():
+            if key in OPENAI_OPTION_MAP:
+                request[OPENAI_OPTION_MAP[key]] = value
+        return request
+
+    @staticmethod
+    def _wrap_error(error: Exception) -> LLMProviderError:
+        import openai
+
+        if isinstance(error, openai.APITimeoutError):
+            return LLMTimeoutError(str(error))
+        if isinstance(error, openai.APIConnectionError):
+            return LLMUnavailableError(str(error))
+        return LLMProviderError(str(error))
+
+    async def generate(self, model, prompt, *, system=None, options=None, agent=None, history=None) -> str:
+        try:
+            response = await self.gateway.chat_completion(
+                agent or "default", **self._request(model, prompt, system, options, history)
+            )
+        except LLMProviderError:
+            raise
+        except Exception as e:
+            raise self._wrap_error(e) from e
+        return response.choices[0].message.content or ""
+
+    async def stream(self, model, prompt, *, system=None, options=None, agent=None, history=None) -> AsyncIterator[str]:
+        try:
+            # aclosing : un arrêt anticipé ferme aussitôt le flux de la passerelle (connexion, TPM)
+            async with aclosing(self.gateway.stream_chat_completion(
+                agent or "default", **self._request(model, prompt, system, options, history)
+            )) as chunks:
+                async for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except LLMProviderError:
+            raise
+        except Exception as e:
+            raise self._wrap_error(e) from e
+
+    async def embed(self, model, text) -> List[float]:
+        try:
+            response = await self.gateway.client.embeddings.create(model=model, input=text)
+        except Exception as e:
+            raise self._wrap_error(e) from e
+        return list(response.data[0].embedding)
+
+    async def list_models(self) -> List[str]:
+        try:
+            page = await self.gateway.client.models.list()
+        except Exception as e:
+            raise self._wrap_error(e) from e
+        return [model.id for model in page.data]
+
+
+class StubProvider(LLMProvider):
+    """Fournisseur local déterministe (tests, mode hors-ligne)"""
+
+    name = "stub"
+
+    def __init__(self, models: Optional[List[str]] = None, latency: float = 0.0, chunk_size: int = 16):
+        self.models = models or ["stub"]
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls: List[Dict[str, Any]] = []
+
+    def _answer(self, model, prompt, agent) -> str:
+        return f"[Stub {agent or model}] Réponse pour: {prompt[-60:]}"
+
+    async def generate(self, model, prompt, *, system=None, options=None, agent=None, history=None) -> str:
+        self.calls.append({"model": model, "prompt": prompt, "system": system, "options": options, "agent": agent,
+                           "history": history})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(model, prompt, agent)
+
+    async def stream(self, model, prompt, *, system=None, options=None, agent=None, history=None) -> AsyncIterator[str]:
+        answer = await self.generate(model, prompt, system=system, options=options, agent=agent, history=history)
+        for i in range(0, len(answer), self.chunk_size):
+            yield answer[i:i + self.chunk_size]
+
+    async def embed(self, model, text) -> List[float]:
+        return [float(len(text)), float(sum(map(ord, text)) % 997)]
+
+    async def list_models(self) -> List[str]:
+        return list(self.models)
+
+
+# ==================== MIDDLEWARES ====================
+
+class ProviderMiddleware(LLMProvider):
+    """Base des middlewares : délègue tout au fournisseur enveloppé"""
+
+    def __init__(self, inner: LLMProvider):
+        self.inner = inner
+
+    @property
+    def name(self):
+        return self.inner.name
+
+    async def generate(self, model, prompt, **kwargs) -> str:
+        return await self.inner.generate(model, prompt, **kwargs)
+
+    async def stream(self, model, prompt, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self.inner.stream(model, prompt, **kwargs):
+            yield chunk
+
+    async def embed(self, model, text) -> List[float]:
+        return await self.inner.embed(model, text)
+
+    async def list_models(self) -> List[str]:
+        return await self.inner.list_models()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class ModelListCacheMiddleware(ProviderMiddleware):
+    """
+    Met en cache la liste des modèles : les sondes de santé faites avant
+    chaque appel ne coûtent plus un aller-retour HTTP. Les échecs sont
+    mémorisés plus brièvement pour ne pas marteler un serveur arrêté.
+    """
+
+    def __init__(self, inner: LLMProvider, ttl: float = 10.0, negative_ttl: float = 2.0):
+        super().__init__(inner)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._models: Optional[List[str]] = None
+        self._error: Optional[LLMProviderError] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def list_models(self) -> List[str]:
+        async with self._lock:
+            if time.monotonic() >= self._expires_at:
+                try:
+                    self._models, self._error = await self.inner.list_models(), None
+                    self._expires_at = time.monotonic() + self.ttl
+                except LLMProviderError as e:
+                    self._models, self._error = None, e
+                    self._expires_at = time.monotonic() + self.negative_ttl
+            if self._error is not None:
+                raise self._error
+            return list(self._models)
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+
+class ConcurrencyLimitMiddleware(ProviderMiddleware):
+    """
+    Limite globale du nombre de générations simultanées, avec admission
+    selon l'échéance de la requête : l'attente est estimée d'après la
+    profondeur de file et la durée moyenne observée des générations. Une
+    requête qui ne pourrait pas démarrer avant son échéance (ou qui trouve
+    la file pleine) est rejetée tout de suite plutôt que servie trop tard.
+    Sans échéance (tâches de fond), la requête attend son tour.
+    """
+
+    def __init__(self, inner: LLMProvider, max_concurrency: int = 4, max_queue: Optional[int] = None,
+                 alpha: float = 0.2):
+        super().__init__(inner)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.alpha = alpha
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        # Durée moyenne d'une génération (moyenne mobile), None avant la première
+        self.service_time: Optional[float] = None
+        self.shed = 0
+        self.expired_in_queue = 0
+
+    def expected_wait(self) -> float:
+        """Attente estimée d'une nouvelle requête avant d'obtenir une place"""
+        if not self._semaphore.locked() or self.service_time is None:
+            return 0.0
+        return (self.waiting + 1) / self.max_concurrency * self.service_time
+
+    def _admit(self, budget: float):
+        if budget <= 0:
+            self.expired_in_queue += 1
+            raise DeadlineExceeded("Échéance dépassée avant la mise en file")
+        if not self._semaphore.locked():
+            return
+        if self.max_queue is not None and self.waiting >= self.max_queue:
+            self.shed += 1
+            raise LLMOverloadedError(f"File de génération pleine ({self.waiting} en attente)",
+                                     retry_after=self.expected_wait() or None)
+        wait = self.expected_wait()
+        if wait >= budget:
+            self.shed += 1
+            raise LLMOverloadedError(f"Attente estimée {wait:.1f}s au-delà de l'échéance ({budget:.1f}s)",
+                                     retry_after=wait)
+
+    async def _acquire(self):
+        budget = deadlines.remaining()
+        if budget is not None:
+            self._admit(budget)
+        # Une requête annulée pendant l'attente ne doit pas fausser le compteur
+        self.waiting += 1
+        try:
+            if budget is None:
+                await self._semaphore.acquire()
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), budget)
+        except asyncio.TimeoutError:
+            self.expired_in_queue += 1
+            raise DeadlineExceeded("Échéance atteinte en file d'attente")
+        finally:
+            self.waiting -= 1
+
+    def _record_service(self, duration: float):
+        previous = self.service_time
+        self.service_time = duration if previous is None else previous + self.alpha * (duration - previous)
+
+    async def generate(self, model, prompt, **kwargs) -> str:
+        with tracer.span("llm.queue", waiting=self.waiting):
+            await self._acquire()
+        start = time.perf_counter()
+        try:
+            result = await self.inner.generate(model, prompt, **kwargs)
+            self._record_service(time.perf_counter() - start)
+            return result
+        finally:
+            self._semaphore.release()
+
+    async def stream(self, model, prompt, **kwargs) -> AsyncIterator[str]:
+        with tracer.span("llm.queue", waiting=self.waiting):
+            await self._acquire()
+        start = time.perf_counter()
+        try:
+            async for chunk in self.inner.stream(model, prompt, **kwargs):
+                yield chunk
+            self._record_service(time.perf_counter() - start)
+        finally:
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "expected_wait_seconds": round(self.expected_wait(), 2),
+            "avg_generation_seconds": round(self.service_time, 2) if self.service_time is not None else None,
+            "shed": self.shed,
+            "expired_in_queue": self.expired_in_queue,
+        }
+
+
+class MetricsMiddleware(ProviderMiddleware):
+    """Durée et succès de chaque génération, par agent, vers le PerformanceMonitor"""
+
+    def __init__(self, inner: LLMProvider, monitor):
+        super().__init__(inner)
+        self.monitor = monitor
+
+    async def generate(self, model, prompt, **kwargs) -> str:
+        start = time.perf_counter()
+        try:
+            result = await self.inner.generate(model, prompt, **kwargs)
+        except asyncio.CancelledError:
+            # Annulation (client parti) : ni succès ni échec du fournisseur
+            raise
+        except BaseException:
+            self.monitor.record_agent_call(kwargs.get("agent") or model, time.perf_counter() - start, False)
+            raise
+        self.monitor.record_agent_call(kwargs.get("agent") or model, time.perf_counter() - start, True)
+        return result
+
+    async def stream(self, model, prompt, **kwargs) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        try:
+            async for chunk in self.inner.stream(model, prompt, **kwargs):
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except BaseException:
+            self.monitor.record_agent_call(kwargs.get("agent") or model, time.perf_counter() - start, False)
+            raise
+        self.monitor.record_agent_call(kwargs.get("agent") or model, time.perf_counter() - start, True)
+
+
+def estimate_output_tokens(text: str) -> int:
+    """Estimation grossière (≈ 4 caractères par token), comme la passerelle OpenAI"""
+    return max(len(text) // 4, 1) if text else 0
+
+
+def output_usage(text: str, result: Optional[str] = None) -> Tuple[int, Optional[bool]]:
+    """
+    Tokens produits et troncature, tels que rapportés par le fournisseur
+    (GenerationResult). Repli sur l'estimation par caractères sinon.
+    """
+    tokens = getattr(result, "output_tokens", None)
+    return (tokens if tokens is not None else estimate_output_tokens(text)), getattr(result, "truncated", None)
+
+
+class OutputLengthTracker:
+    """
+    Distribution des longueurs de sortie par agent, pour ajuster num_predict.
+
+    Limite proposée = quantile `quantile` des dernières sorties x `headroom`,
+    bornée par [floor, plafond du profil]. Une sortie tronquée est enregistrée
+    au moins à la valeur de la limite : la marge fait alors remonter la limite
+    suivante. Sans indication du fournisseur, une sortie à 98 % de la limite
+    est considérée comme tronquée.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20, quantile: float = 0.95,
+                 headroom: float = 1.25, floor: int = 128):
+        self.window = window
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.headroom = headroom
+        self.floor = floor
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._truncated: Dict[str, int] = defaultdict(int)
+
+    def record(self, agent: str, tokens: int, limit: Optional[int] = None, truncated: Optional[bool] = None):
+        if truncated is None:
+            truncated = bool(limit) and tokens >= limit * 0.98
+        if truncated:
+            self._truncated[agent] += 1
+            tokens = max(tokens, limit or 0)
+        self._samples[agent].append(tokens)
+
+    def suggest(self, agent: str, cap: int) -> int:
+        samples = self._samples.get(agent)
+        if not samples or len(samples) < self.min_samples:
+            return cap
+        ordered = sorted(samples)
+        observed = ordered[min(int(len(ordered) * self.quantile), len(ordered) - 1)]
+        return max(self.floor, min(cap, int(observed * self.headroom)))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            agent: {
+                "samples": len(samples),
+                "max_tokens_seen": max(samples),
+                "truncated": self._truncated[agent],
+            }
+            for agent, samples in self._samples.items() if samples
+        }
+
+
+class AdaptiveNumPredictMiddleware(ProviderMiddleware):
+    """
+    Ajuste num_predict de chaque agent à la longueur réelle de ses réponses :
+    le num_predict du profil reste le plafond, les générations qui s'emballent
+    sont coupées au plus tôt.
+    """
+
+    def __init__(self, inner: LLMProvider, tracker: Optional[OutputLengthTracker] = None):
+        super().__init__(inner)
+        self.tracker = tracker or OutputLengthTracker()
+
+    def _adapt(self, kwargs) -> Optional[int]:
+        options = kwargs.get("options") or {}
+        agent = kwargs.get("agent")
+        cap = options.get("num_predict")
+        if not agent or not cap or cap < 0:
+            return None
+        limit = self.tracker.suggest(agent, cap)
+        kwargs["options"] = {**options, "num_predict": limit}
+        return limit
+
+    async def generate(self, model, prompt, **kwargs) -> str:
+        limit = self._adapt(kwargs)
+        result = await self.inner.generate(model, prompt, **kwargs)
+        if limit is not None:
+            tokens, truncated = output_usage(result, result)
+            self.tracker.record(kwargs["agent"], tokens, limit, truncated)
+        return result
+
+    async def stream(self, model, prompt, **kwargs) -> AsyncIterator[str]:
+        limit = self._adapt(kwargs)
+        chunks = []
+        async for chunk in self.inner.stream(model, prompt, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        if limit is not None:
+            # Les compteurs arrivent avec le dernier fragment
+            tokens, truncated = output_usage("".join(chunks), chunks[-1] if chunks else None)
+            self.tracker.record(kwargs["agent"], tokens, limit, truncated)
+
+
+class PrefixReuseMiddleware(ProviderMiddleware):
+    """Mesure le préfixe commun entre prompts consécutifs d'un même modèle (cache KV)"""
+
+    def __init__(self, inner: LLMProvider, tracker):
+        super().__init__(inner)
+        self.tracker = tracker
+
+    def _record(self, model, prompt, kwargs):
+        # Même rendu que le repli texte : proche de ce que le gabarit de chat produit
+        system = kwargs.get("system")
+        prompt = flatten_history(prompt, kwargs.get("history"))
+        self.tracker.record(model, f"{system}\n{prompt}" if system else prompt)
+
+    async def generate(self, model, prompt, **kwargs) -> str:
+        self._record(model, prompt, kwargs)
+        return await self.inner.generate(model, prompt, **kwargs)
+
+    async def stream(self, model, prompt, **kwargs) -> AsyncIterator[str]:
+        self._record(model, prompt, kwargs)
+        async for chunk in self.inner.stream(model, prompt, **kwargs):
+            yield chunk
+
+
+def build_provider_stack(
+    provider: LLMProvider,
+    monitor=None,
+    max_concurrency: Optional[int] = None,
+    max_queue: Optional[int] = None,
+    models_ttl: Optional[float] = 10.0,
+    adaptive_num_predict: bool = False,
+    prefix_tracker=None,
+) -> LLMProvider:
+    """Empile les middlewares standards autour d'un fournisseur"""
+    stack = provider
+    if models_ttl:
+        stack = ModelListCacheMiddleware(stack, ttl=models_ttl)
+    if prefix_tracker is not None:
+        # Sous le limiteur : mesuré dans l'ordre réel d'arrivée chez le fournisseur
+        stack = PrefixReuseMiddleware(stack, prefix_tracker)
+    if max_concurrency:
+        stack = ConcurrencyLimitMiddleware(stack, max_concurrency=max_concurrency, max_queue=max_queue)
+    if adaptive_num_predict:
+        stack = AdaptiveNumPredictMiddleware(stack)
+    if monitor is not None:
+        stack = MetricsMiddleware(stack, monitor)
+    return stack
+
+
+def find_middleware(provider: LLMProvider, kind: type) -> Optional[LLMProvider]:
+    """Premier middleware de type `kind` dans la pile (None s'il n'y en a pas)"""
+    while provider is not None:
+        if isinstance(provider, kind):
+            return provider
+        provider = getattr(provider, "inner", None)
+    return None
+
+
+_default_provider: Optional[LLMProvider] = None
+
+
+def get_default_provider() -> LLMProvider:
+    """
+    Fournisseur Ollama partagé par tous les services (stub si httpx est absent).
+    Construit au premier appel et non à l'import, pour un démarrage rapide.
+    """
+    global _default_provider
+    if _default_provider is None:
+        from ..utils.config import OLLAMA_CONFIG
+        from ..utils.monitoring import performance_monitor, prefix_reuse_tracker
+
+        try:
+            provider = OllamaProvider(
+                OLLAMA_CONFIG["base_url"], timeout=OLLAMA_CONFIG["timeout"], use_chat=OLLAMA_CONFIG["chat_api"]
+            )
+        except LLMUnavailableError as e:
+            logger.warning(f"{e} - fournisseur stub utilisé")
+            provider = StubProvider()
+        _default_provider = build_provider_stack(
+            provider,
+            monitor=performance_monitor,
+            max_concurrency=OLLAMA_CONFIG["max_concurrency"],
+            max_queue=OLLAMA_CONFIG["max_queue"],
+            models_ttl=OLLAMA_CONFIG["models_cache_ttl"],
+            adaptive_num_predict=OLLAMA_CONFIG["adaptive_num_predict"],
+            prefix_tracker=prefix_reuse_tracker,
+        )
+    return _default_provider
@@ -1,17 +1,15 @@
 # backend/app/services/ollama_service.py - VERSION AVANCÉE
-import httpx
-import json
 import logging
-import asyncio
 from typing import Dict, Any, Optional, List
-from ..utils.config import AGENT_ROLES, OLLAMA_CONFIG
+from ..utils.config import AGENT_ROLES, OLLAMA_CONFIG, get_generation_profile
+from .llm_provider import LLMProvider, LLMProviderError, get_default_provider
 
 logger = logging.getLogger(__name__)
 
 class AdvancedOllamaService:
-    def __init__(self):
+    def __init__(self, provider: Optional[LLMProvider] = None):
+        self._provider = provider
         self.base_url = OLLAMA_CONFIG["base_url"]
-        self.timeout = OLLAMA_CONFIG["timeout"]
         self.temperature = OLLAMA_CONFIG["temperature"]
         
         # Mapping des agents vers leurs modèles spécialisés
@@ -108,25 +106,22 @@ Fournis des analyses constructives avec suggestions d'amélioration concrètes."
 Propose des optimisations mesurables avec impact business."""
         }
 
+    @property
+    def provider(self) -> LLMProvider:
+        """Fournisseur résolu au premier appel (client HTTP créé à la demande)"""
+        if self._provider is None:
+            self._provider = get_default_provider()
+        return self._provider
+
     async def is_available(self) -> bool:
-        """Vérifie si Ollama est accessible"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/api/tags", timeout=5.0)
-                return response.status_code == 200
-        except Exception as e:
-            logger.warning(f"Ollama non disponible: {e}")
-            return False
+        """Vérifie si Ollama est accessible (liste des modèles mise en cache)"""
+        return await self.provider.is_available()
 
     async def get_installed_models(self) -> List[str]:
         """Récupère la liste des modèles installés"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/api/tags", timeout=10.0)
-                if response.status_code == 200:
-                    models_data = response.json()
-                    return [model['name'] for model in models_data.get('models', [])]
-        except Exception as e:
+            return await self.provider.list_models()
+        except LLMProviderError as e:
             logger.error(f"Erreur récupération modèles: {e}")
         return []
 
@@ -151,72 +146,32 @@ Propose des optimisations mesurables avec impact business."""
             logger.warning(f"Modèle {model_name} non disponible pour {agent_role}")
             return await self._model_missing_response(agent_role, model_name, message)
         
-        # Construire le prompt avec le contexte de l'agent
+        # Rôle et contexte dans le message système, demande en message utilisateur
         system_prompt = self.agent_prompts.get(agent_role, "Tu es un assistant IA spécialisé.")
-        full_prompt = f"{system_prompt}\n\nDemande utilisateur: {message}"
-        
-        # Ajouter le contexte si disponible
-        if context.get("last_output"):
-            full_prompt += f"\n\nContexte précédent: {context['last_output'][:500]}..."
-        
         if context.get("project_type"):
-            full_prompt += f"\n\nType de projet: {context['project_type']}"
+            system_prompt += f"\n\nType de projet: {context['project_type']}"
+        # Sortie de l'étape précédente : produite par un autre agent, c'est du contexte,
+        # pas un tour assistant (le modèle ne doit pas la prendre pour la sienne)
+        if context.get("last_output"):
+            system_prompt += f"\n\nRésultat de l'agent précédent:\n{context['last_output'][:500]}"
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # Paramètres optimisés par type d'agent
-                temperature = self._get_agent_temperature(agent_role)
-                max_tokens = self._get_agent_max_tokens(agent_role)
-                
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": model_name,
-                        "prompt": full_prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": temperature,
-                            "top_p": 0.9,
-                            "max_tokens": max_tokens,
-                            "stop": ["<|im_end|>", "<|endoftext|>"]
-                        }
-                    }
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    generated_text = result.get("response", "Erreur: réponse vide")
-                    
-                    # Post-traitement selon l'agent
-                    return self._post_process_response(agent_role, generated_text)
-                else:
-                    logger.error(f"Erreur Ollama {model_name}: {response.status_code}")
-                    return await self._fallback_response(agent_role, message)
+            # Profil de génération de l'agent (temperature, num_predict, num_ctx)
+            generated_text = await self.provider.generate(
+                model_name,
+                message,
+                system=system_prompt,
+                options=get_generation_profile(agent_role),
+                agent=agent_role
+            )
+            
+            # Post-traitement selon l'agent
+            return self._post_process_response(agent_role, generated_text or "Erreur: réponse vide")
                     
-        except Exception as e:
+        except LLMProviderError as e:
             logger.error(f"Erreur lors de l'appel Ollama ({model_name}): {e}")
             return await self._fallback_response(agent_role, message)
 
-    def _get_agent_temperature(self, agent_role: str) -> float:
-        """Température optimisée par type d'agent"""
-        creative_agents = ["visionnaire", "designer_ui_ux"]
-        technical_agents = ["architecte", "backend_engineer", "database_specialist"]
-        
-        if agent_role in creative_agents:
-            return 0.8  # Plus créatif
-        elif agent_role in technical_agents:
-            return 0.3  # Plus précis
-        else:
-            return 0.7  # Équilibré
-
-    def _get_agent_max_tokens(self, agent_role: str) -> int:
-        """Nombre de tokens optimisé par agent"""
-        verbose_agents = ["architecte", "critique", "optimiseur"]
-        if agent_role in verbose_agents:
-            return 2000  # Réponses détaillées
-        else:
-            return 1200  # Réponses concises
-
     def _post_process_response(self, agent_role: str, response: str) -> str:
         """Post-traitement spécialisé par agent"""
         # Ajouter l'emoji et le nom de l'agent
@@ -1,20 +1,90 @@
 import logging
-import httpx
-import subprocess
 import time
 import json
 import asyncio
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
-from ..utils.config import AGENT_ROLES, get_required_models, get_priority_models
+# httpx et subprocess sont importés dans les méthodes : importer ce module reste instantané
+from ..utils.config import AGENT_ROLES, PROVISIONING_CONFIG, get_required_models, get_priority_models
 
 logger = logging.getLogger("setup_ollama")
 
+
+class PullProgress:
+    """
+    Progression agrégée de téléchargements parallèles : octets par couche
+    (digest) de chaque modèle, une ligne de log globale toutes les
+    `interval` secondes au lieu d'une ligne par message d'Ollama.
+    """
+
+    def __init__(self, models: List[str], interval: float = 2.0):
+        self.layers: Dict[str, Dict[str, Tuple[int, int]]] = {model: {} for model in models}
+        self.status: Dict[str, str] = {model: "pending" for model in models}
+        self.interval = interval
+        self.started = time.time()
+        self._last_report = 0.0
+
+    def update(self, model: str, data: Dict[str, Any]):
+        digest = data.get("digest")
+        if digest and data.get("total"):
+            self.layers[model][digest] = (data.get("completed", 0), data["total"])
+
+    def model_bytes(self, model: str) -> Tuple[int, int]:
+        layers = self.layers[model].values()
+        return sum(done for done, _ in layers), sum(total for _, total in layers)
+
+    def snapshot(self) -> Dict[str, Any]:
+        models = {}
+        for model in self.layers:
+            done, total = self.model_bytes(model)
+            models[model] = {
+                "status": self.status[model],
+                "completed": done,
+                "total": total,
+                "percent": round(done / total * 100, 1) if total else (100.0 if self.status[model] == "installed" else 0.0),
+            }
+        done = sum(info["completed"] for info in models.values())
+        total = sum(info["total"] for info in models.values())
+        return {
+            "completed": done,
+            "total": total,
+            "percent": round(done / total * 100, 1) if total else 0.0,
+            "elapsed_seconds": round(time.time() - self.started, 1),
+            "models": models,
+        }
+
+    def report(self, force: bool = False) -> bool:
+        """Ligne de progression globale (au plus une par intervalle)"""
+        now = time.time()
+        if not force and now - self._last_report < self.interval:
+            return False
+        self._last_report = now
+        snapshot = self.snapshot()
+        active = ", ".join(
+            f"{model} {info['percent']:.0f}%"
+            for model, info in snapshot["models"].items() if info["status"] == "pulling"
+        )
+        logger.info(
+            f"⏳ Téléchargements: {snapshot['completed'] / 1e9:.2f}/{snapshot['total'] / 1e9:.2f} GB "
+            f"({snapshot['percent']:.1f}%)" + (f" - {active}" if active else "")
+        )
+        return True
+
+
 class IntegratedOllamaSetup:
-    def __init__(self):
+    def __init__(self, pull_concurrency: Optional[int] = None, test_concurrency: Optional[int] = None,
+                 state=None):
         self.ollama_host = "http://localhost:11434"
         self.required_models = get_required_models()
         self.priority_models = get_priority_models()
+        # Téléchargements et tests simultanés (bande passante / mémoire du serveur Ollama)
+        self.pull_concurrency = max(1, pull_concurrency or PROVISIONING_CONFIG["pull_concurrency"])
+        self.test_concurrency = max(1, test_concurrency or PROVISIONING_CONFIG["test_concurrency"])
+        self.pull_retries = PROVISIONING_CONFIG["pull_retries"]
+        self.retry_delay = 2.0
+        # Transport httpx injectable (tests)
+        self.transport = None
+        self._state = state
         
         # Tailles des modèles (estimation en GB)
         self.model_sizes = {
@@ -25,8 +95,39 @@ class IntegratedOllamaSetup:
             "llama3.2:3b": 2.0
         }
 
+    @property
+    def state(self):
+        """
+        État des téléchargements, conservé entre deux exécutions : un
+        provisionnement interrompu reprend par les modèles entamés (Ollama
+        garde les couches déjà reçues et ne télécharge que le reste).
+        """
+        if self._state is None:
+            from ..core.state_backend import get_checkpoint_backend
+
+            self._state = get_checkpoint_backend().namespace("model_provisioning")
+        return self._state
+
+    def _client(self, timeout: float):
+        import httpx
+
+        return httpx.AsyncClient(timeout=timeout, transport=self.transport)
+
+    def _save_state(self, model: str, progress: Optional["PullProgress"] = None, **fields):
+        entry = dict(self.state.get(model) or {})
+        if progress is not None:
+            entry["completed"], entry["total"] = progress.model_bytes(model)
+        entry.update(fields, updated_at=time.time())
+        self.state[model] = entry
+
+    def interrupted_pulls(self) -> List[str]:
+        """Modèles dont le dernier téléchargement n'a pas abouti"""
+        return [model for model, entry in self.state.items() if entry.get("status") in ("pulling", "failed")]
+
     async def check_ollama_installed(self) -> bool:
         """Vérifie si Ollama est installé"""
+        import subprocess
+
         try:
             result = subprocess.run(['ollama', '--version'], 
                                   capture_output=True, 
@@ -46,8 +147,8 @@ class IntegratedOllamaSetup:
     async def check_ollama_running(self) -> bool:
         """Vérifie si le service Ollama fonctionne"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.ollama_host, timeout=5)
+            async with self._client(timeout=5) as client:
+                response = await client.get(self.ollama_host)
                 if response.status_code == 200:
                     logger.info("✅ Service Ollama actif")
                     return True
@@ -60,6 +161,8 @@ class IntegratedOllamaSetup:
 
     async def start_ollama_service(self) -> bool:
         """Démarre le service Ollama"""
+        import subprocess
+
         logger.info("🚀 Démarrage du service Ollama...")
         try:
             # Démarrer ollama serve en arrière-plan
@@ -85,8 +188,8 @@ class IntegratedOllamaSetup:
     async def get_installed_models(self) -> List[str]:
         """Récupère les modèles installés"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.ollama_host}/api/tags", timeout=10)
+            async with self._client(timeout=10) as client:
+                response = await client.get(f"{self.ollama_host}/api/tags")
                 if response.status_code == 200:
                     models_data = response.json()
                     models = [model['name'] for model in models_data.get('models', [])]
@@ -99,47 +202,105 @@ class IntegratedOllamaSetup:
             logger.error(f"❌ Erreur API modèles: {e}")
             return []
 
-    async def pull_model_with_progress(self, model_name: str) -> bool:
-        """Télécharge un modèle avec suivi de progression"""
-        logger.info(f"📥 Téléchargement de {model_name}...")
-        
-        try:
-            async with httpx.AsyncClient(timeout=600) as client:  # 10 minutes timeout
-                async with client.stream(
-                    "POST",
-                    f"{self.ollama_host}/api/pull",
-                    json={"name": model_name}
-                ) as response:
-                    
-                    if response.status_code != 200:
-                        logger.error(f"❌ Erreur téléchargement {model_name}: {response.status_code}")
-                        return False
-                    
-                    async for line in response.aiter_lines():
-                        if line.strip():
-                            try:
-                                data = json.loads(line)
-                                status = data.get("status", "")
-                                
-                                if "downloading" in status.lower():
-                                    completed = data.get("completed", 0)
-                                    total = data.get("total", 1)
-                                    percent = (completed / total) * 100 if total > 0 else 0
-                                    logger.info(f"⏳ {model_name}: {percent:.1f}% ({completed}/{total} bytes)")
-                                
-                                elif "success" in status.lower():
-                                    logger.info(f"✅ {model_name} téléchargé avec succès")
-                                    return True
-                                    
-                            except json.JSONDecodeError:
-                                continue
-                    
-                    logger.info(f"✅ {model_name} installé")
+    async def pull_model_with_progress(self, model_name: str, progress: Optional[PullProgress] = None,
+                                       client=None) -> bool:
+        """
+        Télécharge un modèle avec suivi de progression. Flux coupé ou erreur
+        réseau : nouvelle tentative après un délai croissant, Ollama reprend
+        là où les couches s'étaient arrêtées.
+        """
+        progress = progress or PullProgress([model_name])
+        if client is None:
+            async with self._client(timeout=600) as client:  # 10 minutes sans données
+                return await self.pull_model_with_progress(model_name, progress, client)
+
+        previous = self.state.get(model_name) or {}
+        if previous.get("status") == "pulling" and previous.get("completed"):
+            logger.info(f"🔁 Reprise de {model_name} ({previous['completed'] / 1e9:.2f} GB déjà reçus)")
+        else:
+            logger.info(f"📥 Téléchargement de {model_name}...")
+        progress.status[model_name] = "pulling"
+
+        for attempt in range(1, self.pull_retries + 1):
+            self._save_state(model_name, progress, status="pulling", attempts=previous.get("attempts", 0) + attempt)
+            try:
+                outcome = await self._stream_pull(model_name, progress, client)
+            except Exception as e:
+                outcome = f"{type(e).__name__}: {e}"
+            if outcome is True:
+                progress.status[model_name] = "installed"
+                self._save_state(model_name, progress, status="installed")
+                logger.info(f"✅ {model_name} téléchargé avec succès")
+                return True
+            if outcome is False:
+                break
+            if attempt < self.pull_retries:
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.warning(f"⚠️ {model_name} interrompu ({outcome}), reprise dans {delay:.0f}s "
+                               f"({attempt}/{self.pull_retries})")
+                await asyncio.sleep(delay)
+            else:
+                logger.error(f"❌ Erreur téléchargement {model_name}: {outcome}")
+
+        progress.status[model_name] = "failed"
+        self._save_state(model_name, progress, status="failed")
+        return False
+
+    async def _stream_pull(self, model_name: str, progress: PullProgress, client):
+        """
+        Un appel à /api/pull : True si terminé, False si l'erreur est
+        définitive (modèle inconnu...), sinon la raison de l'interruption.
+        """
+        async with client.stream("POST", f"{self.ollama_host}/api/pull", json={"name": model_name}) as response:
+            if response.status_code != 200:
+                await response.aread()
+                # 4xx : demande invalide, inutile de réessayer
+                if 400 <= response.status_code < 500:
+                    logger.error(f"❌ Erreur téléchargement {model_name}: {response.status_code}")
+                    return False
+                return f"HTTP {response.status_code}"
+
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if data.get("error"):
+                    logger.error(f"❌ Erreur téléchargement {model_name}: {data['error']}")
+                    return False
+                if data.get("status") == "success":
                     return True
-                    
-        except Exception as e:
-            logger.error(f"❌ Erreur téléchargement {model_name}: {e}")
-            return False
+                progress.update(model_name, data)
+                if progress.report():
+                    self._save_state(model_name, progress)
+
+        return "flux terminé avant la fin du téléchargement"
+
+    async def pull_models(self, models: List[str]) -> Tuple[bool, List[str]]:
+        """
+        Télécharge `models` en parallèle (au plus `pull_concurrency` à la
+        fois) : modèles entamés d'abord, puis les plus gros, pour que les
+        longs téléchargements ne finissent pas seuls en queue.
+        """
+        interrupted = set(self.interrupted_pulls())
+        ordered = sorted(models, key=lambda model: (model not in interrupted, -self.model_sizes.get(model, 5.0)))
+        progress = PullProgress(ordered)
+        semaphore = asyncio.Semaphore(self.pull_concurrency)
+
+        async def pull(model: str) -> bool:
+            async with semaphore:
+                return await self.pull_model_with_progress(model, progress, client)
+
+        async with self._client(timeout=600) as client:
+            results = await asyncio.gather(*(pull(model) for model in ordered))
+        progress.report(force=True)
+
+        failed_models = [model for model, ok in zip(ordered, results) if not ok]
+        logger.info(f"📦 {len(ordered) - len(failed_models)}/{len(ordered)} modèles installés "
+                    f"en {time.time() - progress.started:.0f}s")
+        return not failed_models, failed_models
 
     async def install_priority_models(self) -> Tuple[bool, List[str]]:
         """Installe les modèles prioritaires pour le MVP"""
@@ -147,7 +308,7 @@ class IntegratedOllamaSetup:
         
         installed_models = await self.get_installed_models()
         missing_priority = [
-            model for model in self.priority_models 
+            model for model in dict.fromkeys(self.priority_models)
             if model not in installed_models
         ]
         
@@ -161,17 +322,7 @@ class IntegratedOllamaSetup:
         total_size = sum(self.model_sizes.get(model, 5.0) for model in missing_priority)
         logger.info(f"💾 Espace requis: ~{total_size:.1f} GB")
         
-        failed_models = []
-        for model in missing_priority:
-            logger.info(f"🔄 Installation de {model}...")
-            if await self.pull_model_with_progress(model):
-                logger.info(f"✅ {model} installé avec succès")
-            else:
-                logger.error(f"❌ Échec installation {model}")
-                failed_models.append(model)
-        
-        success = len(failed_models) == 0
-        return success, failed_models
+        return await self.pull_models(missing_priority)
 
     async def install_all_models(self) -> Tuple[bool, List[str]]:
         """Installe tous les modèles requis"""
@@ -191,60 +342,67 @@ class IntegratedOllamaSetup:
         total_size = sum(self.model_sizes.get(model, 5.0) for model in missing_models)
         logger.info(f"💾 Espace total requis: ~{total_size:.1f} GB")
         
-        failed_models = []
-        for model in missing_models:
-            if await self.pull_model_with_progress(model):
-                logger.info(f"✅ {model} installé")
-            else:
-                failed_models.append(model)
-        
-        success = len(failed_models) == 0
-        return success, failed_models
+        return await self.pull_models(missing_models)
 
     async def test_agent_models(self) -> Dict[str, bool]:
-        """Teste tous les modèles d'agents"""
+        """
+        Teste les modèles d'agents : une génération par modèle distinct (et
+        non par agent), en parallèle, résultat reporté sur chaque agent.
+        """
         logger.info("🧪 Test des modèles d'agents...")
         
-        test_results = {}
-        test_prompt = "Réponds juste 'OK' pour confirmer que tu fonctionnes."
-        
+        roles_by_model: Dict[str, List[str]] = {}
         for agent_role, agent_info in AGENT_ROLES.items():
-            model_name = agent_info["model"]
-            logger.info(f"🔍 Test {agent_role} ({model_name})...")
-            
-            try:
-                async with httpx.AsyncClient(timeout=30) as client:
-                    response = await client.post(
-                        f"{self.ollama_host}/api/generate",
-                        json={
-                            "model": model_name,
-                            "prompt": test_prompt,
-                            "stream": False
-                        }
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        if result.get("response"):
-                            test_results[agent_role] = True
-                            logger.info(f"✅ {agent_role} fonctionne")
-                        else:
-                            test_results[agent_role] = False
-                            logger.warning(f"⚠️ {agent_role} réponse vide")
-                    else:
-                        test_results[agent_role] = False
-                        logger.error(f"❌ {agent_role} erreur {response.status_code}")
-                        
-            except Exception as e:
-                test_results[agent_role] = False
-                logger.error(f"❌ {agent_role} exception: {e}")
+            roles_by_model.setdefault(agent_info["model"], []).append(agent_role)
+        semaphore = asyncio.Semaphore(self.test_concurrency)
+
+        async def test(client, model_name: str) -> bool:
+            async with semaphore:
+                return await self._test_model(client, model_name, roles_by_model[model_name])
+
+        async with self._client(timeout=30) as client:
+            results = await asyncio.gather(*(test(client, model) for model in roles_by_model))
+
+        working_models = dict(zip(roles_by_model, results))
+        test_results = {
+            agent_role: working_models[agent_info["model"]]
+            for agent_role, agent_info in AGENT_ROLES.items()
+        }
         
         working_agents = sum(test_results.values())
         total_agents = len(test_results)
-        logger.info(f"📊 Agents fonctionnels: {working_agents}/{total_agents}")
+        logger.info(f"📊 Agents fonctionnels: {working_agents}/{total_agents} "
+                    f"({sum(results)}/{len(results)} modèles)")
         
         return test_results
 
+    async def _test_model(self, client, model_name: str, agent_roles: List[str]) -> bool:
+        test_prompt = "Réponds juste 'OK' pour confirmer que tu fonctionnes."
+        agents = ", ".join(agent_roles)
+        logger.info(f"🔍 Test {model_name} ({agents})...")
+        
+        try:
+            response = await client.post(
+                f"{self.ollama_host}/api/generate",
+                json={
+                    "model": model_name,
+                    "prompt": test_prompt,
+                    "stream": False
+                }
+            )
+            
+            if response.status_code == 200:
+                if response.json().get("response"):
+                    logger.info(f"✅ {model_name} fonctionne ({agents})")
+                    return True
+                logger.warning(f"⚠️ {model_name} réponse vide ({agents})")
+            else:
+                logger.error(f"❌ {model_name} erreur {response.status_code} ({agents})")
+                
+        except Exception as e:
+            logger.error(f"❌ {model_name} exception: {e} ({agents})")
+        return False
+
     async def get_detailed_status(self) -> Dict:
         """Statut détaillé de la configuration"""
         status = {
@@ -255,6 +413,7 @@ class IntegratedOllamaSetup:
             "priority_models": self.priority_models,
             "missing_models": [],
             "missing_priority": [],
+            "interrupted_pulls": [],
             "agents_status": {},
             "disk_usage_gb": 0,
             "setup_complete": False
@@ -276,6 +435,11 @@ class IntegratedOllamaSetup:
                     model for model in self.priority_models 
                     if model not in status["installed_models"]
                 ]
+
+                status["interrupted_pulls"] = [
+                    model for model in self.interrupted_pulls()
+                    if model not in status["installed_models"]
+                ]
                 
                 # Statut des agents
                 for agent_role, agent_info in AGENT_ROLES.items():
@@ -357,6 +521,9 @@ class IntegratedOllamaSetup:
             print(f"❌ Modèles prioritaires manquants: {', '.join(status['missing_priority'])}")
         else:
             print("✅ Tous les modèles prioritaires installés")
+
+        if status.get('interrupted_pulls'):
+            print(f"🔁 Téléchargements interrompus (repris au prochain install): {', '.join(status['interrupted_pulls'])}")
         
         # Agents
         print(f"\n🤖 AGENTS ({len(status['agents_status'])} total):")
@@ -10,26 +10,43 @@ import os
 import time
 import uuid
 import logging
+import sys
+from contextlib import aclosing
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Body
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from openai import AsyncOpenAI
+
+# Lancement direct (`python app/ultra_simple_main.py`) : rendre le package `app` importable
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.task_supervisor import TaskSupervisor, COMPLETED
+from app.core.state_backend import get_state_backend
+from app.core.cancellation import cancellation_metrics
+from app.core.websocket_manager import WorkflowEventHub
+from app.services.llm_gateway import ProviderGateway
+from app.services.llm_provider import OpenAICompatibleProvider
+from app.services.file_service import (
+    ARCHIVE_FORMATS, CHUNK_SIZE, WorkspaceWriter, iter_archive, iter_file_range, parse_range_header
+)
+from app.utils.logger import setup_logging
+from app.utils.config import COMPRESSION_CONFIG
+from app.utils.responses import CompressionMiddleware, FastJSONResponse
 
 # Configuration
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger("ultra-simple")
 
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is required")
 WORKSPACE_DIR = "./ultra_workspace"
 os.makedirs(WORKSPACE_DIR, exist_ok=True)
 
-app = FastAPI(title="🚀 Ultra Simple Revolutionary", version="5.0.0")
+app = FastAPI(title="🚀 Ultra Simple Revolutionary", version="5.0.0", default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +56,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if COMPRESSION_CONFIG["enabled"]:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_CONFIG["minimum_size"],
+        gzip_level=COMPRESSION_CONFIG["gzip_level"],
+        brotli_quality=COMPRESSION_CONFIG["brotli_quality"],
+    )
+
 # ==================== SYSTÈME ULTRA-SIMPLE ====================
 
 class UltraAgent:
@@ -47,11 +72,50 @@ class UltraAgent:
         self.name = name
         self.prompt = prompt
 
+def create_openai_client():
+    """Client OpenAI unique, créé au premier appel (import du SDK différé)"""
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY environment variable is required")
+    from openai import AsyncOpenAI
+    
+    # Retries gérés par la passerelle ; OPENAI_BASE_URL pour un serveur compatible local
+    return AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        base_url=os.environ.get("OPENAI_BASE_URL") or None,
+        max_retries=0
+    )
+
 class UltraSimpleEngine:
     def __init__(self):
-        self.openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        self.gateway = ProviderGateway(
+            client_factory=create_openai_client,
+            requests_per_minute=float(os.environ.get("ULTRA_OPENAI_RPM", "500")),
+            tokens_per_minute=float(os.environ.get("ULTRA_OPENAI_TPM", "150000")),
+            max_retries=int(os.environ.get("ULTRA_OPENAI_MAX_RETRIES", "4")),
+            agent_concurrency=int(os.environ.get("ULTRA_AGENT_CONCURRENCY", "4"))
+        )
+        self.provider = OpenAICompatibleProvider(self.gateway)
+        # Workflows exécutés par ce worker ; leur état est recopié dans le backend partagé
+        # pour que les autres workers (uvicorn --workers N) puissent le consulter
         self.active_workflows = {}
-        self.websocket_connections = {}
+        self.workflow_store = get_state_backend().namespace("ultra_workflows")
+        # Exécutions en tâches de fond : nombre de streams GPT simultanés plafonné
+        self.supervisor = TaskSupervisor(
+            max_workers=int(os.environ.get("ULTRA_MAX_CONCURRENT_WORKFLOWS", "4")),
+            default_timeout=float(os.environ.get("ULTRA_WORKFLOW_TIMEOUT", "600")),
+            name="ultra-workflows"
+        )
+        # Écritures disque hors boucle d'événements, atomiques et sous quota
+        self.workspace_writer = WorkspaceWriter(
+            WORKSPACE_DIR,
+            max_files_per_workflow=int(os.environ.get("ULTRA_MAX_FILES_PER_WORKFLOW", "200")),
+            max_bytes_per_workflow=int(os.environ.get("ULTRA_MAX_BYTES_PER_WORKFLOW", str(20 * 1024 * 1024)))
+        )
+        # Un canal d'événements par workflow : plusieurs abonnés, rejeu borné.
+        # Le texte généré est cumulé à part (instantané) : le buffer n'a pas à contenir tout le flux
+        self.event_hub = WorkflowEventHub(
+            replay_size=int(os.environ.get("ULTRA_REPLAY_BUFFER", "500"))
+        )
         
         # Agents ultra-simples mais puissants
         self.agents = {
@@ -209,6 +273,28 @@ GÉNÈRE DE L'ARCHITECTURE RÉVOLUTIONNAIRE !"""
         
         logger.info(f"🚀 Ultra Simple Engine initialisé avec {len(self.agents)} agents")
 
+    @property
+    def openai_client(self):
+        return self.gateway.client
+
+    def _persist(self, workflow: Dict):
+        # Conserve une éventuelle demande d'annulation déposée par un autre worker
+        self.workflow_store.modify(
+            workflow["workflow_id"],
+            lambda stored: {**workflow, "cancel_requested": bool(stored and stored.get("cancel_requested"))}
+        )
+
+    def get_workflow(self, workflow_id: str) -> Optional[Dict]:
+        """Workflow local, sinon dernier état publié par un autre worker"""
+        workflow = self.active_workflows.get(workflow_id)
+        if workflow is not None:
+            return workflow
+        return self.workflow_store.get(workflow_id)
+
+    def _cancel_requested(self, workflow_id: str) -> bool:
+        stored = self.workflow_store.get(workflow_id) or {}
+        return bool(stored.get("cancel_requested"))
+
     async def create_ultra_workflow(self, prompt: str, agent_id: str = "quantum_developer") -> str:
         """Crée un workflow ultra-simple et révolutionnaire"""
         
@@ -221,16 +307,68 @@ GÉNÈRE DE L'ARCHITECTURE RÉVOLUTIONNAIRE !"""
             "state": "created",
             "created_at": datetime.now().isoformat(),
             "files": [],
+            "rejected_files": [],
             "response": ""
         }
         
         self.active_workflows[workflow_id] = workflow_data
+        self._persist(workflow_data)
         
         logger.info(f"🚀 Workflow ultra-simple créé: {workflow_id}")
         return workflow_id
 
-    async def execute_ultra_workflow(self, workflow_id: str, websocket: WebSocket = None):
-        """Exécute le workflow ultra-simple avec streaming"""
+    def start_ultra_workflow(self, workflow_id: str) -> bool:
+        """Soumet le workflow au pool d'exécution s'il n'a pas déjà démarré"""
+        
+        workflow = self.active_workflows.get(workflow_id)
+        if not workflow or workflow["state"] != "created":
+            return False
+        
+        if not self.supervisor.submit(
+            workflow_id,
+            lambda: self.execute_ultra_workflow(workflow_id),
+            on_finished=self._on_workflow_finished
+        ):
+            return False
+        
+        workflow["state"] = "queued"
+        self._persist(workflow)
+        self.event_hub.publish(workflow_id, {
+            "type": "workflow_queued",
+            "workflow_id": workflow_id,
+            "running": self.supervisor.stats()["running"]
+        })
+        return True
+
+    def cancel_ultra_workflow(self, workflow_id: str) -> bool:
+        """Annule un workflow en file ou en cours d'exécution, y compris sur un autre worker"""
+        if workflow_id in self.active_workflows:
+            return self.supervisor.cancel(workflow_id)
+        # Exécuté ailleurs : le worker propriétaire lit la demande pendant le streaming
+        stored = self.workflow_store.update_item(workflow_id, cancel_requested=True)
+        return stored is not None and stored["state"] in ("created", "queued", "executing")
+
+    def _on_workflow_finished(self, workflow_id: str, status: str, error: Optional[str]):
+        """Timeouts et annulations : état et événement de fin centralisés"""
+        
+        workflow = self.active_workflows.get(workflow_id)
+        if status == COMPLETED or not workflow:
+            return
+        if workflow["state"] in ("completed", "error", "cancelled"):
+            return
+        
+        workflow["state"] = "cancelled" if status == "cancelled" else "error"
+        workflow["error"] = error
+        workflow["completed_at"] = datetime.now().isoformat()
+        self._persist(workflow)
+        self.event_hub.publish(workflow_id, {
+            "type": "workflow_cancelled" if status == "cancelled" else "workflow_error",
+            "workflow_id": workflow_id,
+            "error": error
+        })
+
+    async def execute_ultra_workflow(self, workflow_id: str):
+        """Exécute le workflow ultra-simple et publie le streaming sur le hub"""
         
         if workflow_id not in self.active_workflows:
             logger.error(f"❌ Workflow {workflow_id} non trouvé")
@@ -238,6 +376,9 @@ GÉNÈRE DE L'ARCHITECTURE RÉVOLUTIONNAIRE !"""
         
         workflow = self.active_workflows[workflow_id]
         workflow["state"] = "executing"
+        self._persist(workflow)
+        publish = lambda event: self.event_hub.publish(workflow_id, event)
+        started = time.monotonic()
         
         try:
             agent = self.agents[workflow["agent_id"]]
@@ -246,79 +387,100 @@ GÉNÈRE DE L'ARCHITECTURE RÉVOLUTIONNAIRE !"""
             logger.info(f"🚀 Exécution agent {agent.name}")
             
             # Stream de début
-            if websocket:
-                await websocket.send_json({
-                    "type": "workflow_started",
-                    "workflow_id": workflow_id,
-                    "agent": agent.name
-                })
+            publish({
+                "type": "workflow_started",
+                "workflow_id": workflow_id,
+                "agent": agent.name
+            })
             
             # Appel OpenAI avec streaming
             response_content = ""
+            last_cancel_check = 0.0
             
-            stream = await self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": agent.prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=4096,
-                stream=True
+            stream = self.provider.stream(
+                "gpt-4o",
+                prompt,
+                system=agent.prompt,
+                options={"temperature": 0.3, "max_tokens": 4096},
+                agent=agent.agent_id
             )
             
-            async for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
+            # aclosing : à l'annulation, le flux OpenAI est fermé tout de suite (pas au ramasse-miettes)
+            async with aclosing(stream):
+                async for content in stream:
                     response_content += content
                     
-                    # Stream temps réel
-                    if websocket:
-                        await websocket.send_json({
-                            "type": "agent_streaming",
-                            "agent": agent.agent_id,
-                            "content": content,
-                            "accumulated_length": len(response_content)
-                        })
-            
-            # Extraction des fichiers
-            files = self._extract_files_ultra(response_content, workflow_id)
+                    # Stream temps réel (une seule génération, N abonnés)
+                    publish({
+                        "type": "agent_streaming",
+                        "agent": agent.agent_id,
+                        "content": content,
+                        "accumulated_length": len(response_content)
+                    })
+                    
+                    # Annulation demandée depuis un autre worker (vérifiée au plus une fois par seconde)
+                    if time.monotonic() - last_cancel_check >= 1.0:
+                        last_cancel_check = time.monotonic()
+                        if self._cancel_requested(workflow_id):
+                            self.supervisor.cancel(workflow_id)
             
+            # La réponse générée est conservée quoi qu'il arrive aux fichiers
             workflow["response"] = response_content
+            
+            # Extraction des fichiers puis écriture sur le pool de threads
+            extracted = self._extract_files_ultra(response_content, workflow_id)
+            written = await self.workspace_writer.write_files(
+                workflow_id,
+                [(file["workspace_path"], file["content"]) for file in extracted]
+            )
+            files, rejected_files = [], []
+            for file, result in zip(extracted, written):
+                if "rejected" in result:
+                    rejected_files.append({"path": file["path"], "reason": result["rejected"]})
+                    continue
+                file["hash"] = result["hash"]
+                files.append(file)
+            
             workflow["files"] = files
+            workflow["rejected_files"] = rejected_files
             workflow["state"] = "completed"
             workflow["completed_at"] = datetime.now().isoformat()
+            self._persist(workflow)
             
             # Stream final
-            if websocket:
-                await websocket.send_json({
-                    "type": "workflow_completed",
-                    "workflow_id": workflow_id,
-                    "files_count": len(files),
-                    "response_length": len(response_content)
-                })
+            publish({
+                "type": "workflow_completed",
+                "workflow_id": workflow_id,
+                "files_count": len(files),
+                "rejected_files": rejected_files,
+                "response_length": len(response_content)
+            })
             
             logger.info(f"✅ Workflow {workflow_id} terminé: {len(files)} fichiers")
+            cancellation_metrics.record_completed("ultra_workflow", time.monotonic() - started)
             
+        except asyncio.CancelledError:
+            # Annulation ou timeout : le flux OpenAI est fermé, la génération s'arrête
+            cancellation_metrics.record_cancelled("ultra_workflow", time.monotonic() - started)
+            raise
         except Exception as e:
             logger.error(f"❌ Erreur workflow {workflow_id}: {e}")
             workflow["state"] = "error"
             workflow["error"] = str(e)
+            self._persist(workflow)
             
-            if websocket:
-                await websocket.send_json({
-                    "type": "workflow_error",
-                    "workflow_id": workflow_id,
-                    "error": str(e)
-                })
+            publish({
+                "type": "workflow_error",
+                "workflow_id": workflow_id,
+                "error": str(e)
+            })
 
     def _extract_files_ultra(self, content: str, workflow_id: str) -> List[Dict]:
-        """Extraction ultra-simple mais efficace"""
+        """Extraction ultra-simple mais efficace (sans I/O, l'écriture est déléguée au WorkspaceWriter)"""
         
         files = []
-        print(f"🔍 [DEBUG] Extraction fichiers pour workflow {workflow_id}")
-        print(f"🔍 [DEBUG] Longueur contenu: {len(content)}")
-        print(f"🔍 [DEBUG] Aperçu contenu: {content[:500]}...")
+        seen_paths = set()
+        logger.debug("🔍 Extraction fichiers", extra={"workflow_id": workflow_id, "content_chars": len(content)})
         
         # Pattern principal : // FICHIER: ou /* FICHIER: 
         import re
@@ -349,16 +511,15 @@ GÉNÈRE DE L'ARCHITECTURE RÉVOLUTIONNAIRE !"""
                     # Nettoyer le nom de fichier pour éviter les caractères invalides
                     clean_filepath = self._clean_filepath(filepath)
                     
-                    # Sauvegarder physiquement
-                    full_path = Path(WORKSPACE_DIR) / workflow_id / clean_filepath
-                    full_path.parent.mkdir(parents=True, exist_ok=True)
-                    
-                    with open(full_path, 'w', encoding='utf-8') as f:
-                        f.write(file_content)
+                    # Les deux patterns peuvent capturer le même bloc
+                    if clean_filepath in seen_paths:
+                        continue
+                    seen_paths.add(clean_filepath)
                     
                     file_info = {
                         "name": filepath.split('/')[-1],  # Nom du fichier seul
                         "path": filepath,
+                        "workspace_path": clean_filepath,
                         "content": file_content,
                         "language": language,
                         "size": len(file_content),
@@ -366,11 +527,11 @@ GÉNÈRE DE L'ARCHITECTURE RÉVOLUTIONNAIRE !"""
                     }
                     
                     files.append(file_info)
-                    logger.info(f"📁 Fichier créé: {filepath}")
         
-        print(f"🔍 [DEBUG] Extraction terminée: {len(files)} fichiers trouvés")
-        for i, file in enumerate(files):
-            print(f"🔍 [DEBUG] Fichier {i}: {file.get('name', 'no-name')} ({len(file.get('content', ''))} chars)")
+        logger.info(f"📁 {len(files)} fichiers extraits", extra={
+            "workflow_id": workflow_id,
+            "files": [{"path": file["path"], "size": file["size"]} for file in files]
+        })
         
         return files
 
@@ -415,8 +576,10 @@ async def start_ultra_workflow(request: UltraWorkflowRequest):
             request.agent_id
         )
         
-        # Le workflow sera lancé quand le WebSocket se connectera
-        # Cela permet de capturer tout le streaming depuis le début
+        # Exécution immédiate en tâche de fond : les WebSockets ne sont que des abonnés.
+        # Un abonné tardif reçoit les événements encore dans le buffer de rejeu ; si des
+        # fragments en ont été évincés, le texte déjà généré lui arrive en un instantané
+        ultra_engine.start_ultra_workflow(workflow_id)
         
         return {
             "success": True,
@@ -434,56 +597,154 @@ async def start_ultra_workflow(request: UltraWorkflowRequest):
 async def get_ultra_status(workflow_id: str):
     """📊 Statut du workflow ultra"""
     
-    if workflow_id not in ultra_engine.active_workflows:
+    workflow = ultra_engine.get_workflow(workflow_id)
+    if workflow is None:
         raise HTTPException(404, "Workflow non trouvé")
     
-    return ultra_engine.active_workflows[workflow_id]
+    return workflow
 
-@app.get("/ultra/workflow/{workflow_id}/files")
-async def get_ultra_files(workflow_id: str):
-    """📁 Fichiers du workflow ultra"""
+@app.post("/ultra/workflow/{workflow_id}/cancel")
+async def cancel_ultra_workflow(workflow_id: str):
+    """🛑 Annule un workflow ultra en file ou en cours"""
     
-    if workflow_id not in ultra_engine.active_workflows:
+    workflow = ultra_engine.get_workflow(workflow_id)
+    if workflow is None:
+        raise HTTPException(404, "Workflow non trouvé")
+    
+    cancelled = ultra_engine.cancel_ultra_workflow(workflow_id)
+    return {
+        "success": cancelled,
+        "workflow_id": workflow_id,
+        "state": "cancelling" if cancelled else workflow["state"]
+    }
+
+def _ensure_workflow_files(workflow_id: str):
+    """404 si le workflow n'est ni en mémoire ni présent dans le workspace"""
+    try:
+        workflow_dir = ultra_engine.workspace_writer.workflow_dir(workflow_id)
+    except ValueError:
         raise HTTPException(404, "Workflow non trouvé")
+    if ultra_engine.get_workflow(workflow_id) is None and not workflow_dir.is_dir():
+        raise HTTPException(404, "Workflow non trouvé")
+    return workflow_dir
+
+@app.get("/ultra/workflow/{workflow_id}/files")
+async def get_ultra_files(workflow_id: str, include_content: bool = False):
+    """📁 Fichiers du workflow ultra (métadonnées ; contenu via /files/{path} ou /archive)"""
     
-    workflow = ultra_engine.active_workflows[workflow_id]
-    files_list = workflow.get("files", [])
+    _ensure_workflow_files(workflow_id)
     
-    # Convertir la liste de fichiers en dictionnaire avec le nom comme clé
-    files_dict = {}
-    for file in files_list:
-        filename = file.get("name", file.get("path", f"file_{len(files_dict)}"))
-        files_dict[filename] = {
-            "content": file.get("content", ""),
-            "language": file.get("language", "javascript"),
-            "path": file.get("path", filename)
-        }
+    if include_content:
+        # Ancien format : contenu complet inline, conservé pour compatibilité
+        workflow = ultra_engine.get_workflow(workflow_id) or {}
+        files_dict = {}
+        for file in workflow.get("files", []):
+            filename = file.get("name", file.get("path", f"file_{len(files_dict)}"))
+            files_dict[filename] = {
+                "content": file.get("content", ""),
+                "language": file.get("language", "javascript"),
+                "path": file.get("path", filename)
+            }
+        return FastJSONResponse({
+            "workflow_id": workflow_id,
+            "files": files_dict,
+            "total_files": len(files_dict)
+        })
     
-    print(f"🔍 [DEBUG] get_ultra_files - {len(files_dict)} fichiers retournés")
-    for name, content in files_dict.items():
-        print(f"🔍 [DEBUG] Fichier: {name} ({len(content.get('content', ''))} chars)")
+    entries = await ultra_engine.workspace_writer.list_files_async(workflow_id)
+    for entry in entries:
+        entry["language"] = ultra_engine._detect_lang(entry["path"])
+        entry["url"] = f"/ultra/workflow/{workflow_id}/files/{entry['path']}"
     
-    return {
+    return FastJSONResponse({
         "workflow_id": workflow_id,
-        "files": files_dict,
-        "total_files": len(files_dict)
-    }
+        "files": entries,
+        "total_files": len(entries),
+        "total_size": sum(entry["size"] for entry in entries),
+        "archive_url": f"/ultra/workflow/{workflow_id}/archive"
+    })
+
+@app.get("/ultra/workflow/{workflow_id}/files/{file_path:path}")
+async def get_ultra_file_content(workflow_id: str, file_path: str, request: Request):
+    """📄 Contenu d'un fichier, avec support des requêtes partielles (Range)"""
+    
+    _ensure_workflow_files(workflow_id)
+    try:
+        path = ultra_engine.workspace_writer.resolve(workflow_id, file_path)
+    except ValueError:
+        raise HTTPException(404, "Fichier non trouvé")
+    if not path.is_file():
+        raise HTTPException(404, "Fichier non trouvé")
+    
+    size = path.stat().st_size
+    headers = {"Accept-Ranges": "bytes"}
+    try:
+        byte_range = parse_range_header(request.headers.get("range"), size)
+    except ValueError:
+        raise HTTPException(416, "Range non satisfaisable", headers={"Content-Range": f"bytes */{size}"})
+    
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+    
+    return StreamingResponse(
+        iter_file_range(path, start, end, CHUNK_SIZE),
+        status_code=status_code,
+        media_type="text/plain; charset=utf-8",
+        headers=headers
+    )
+
+@app.get("/ultra/workflow/{workflow_id}/archive")
+async def get_ultra_archive(workflow_id: str, format: str = "zip"):
+    """📦 Archive zip ou tar.gz des fichiers générés, construite en flux"""
+    
+    workflow_dir = _ensure_workflow_files(workflow_id)
+    if format not in ARCHIVE_FORMATS:
+        raise HTTPException(400, f"Format non supporté: {format} ({', '.join(ARCHIVE_FORMATS)})")
+    
+    media_type, extension = ARCHIVE_FORMATS[format]
+    return StreamingResponse(
+        iter_archive(workflow_dir, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{workflow_id}.{extension}"'}
+    )
 
 @app.websocket("/ultra/ws/{workflow_id}")
-async def ultra_websocket(websocket: WebSocket, workflow_id: str):
-    """🌊 WebSocket ultra-simple"""
+async def ultra_websocket(websocket: WebSocket, workflow_id: str, last_seq: int = 0):
+    """🌊 WebSocket ultra-simple (abonné au hub, reprise via ?last_seq=N)"""
     
     await websocket.accept()
-    ultra_engine.websocket_connections[workflow_id] = websocket
+    
+    if workflow_id not in ultra_engine.active_workflows:
+        # Les événements ne vivent que sur le worker qui exécute le workflow
+        stored = ultra_engine.workflow_store.get(workflow_id)
+        if stored and stored["state"] in ("completed", "error", "cancelled"):
+            event = {"type": f"workflow_{stored['state']}", "workflow_id": workflow_id}
+            if stored["state"] == "completed":
+                event["files_count"] = len(stored.get("files", []))
+            else:
+                event["error"] = stored.get("error")
+        else:
+            event = {
+                "type": "workflow_error",
+                "workflow_id": workflow_id,
+                "error": "Workflow exécuté par un autre worker" if stored else "Workflow non trouvé"
+            }
+        await websocket.send_json(event)
+        await websocket.close()
+        return
+    
+    async def forward_events():
+        async for event in ultra_engine.event_hub.subscribe(workflow_id, last_seq):
+            await websocket.send_json(event)
+    
+    forward_task = asyncio.create_task(forward_events())
     
     try:
-        logger.info(f"🌊 WebSocket connecté: {workflow_id}")
-        
-        # Si workflow pas encore exécuté, le lancer
-        if workflow_id in ultra_engine.active_workflows:
-            workflow = ultra_engine.active_workflows[workflow_id]
-            if workflow["state"] == "created":
-                await ultra_engine.execute_ultra_workflow(workflow_id, websocket)
+        logger.info(f"🌊 WebSocket connecté: {workflow_id} (last_seq={last_seq})")
         
         # Garder la connexion
         while True:
@@ -497,8 +758,7 @@ async def ultra_websocket(websocket: WebSocket, workflow_id: str):
     except Exception as e:
         logger.error(f"❌ WebSocket error: {e}")
     finally:
-        if workflow_id in ultra_engine.websocket_connections:
-            del ultra_engine.websocket_connections[workflow_id]
+        forward_task.cancel()
 
 @app.post("/ultra/chat")
 async def ultra_chat(data: dict = Body(...)):
@@ -506,6 +766,7 @@ async def ultra_chat(data: dict = Body(...)):
     
     message = data.get("message", "")
     agent_id = data.get("agent", "quantum_developer")
+    history = data.get("history") or []  # Tours précédents [{role, content}]
     
     if not message:
         raise HTTPException(400, "Message requis")
@@ -515,18 +776,15 @@ async def ultra_chat(data: dict = Body(...)):
         if not agent:
             raise HTTPException(404, f"Agent {agent_id} non trouvé")
         
-        response = await ultra_engine.openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": agent.prompt},
-                {"role": "user", "content": message}
-            ],
-            temperature=0.3,
-            max_tokens=4096
+        content = await ultra_engine.provider.generate(
+            "gpt-4o",
+            message,
+            system=agent.prompt,
+            history=history if isinstance(history, list) else [],
+            options={"temperature": 0.3, "max_tokens": 4096},
+            agent=agent_id
         )
         
-        content = response.choices[0].message.content
-        
         return {
             "success": True,
             "agent": agent_id,
@@ -550,7 +808,10 @@ async def ultra_debug():
             for agent_id, agent in ultra_engine.agents.items()
         },
         "active_workflows": len(ultra_engine.active_workflows),
-        "websockets": len(ultra_engine.websocket_connections),
+        "websockets": ultra_engine.event_hub.subscriber_count(),
+        "workers": ultra_engine.supervisor.stats(),
+        "openai_gateway": ultra_engine.gateway.stats(),
+        "cancellation": cancellation_metrics.stats(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -560,10 +821,11 @@ async def ultra_health():
     
     try:
         # Test OpenAI
-        await ultra_engine.openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": "test"}],
-            max_tokens=1
+        await ultra_engine.provider.generate(
+            "gpt-3.5-turbo",
+            "test",
+            options={"max_tokens": 1},
+            agent="health"
         )
         
         return {
@@ -581,6 +843,12 @@ async def ultra_health():
             "timestamp": datetime.now().isoformat()
         }
 
+@app.on_event("shutdown")
+async def ultra_shutdown():
+    """Annule proprement les workflows encore actifs"""
+    await ultra_engine.supervisor.shutdown()
+    ultra_engine.workspace_writer.shutdown()
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -7,63 +7,87 @@ AGENT_ROLES = {
         "name": "Assistant général polyvalent",
         "model": "qwen2.5:3b",
         "priority": False,
-        "description": "Assistant IA généraliste pour toutes tâches"
+        "description": "Assistant IA généraliste pour toutes tâches",
+        "generation": {"temperature": 0.7, "num_predict": 1200}
     },
     "visionnaire": {
         "name": "Expert en vision produit et besoins utilisateurs",
         "model": "qwen2.5:3b",
         "priority": True,
-        "description": "Analyse les besoins et propose une vision produit"
+        "description": "Analyse les besoins et propose une vision produit",
+        "generation": {"temperature": 0.8, "num_predict": 1200}
     },
     "architecte": {
         "name": "Architecte logiciel et conception système", 
         "model": "deepseek-coder:6.7b",
         "priority": True,
-        "description": "Conçoit l'architecture technique et les patterns"
+        "description": "Conçoit l'architecture technique et les patterns",
+        "generation": {"temperature": 0.3, "num_predict": 2000}
     },
     "frontend_engineer": {
         "name": "Développeur frontend React/TypeScript",
         "model": "deepseek-coder:6.7b",
         "priority": True,
-        "description": "Développe les interfaces utilisateur modernes"
+        "description": "Développe les interfaces utilisateur modernes",
+        "generation": {"temperature": 0.7, "num_predict": 1200}
     },
     "backend_engineer": {
         "name": "Développeur backend Python/API",
         "model": "deepseek-r1:8b",
         "priority": False,
-        "description": "Développe les APIs et la logique serveur"
+        "description": "Développe les APIs et la logique serveur",
+        "generation": {"temperature": 0.3, "num_predict": 1200}
     },
     "database_specialist": {
         "name": "Expert bases de données et optimisation",
         "model": "deepseek-r1:8b",
         "priority": False,
-        "description": "Optimise et conçoit les bases de données"
+        "description": "Optimise et conçoit les bases de données",
+        "generation": {"temperature": 0.3, "num_predict": 1200}
     },
     "designer_ui_ux": {
         "name": "Designer d'interfaces et expérience utilisateur",
         "model": "qwen2.5:3b",
         "priority": False,
-        "description": "Conçoit l'expérience et les interfaces"
+        "description": "Conçoit l'expérience et les interfaces",
+        "generation": {"temperature": 0.8, "num_predict": 1200}
     },
     "critique": {
         "name": "Analyste code et revue qualité",
         "model": "deepseek-coder:6.7b",
         "priority": False,
-        "description": "Analyse et améliore la qualité du code"
+        "description": "Analyse et améliore la qualité du code",
+        "generation": {"temperature": 0.7, "num_predict": 2000}
     },
     "optimiseur": {
         "name": "Expert optimisation et performance",
         "model": "deepseek-coder:6.7b",
         "priority": False,
-        "description": "Optimise les performances et la qualité"
+        "description": "Optimise les performances et la qualité",
+        "generation": {"temperature": 0.7, "num_predict": 2000}
     }
 }
 
+# Profil de génération par défaut (options Ollama ; traduites pour les autres fournisseurs).
+# Pas de "stop" commun : les jetons de fin dépendent du modèle et Ollama applique ceux de son template ;
+# un agent peut en ajouter dans son propre profil.
+DEFAULT_GENERATION = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "num_predict": 1500,  # Plafond de tokens générés : coupe les générations qui s'emballent
+    "num_ctx": 4096
+}
+
 # Configuration Ollama avancée
 OLLAMA_CONFIG = {
     "base_url": os.getenv("OLLAMA_URL", "http://localhost:11434"),
-    "timeout": int(os.getenv("OLLAMA_TIMEOUT", "60")),  # Plus long pour les gros modèles
-    "temperature": float(os.getenv("DEFAULT_TEMPERATURE", "0.7"))
+    "timeout": int(os.getenv("OLLAMA_TIMEOUT", "120")),  # Plus long pour les gros modèles
+    "temperature": float(os.getenv("DEFAULT_TEMPERATURE", "0.7")),
+    "max_concurrency": int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4")),  # Générations simultanées
+    "max_queue": int(os.getenv("OLLAMA_MAX_QUEUE", "32")),  # Requêtes avec échéance en attente au-delà : rejet immédiat
+    "models_cache_ttl": float(os.getenv("OLLAMA_MODELS_CACHE_TTL", "10")),  # Cache de /api/tags (s)
+    "adaptive_num_predict": os.getenv("OLLAMA_ADAPTIVE_NUM_PREDICT", "true").lower() == "true",  # num_predict ajusté aux longueurs observées
+    "chat_api": os.getenv("OLLAMA_CHAT_API", "true").lower() == "true"  # /api/chat (messages structurés), sinon /api/generate
 }
 
 # Configuration Storage
@@ -73,6 +97,74 @@ STORAGE_CONFIG = {
     "max_context_length": int(os.getenv("MAX_CONTEXT_LENGTH", "2000"))
 }
 
+# État partagé entre workers : "memory" (un seul worker) ou "sqlite" (uvicorn --workers N)
+STATE_CONFIG = {
+    "backend": os.getenv("STATE_BACKEND", "memory"),
+    "path": os.getenv("STATE_DB_PATH", os.path.join(os.getenv("DATA_DIR", "./data"), "state.db")),
+    # Points de reprise des workflows : toujours sur disque, même avec STATE_BACKEND=memory
+    "checkpoint_path": os.getenv("WORKFLOW_CHECKPOINT_DB", os.path.join(os.getenv("DATA_DIR", "./data"), "workflows.db"))
+}
+
+# Mode spéculatif de /chat : brouillon du petit modèle, réponse affinée du modèle spécialiste
+SPECULATIVE_CONFIG = {
+    "draft_model": os.getenv("DRAFT_MODEL", "qwen2.5:3b"),
+    "refine_threshold": float(os.getenv("ROUTING_REFINE_THRESHOLD", "0.5")),  # Score à partir duquel le gros modèle est appelé
+    "long_prompt_chars": int(os.getenv("ROUTING_LONG_PROMPT_CHARS", "600"))  # Demande considérée comme longue
+}
+
+# Routage des demandes vers le workflow (ou l'agent) le moins coûteux qui suffit
+WORKFLOW_ROUTING_CONFIG = {
+    "classifier": os.getenv("ROUTER_CLASSIFIER", "true").lower() == "true",  # Petit modèle si aucune règle ne tranche
+    "classifier_model": os.getenv("ROUTER_CLASSIFIER_MODEL", os.getenv("DRAFT_MODEL", "qwen2.5:3b")),
+    "cache_size": int(os.getenv("ROUTER_CACHE_SIZE", "512"))  # Décisions du classifieur mémorisées
+}
+
+# Journalisation structurée (file non bloquante, échantillonnage par route "préfixe=taux,...")
+LOGGING_CONFIG = {
+    "level": os.getenv("LOG_LEVEL", "INFO"),
+    "format": os.getenv("LOG_FORMAT", "json"),  # json | text
+    "sampling": os.getenv("LOG_SAMPLING", "/health=0.01,/system/status=0.1"),
+    "queue_size": int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+}
+
+# Traçage des requêtes (spans par phase) : traces récentes en mémoire, export optionnel
+TRACING_CONFIG = {
+    "enabled": os.getenv("TRACING", "true").lower() == "true",
+    "sample_rate": float(os.getenv("TRACE_SAMPLE_RATE", "1.0")),
+    "slow_ms": float(os.getenv("TRACE_SLOW_MS", "1000")),  # Seuil de /debug/traces/recent
+    "recent_size": int(os.getenv("TRACE_RECENT_SIZE", "200")),
+    "exporter": os.getenv("TRACE_EXPORTER", "none"),  # none | jsonl | otlp
+    "jsonl_path": os.getenv("TRACE_JSONL_PATH", os.path.join(os.getenv("DATA_DIR", "./data"), "traces.jsonl")),
+    "otlp_endpoint": os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+}
+
+# Mémoïsation des étapes de workflow (même agent, modèle, entrée et amont -> sortie réutilisée)
+STEP_MEMO_CONFIG = {
+    "enabled": os.getenv("STEP_MEMO", "true").lower() == "true",
+    "ttl": float(os.getenv("STEP_MEMO_TTL", str(7 * 24 * 3600)))  # Durée de validité d'une entrée (s)
+}
+
+# Provisionnement des modèles (setup_ollama) : téléchargements et tests en parallèle
+PROVISIONING_CONFIG = {
+    "pull_concurrency": int(os.getenv("OLLAMA_PULL_CONCURRENCY", "3")),
+    "pull_retries": int(os.getenv("OLLAMA_PULL_RETRIES", "4")),  # Tentatives par modèle (flux coupé, erreur réseau)
+    "test_concurrency": int(os.getenv("OLLAMA_TEST_CONCURRENCY", "2"))  # Modèles chargés simultanément pour les tests
+}
+
+# Réponses HTTP : compression brotli/gzip négociée au-delà d'un seuil (octets)
+COMPRESSION_CONFIG = {
+    "enabled": os.getenv("RESPONSE_COMPRESSION", "true").lower() == "true",
+    "minimum_size": int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+    "gzip_level": int(os.getenv("GZIP_LEVEL", "5")),
+    "brotli_quality": int(os.getenv("BROTLI_QUALITY", "4"))
+}
+
+# Échéances de requête : en-tête X-Request-Timeout (s), sinon défaut par préfixe de route "préfixe=secondes"
+DEADLINE_CONFIG = {
+    "route_timeouts": os.getenv("REQUEST_TIMEOUTS", "/chat=120,/agent=180"),
+    "max_timeout": float(os.getenv("REQUEST_TIMEOUT_MAX", "600"))  # Plafond d'une échéance demandée par le client
+}
+
 # Agents prioritaires pour MVP (avec modèles plus légers)
 PRIORITY_AGENTS = ["visionnaire", "architecte", "frontend_engineer"]
 
@@ -88,6 +180,13 @@ def get_agent_model(agent_role: str) -> str:
     """Retourne le modèle spécialisé pour un agent"""
     return AGENT_ROLES.get(agent_role, {}).get("model", "qwen2.5:3b")
 
+def get_generation_profile(agent_role: str) -> Dict:
+    """Options de génération d'un agent (profil par défaut complété par celui de l'agent)"""
+    profile = {**DEFAULT_GENERATION, **AGENT_ROLES.get(agent_role, {}).get("generation", {})}
+    if "stop" in profile:
+        profile["stop"] = list(profile["stop"])
+    return profile
+
 def is_priority_agent(agent_role: str) -> bool:
     """Vérifie si un agent est prioritaire"""
     return agent_role in PRIORITY_AGENTS
\ No newline at end of file
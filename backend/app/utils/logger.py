@@ -0,0 +1,213 @@
+"""
+Journalisation structurée et non bloquante
+
+Les appels `logger.info(...)` ne font que déposer l'enregistrement dans une
+file bornée (QueueHandler) : formatage JSON et écriture sur le flux ont lieu
+dans le thread d'un QueueListener, hors de la boucle d'événements. File
+pleine : l'enregistrement est abandonné et compté plutôt que d'attendre.
+
+- Enregistrements JSON (LOG_FORMAT=json) ou texte lisible (LOG_FORMAT=text),
+  les champs passés via `extra={...}` deviennent des clés du JSON.
+- Échantillonnage par route (`extra={"route": ...}`) : "/health=0.01" garde
+  une requête de santé sur cent ; les avertissements et erreurs sont
+  toujours conservés.
+- Niveau et échantillonnage modifiables à chaud (LoggingPipeline.configure).
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+# Attributs propres à LogRecord : tout le reste vient de `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """"/health=0.01,/system/status=0.1" -> {"/health": 0.01, "/system/status": 0.1}"""
+    rules = {}
+    for rule in filter(None, (part.strip() for part in (spec or "").split(","))):
+        route, _, rate = rule.partition("=")
+        try:
+            rules[route.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            raise ValueError(f"Règle d'échantillonnage invalide: {rule}")
+    return rules
+
+
+def record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement : horodatage, niveau, logger, message et champs"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Format texte historique, suivi des champs structurés en key=value"""
+
+    def __init__(self):
+        super().__init__("%(levelname)s:%(name)s:%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class RouteSampler(logging.Filter):
+    """Garde une fraction des enregistrements portant un champ `route` (préfixe le plus long)"""
+
+    def __init__(self, rules: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rules = dict(rules or {})
+        self.sampled_out = 0
+
+    def rate(self, route: str) -> float:
+        best, rate = -1, 1.0
+        for prefix, prefix_rate in self.rules.items():
+            if route.startswith(prefix) and len(prefix) > best:
+                best, rate = len(prefix), prefix_rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        route = getattr(record, "route", None)
+        if route is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(route)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Dépose l'enregistrement sans formatage ni attente : seul le message est
+    figé (les arguments peuvent changer après l'appel), le reste est fait
+    par le thread d'écriture.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """Sentinelle d'arrêt déposée en attendant une place : la file pleine est vidée, pas perdue"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class LoggingPipeline:
+    """File bornée + thread d'écriture, installés sur le logger racine"""
+
+    def __init__(self, level: str = "INFO", fmt: str = "json", sampling: Optional[Dict[str, float]] = None,
+                 queue_size: int = 10000, stream=None):
+        self.format = fmt
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.sampler = RouteSampler(sampling)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        # Filtre posé sur le handler : appliqué avant la mise en file, dans l'appelant
+        self.handler.addFilter(self.sampler)
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        self.listener = DrainingQueueListener(self.queue, output, respect_handler_level=False)
+        self._lock = threading.Lock()
+        self.root: Optional[logging.Logger] = None
+        self.level = "INFO"
+        self.configure(level=level)
+
+    def install(self, root: Optional[logging.Logger] = None) -> "LoggingPipeline":
+        """Remplace les handlers de `root` (logger racine par défaut) par la file"""
+        self.root = root or logging.getLogger()
+        for handler in list(self.root.handlers):
+            self.root.removeHandler(handler)
+        self.root.addHandler(self.handler)
+        self.root.setLevel(self.level)
+        self.listener.start()
+        return self
+
+    def configure(self, level: Optional[str] = None, sampling: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """Change niveau et/ou règles d'échantillonnage à chaud"""
+        with self._lock:
+            if level is not None:
+                numeric = logging.getLevelName(str(level).upper())
+                if not isinstance(numeric, int):
+                    raise ValueError(f"Niveau de log inconnu: {level}")
+                self.level = logging.getLevelName(numeric)
+                if self.root is not None:
+                    self.root.setLevel(numeric)
+            if sampling is not None:
+                self.sampler.rules = dict(sampling)
+        return self.settings()
+
+    def settings(self) -> Dict[str, Any]:
+        return {"level": self.level, "format": self.format, "sampling": dict(self.sampler.rules)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.settings(),
+            "queued": self.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out,
+        }
+
+    def stop(self):
+        """Vide la file puis arrête le thread d'écriture"""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+
+_pipeline: Optional[LoggingPipeline] = None
+
+
+def setup_logging(**overrides) -> LoggingPipeline:
+    """Installe (une seule fois par processus) le pipeline configuré par LOGGING_CONFIG"""
+    global _pipeline
+    if _pipeline is None:
+        from .config import LOGGING_CONFIG
+
+        settings = {**LOGGING_CONFIG, **overrides}
+        _pipeline = LoggingPipeline(
+            level=settings["level"],
+            fmt=settings["format"],
+            sampling=parse_sampling(settings["sampling"]),
+            queue_size=settings["queue_size"],
+        ).install()
+        # Thread d'écriture démon : vider la file avant la sortie du processus
+        atexit.register(_pipeline.stop)
+    return _pipeline
@@ -1,3 +1,5 @@
+import os
+import platform
 import time
 import logging
 import asyncio
@@ -8,12 +10,17 @@ from collections import defaultdict, deque
 logger = logging.getLogger(__name__)
 
 class PerformanceMonitor:
-    def __init__(self, max_history: int = 1000):
+    def __init__(self, max_history: int = 1000, state=None, publish_interval: float = 5.0):
         self.max_history = max_history
         self.request_times = deque(maxlen=max_history)
         self.agent_times = defaultdict(lambda: deque(maxlen=100))
         self.error_counts = defaultdict(int)
         self.start_time = datetime.now()
+        # Historiques locaux au worker ; un résumé est publié dans le backend d'état partagé
+        self.state = state
+        self.publish_interval = publish_interval
+        self.worker_id = f"{platform.node()}:{os.getpid()}"
+        self._last_publish = 0.0
         
     def record_request(self, endpoint: str, duration: float, status_code: int):
         """Enregistre les métriques d'une requête"""
@@ -26,6 +33,7 @@ class PerformanceMonitor:
         
         if status_code >= 400:
             self.error_counts[endpoint] += 1
+        self._maybe_publish()
     
     def record_agent_call(self, agent_role: str, duration: float, success: bool):
         """Enregistre les métriques d'un appel d'agent"""
@@ -34,6 +42,31 @@ class PerformanceMonitor:
             'timestamp': datetime.now(),
             'success': success
         })
+        self._maybe_publish()
+    
+    def get_agent_latency(self, agent_role: str) -> Optional[float]:
+        """Durée moyenne des appels réussis d'un agent sur tout l'historique (None sans mesure)"""
+        durations = [call['duration'] for call in self.agent_times.get(agent_role, ()) if call['success']]
+        return sum(durations) / len(durations) if durations else None
+    
+    def _maybe_publish(self):
+        if self.state is None or time.monotonic() - self._last_publish < self.publish_interval:
+            return
+        self._last_publish = time.monotonic()
+        try:
+            self.state.set("metrics", self.worker_id, self.get_stats())
+        except Exception as e:
+            logger.warning(f"⚠️ Publication des métriques impossible: {e}")
+    
+    def get_cluster_stats(self) -> Dict:
+        """Derniers résumés publiés par chaque worker (le worker courant est à jour)"""
+        workers = self.state.items("metrics") if self.state is not None else {}
+        workers[self.worker_id] = self.get_stats()
+        return {
+            'workers': workers,
+            'worker_count': len(workers),
+            'total_requests': sum(stats['total_requests'] for stats in workers.values()),
+        }
     
     def get_stats(self) -> Dict:
         """Retourne les statistiques de performance"""
@@ -77,5 +110,50 @@ class PerformanceMonitor:
             'timestamp': now.isoformat()
         }
 
-# Instance globale
-performance_monitor = PerformanceMonitor()
\ No newline at end of file
+def common_prefix_length(a: str, b: str) -> int:
+    """Longueur du préfixe commun (recherche dichotomique, comparaisons en C)"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class PrefixReuseTracker:
+    """
+    Part de chaque prompt identique au début du prompt précédent envoyé au même
+    modèle : c'est la portion dont Ollama peut réutiliser le cache KV.
+    """
+
+    def __init__(self):
+        self._last_prompt: Dict[str, str] = {}
+        self.stats_by_key = defaultdict(lambda: {'prompts': 0, 'chars': 0, 'reused_chars': 0})
+
+    def record(self, key: str, prompt: str) -> float:
+        previous = self._last_prompt.get(key)
+        reused = common_prefix_length(previous, prompt) if previous else 0
+        self._last_prompt[key] = prompt
+
+        stats = self.stats_by_key[key]
+        stats['prompts'] += 1
+        stats['chars'] += len(prompt)
+        stats['reused_chars'] += reused
+        return reused / len(prompt) if prompt else 0.0
+
+    def get_stats(self) -> Dict:
+        total_chars = sum(stats['chars'] for stats in self.stats_by_key.values())
+        reused_chars = sum(stats['reused_chars'] for stats in self.stats_by_key.values())
+        return {
+            'prefix_reuse_ratio': round(reused_chars / total_chars, 3) if total_chars else 0.0,
+            'by_model': {
+                key: {**stats, 'ratio': round(stats['reused_chars'] / stats['chars'], 3) if stats['chars'] else 0.0}
+                for key, stats in self.stats_by_key.items()
+            }
+        }
+
+# Instances globales
+performance_monitor = PerformanceMonitor()
+prefix_reuse_tracker = PrefixReuseTracker()
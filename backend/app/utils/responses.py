@@ -0,0 +1,136 @@
+"""
+Réponses JSON rapides et compression négociée
+
+- FastJSONResponse : sérialisation orjson (repli sur json si absent). Les
+  types qu'orjson ne connaît pas (modèles Pydantic, ensembles...) passent
+  par jsonable_encoder, objet par objet. Renvoyée directement par un
+  endpoint, elle évite aussi le parcours complet de jsonable_encoder que
+  FastAPI applique aux dict retournés.
+- CompressionMiddleware : brotli (si installé) ou gzip selon Accept-Encoding,
+  pour les corps texte/JSON d'au moins `minimum_size` octets envoyés en un
+  seul message. Les réponses en flux (SSE, NDJSON, fichiers) et partielles
+  (Range) passent telles quelles : les compresser retarderait chaque envoi.
+"""
+
+import asyncio
+import gzip
+import json
+from typing import Any, Optional
+
+from fastapi.encoders import jsonable_encoder
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+# Au-delà, la compression est faite hors de la boucle d'événements
+THREAD_COMPRESSION_SIZE = 256 * 1024
+
+
+def dumps_json(content: Any) -> bytes:
+    """JSON UTF-8 compact (orjson si disponible)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=jsonable_encoder).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+def negotiate_encoding(accept_encoding: str, brotli_available: bool = brotli is not None) -> Optional[str]:
+    """"br" ou "gzip" selon l'en-tête Accept-Encoding (q=0 : refusé), None sinon"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token:
+            accepted[token.strip().lower()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    if brotli_available and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 5, brotli_quality: int = 4) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compression brotli/gzip des réponses complètes au-delà d'un seuil"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Retenu jusqu'au premier corps : les en-têtes dépendent de la compression
+                start_message = message
+                return
+            if start_message is None or message["type"] != "http.response.body":
+                return await send(message)
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            if message.get("more_body") or not self._compressible(start, body):
+                await send(start)
+                return await send(message)
+
+            if len(body) >= THREAD_COMPRESSION_SIZE:
+                body = await asyncio.to_thread(compress, body, encoding, self.gzip_level, self.brotli_quality)
+            else:
+                body = compress(body, encoding, self.gzip_level, self.brotli_quality)
+            start["headers"] = list(start.get("headers", []))
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _compressible(self, start, body: bytes) -> bool:
+        if len(body) < self.minimum_size or start["status"] in (204, 206, 304):
+            return False
+        headers = Headers(raw=start["headers"])
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
@@ -0,0 +1,391 @@
+"""
+Traçage de bout en bout des requêtes
+
+Une trace par requête HTTP (identifiant repris de l'en-tête W3C `traceparent`
+ou `X-Trace-Id` s'il est fourni, renvoyé dans `X-Trace-Id`), des spans
+imbriqués autour des phases : conversion du contexte, construction du prompt,
+sonde de santé Ollama, attente de la limite de concurrence, requête au modèle
+(découpée en chargement, prefill et décodage d'après les durées renvoyées par
+Ollama), post-traitement.
+
+    with tracer.span("prompt.build", agent=agent):
+        ...
+
+Le span courant suit le contexte asyncio (ContextVar) : les tâches créées
+pendant une requête s'y rattachent. Les traces terminées restent consultables
+en mémoire (/debug/traces/recent) et sont exportées par un thread d'arrière-
+plan vers un fichier JSONL ou un collecteur OTLP/HTTP (JSON).
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_TRACE_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def new_span_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def valid_trace_id(value: Optional[str]) -> Optional[str]:
+    """Identifiant de trace s'il est au format OTLP (32 hexadécimaux, non nul), None sinon"""
+    value = (value or "").strip().lower()
+    if _TRACE_ID_RE.fullmatch(value) and value != "0" * 32:
+        return value
+    return None
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[str]:
+    """Identifiant de trace d'un en-tête W3C `00-<trace id>-<span id>-<flags>`"""
+    parts = (header or "").split("-")
+    if len(parts) == 4:
+        return valid_trace_id(parts[1])
+    return None
+
+
+class Trace:
+    """Spans terminés d'une même trace, jusqu'à la fin du span racine"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.finished = False
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "start_wall", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None, start: Optional[float] = None):
+        self.trace = trace
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.start_wall = time.time() - (time.perf_counter() - self.start)
+        self.end: Optional[float] = None
+        self.attributes = dict(attributes or {})
+        self.error: Optional[str] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def duration_ms(self) -> float:
+        return round(((self.end or time.perf_counter()) - self.start) * 1000, 2)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Span d'une trace non échantillonnée (ou hors trace) : aucun coût ni effet"""
+
+    trace_id = None
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+# ==================== EXPORT ====================
+
+class BackgroundExporter:
+    """File bornée vidée par un thread démon ; file pleine : trace abandonnée et comptée"""
+
+    def __init__(self, max_queue: int = 1000):
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.exported = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, trace: Dict[str, Any]):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name=type(self).__name__, daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.export(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                logger.warning(f"⚠️ Export de traces échoué ({len(batch)}): {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def flush(self):
+        if self._thread is not None:
+            self.queue.join()
+
+    def export(self, batch: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+
+class JsonlExporter(BackgroundExporter):
+    """Une trace par ligne dans un fichier local"""
+
+    def __init__(self, path: str, max_queue: int = 1000):
+        super().__init__(max_queue)
+        self.path = path
+
+    def export(self, batch):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for trace in batch:
+                f.write(json.dumps(trace, ensure_ascii=False, default=str) + "\n")
+
+
+def to_otlp(traces: List[Dict[str, Any]], service_name: str = "atelier-backend") -> Dict[str, Any]:
+    """Traces au format OTLP/HTTP JSON (resourceSpans)"""
+    def attributes(values):
+        return [{"key": key, "value": {"stringValue": str(value)}} for key, value in values.items()]
+
+    spans = []
+    for trace in traces:
+        start_ns = int(trace["start_unix"] * 1e9)
+        for span in trace["spans"]:
+            span_start = start_ns + int(span["offset_ms"] * 1e6)
+            spans.append({
+                "traceId": trace["trace_id"],
+                "spanId": span["span_id"],
+                "parentSpanId": span["parent_id"] or "",
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(span_start),
+                "endTimeUnixNano": str(span_start + int(span["duration_ms"] * 1e6)),
+                "attributes": attributes(span["attributes"]),
+                "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1},
+            })
+    return {"resourceSpans": [{
+        "resource": {"attributes": attributes({"service.name": service_name})},
+        "scopeSpans": [{"scope": {"name": "app.utils.tracing"}, "spans": spans}],
+    }]}
+
+
+class OtlpHttpExporter(BackgroundExporter):
+    """Envoi à un collecteur OTLP/HTTP (JSON), par lots"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0, max_queue: int = 1000):
+        super().__init__(max_queue)
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, batch):
+        import httpx
+
+        httpx.post(self.endpoint, json=to_otlp(batch), timeout=self.timeout).raise_for_status()
+
+
+# ==================== TRACER ====================
+
+class Tracer:
+    """Création des spans, conservation des traces récentes et lentes, export"""
+
+    def __init__(self, exporters: Optional[List[BackgroundExporter]] = None, sample_rate: float = 1.0,
+                 slow_ms: float = 1000.0, recent_size: int = 200, enabled: bool = True):
+        self.exporters = list(exporters or [])
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.recent: deque = deque(maxlen=recent_size)
+        # Séparées des récentes : un afflux de requêtes rapides n'efface pas les lentes
+        self.slow: deque = deque(maxlen=recent_size)
+        self.traces = 0
+        self.late_spans = 0
+
+    def current_span(self):
+        return _current_span.get() or NOOP_SPAN
+
+    def current_trace_id(self) -> Optional[str]:
+        return self.current_span().trace_id
+
+    @contextmanager
+    def trace(self, name: str, trace_id: Optional[str] = None, **attributes) -> Iterator[Any]:
+        """Nouvelle trace (span racine), indépendante du span courant"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            token = _current_span.set(None)
+            try:
+                yield NOOP_SPAN
+            finally:
+                _current_span.reset(token)
+            return
+        root = Span(Trace(trace_id or new_trace_id()), name, attributes=attributes)
+        try:
+            with self._activate(root):
+                yield root
+        finally:
+            self._finish(root.trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Any]:
+        """Span enfant du span courant (sans effet hors trace)"""
+        parent = _current_span.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        with self._activate(Span(parent.trace, name, parent.span_id, attributes)) as span:
+            yield span
+
+    @contextmanager
+    def _activate(self, span: Span):
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current_span.reset(token)
+            self._close(span)
+
+    def record(self, name: str, start: float, end: float, **attributes):
+        """Span aux bornes déjà connues (perf_counter), rattaché au span courant"""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = Span(parent.trace, name, parent.span_id, attributes, start=start)
+        span.end = end
+        self._close(span)
+
+    def record_ollama_timings(self, data: Dict[str, Any], end: Optional[float] = None):
+        """
+        Découpe une réponse Ollama en chargement du modèle, prefill et décodage
+        (durées en ns renvoyées par /api/chat et /api/generate).
+        """
+        if _current_span.get() is None or not data.get("total_duration"):
+            return
+        end = end or time.perf_counter()
+        cursor = end - data["total_duration"] / 1e9
+        for name, key, count_key in (("ollama.load", "load_duration", None),
+                                     ("ollama.prefill", "prompt_eval_duration", "prompt_eval_count"),
+                                     ("ollama.decode", "eval_duration", "eval_count")):
+            duration = (data.get(key) or 0) / 1e9
+            attributes = {"tokens": data[count_key]} if count_key and count_key in data else {}
+            self.record(name, cursor, cursor + duration, **attributes)
+            cursor += duration
+
+    def _close(self, span: Span):
+        with self._lock:
+            if span.trace.finished:
+                # Tâche terminée après la réponse : la trace est déjà exportée
+                self.late_spans += 1
+            else:
+                span.trace.spans.append(span)
+
+    def _finish(self, trace: Trace):
+        with self._lock:
+            trace.finished = True
+            spans = sorted(trace.spans, key=lambda span: span.start)
+        root = next(span for span in spans if span.parent_id is None)
+        summary = {
+            "trace_id": trace.trace_id,
+            "name": root.name,
+            "start": datetime.fromtimestamp(root.start_wall, timezone.utc).isoformat(),
+            "start_unix": root.start_wall,
+            "duration_ms": root.duration_ms,
+            "attributes": root.attributes,
+            "error": root.error,
+            "spans": [span.to_dict(root.start) for span in spans],
+        }
+        with self._lock:
+            self.traces += 1
+            self.recent.append(summary)
+            if summary["duration_ms"] >= self.slow_ms:
+                self.slow.append(summary)
+        for exporter in self.exporters:
+            exporter.submit(summary)
+
+    def recent_traces(self, min_duration_ms: Optional[float] = None, limit: int = 20,
+                      name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Traces conservées les plus lentes d'abord (seuil par défaut : slow_ms)"""
+        threshold = self.slow_ms if min_duration_ms is None else min_duration_ms
+        with self._lock:
+            candidates = {trace["trace_id"]: trace for trace in list(self.slow) + list(self.recent)}
+        traces = [trace for trace in candidates.values()
+                  if trace["duration_ms"] >= threshold and (name is None or trace["name"] == name)]
+        return sorted(traces, key=lambda trace: trace["duration_ms"], reverse=True)[:limit]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "traces": self.traces,
+            "slow_traces": len(self.slow),
+            "late_spans": self.late_spans,
+            "exporters": {
+                type(exporter).__name__: {"exported": exporter.exported, "dropped": exporter.dropped}
+                for exporter in self.exporters
+            },
+        }
+
+
+def create_tracer() -> Tracer:
+    from .config import TRACING_CONFIG
+
+    exporters: List[BackgroundExporter] = []
+    if TRACING_CONFIG["exporter"] == "jsonl":
+        exporters.append(JsonlExporter(TRACING_CONFIG["jsonl_path"]))
+    elif TRACING_CONFIG["exporter"] == "otlp":
+        exporters.append(OtlpHttpExporter(TRACING_CONFIG["otlp_endpoint"]))
+    return Tracer(
+        exporters,
+        sample_rate=TRACING_CONFIG["sample_rate"],
+        slow_ms=TRACING_CONFIG["slow_ms"],
+        recent_size=TRACING_CONFIG["recent_size"],
+        enabled=TRACING_CONFIG["enabled"],
+    )
+
+
+# Instance globale
+tracer = create_tracer()
@@ -1,8 +1,11 @@
+import logging
 import uuid
 from datetime import datetime
 from enum import Enum
 from agent import query_agent
 
+logger = logging.getLogger(__name__)
+
 # ---- ENUM ÉTATS ----
 class WorkflowStatus(Enum):
     PENDING = "pending"
@@ -75,15 +78,9 @@ class WorkflowOrchestrator:
         return self.workflow_templates
 
     def suggest_workflow(self, user_request: str) -> str:
-        req = user_request.lower()
-        if "frontend" in req:
-            return "frontend_only"
-        elif "api" in req or "backend" in req:
-            return "backend_api"
-        elif "review" in req or "optimise" in req or "optimiser" in req or "analyse" in req:
-            return "code_review"
-        else:
-            return "full_development"
+        """Workflow le moins coûteux couvrant la demande (voir core/workflow_router.py)"""
+        from core.workflow_router import WorkflowRouter
+        return WorkflowRouter(self.workflow_templates).route(user_request, allow_agents=False)["workflow"]
 
     async def execute_workflow(
         self, workflow_type: str, user_request: str, context: dict = None,
@@ -93,7 +90,7 @@ class WorkflowOrchestrator:
             raise ValueError("Type de workflow inconnu")
 
         workflow_id = workflow_id or f"workflow_{uuid.uuid4().hex[:8]}"
-        print(f"[DEBUG] Workflow créé avec l'ID {workflow_id}")
+        logger.debug("Workflow créé", extra={"workflow_id": workflow_id, "workflow_type": workflow_type})
         context = context or {}
         steps_data = []
         agent_outputs = {}
@@ -157,8 +154,6 @@ class WorkflowOrchestrator:
         return workflow_id
 
     def get_workflow_status(self, workflow_id: str):
-        print("[DEBUG] IDs actuellement stockés :", list(self.running_workflows.keys()))
-        print(f"[DEBUG] Demande de status pour workflow_id: {workflow_id}")
         return self.running_workflows.get(workflow_id)
 
 # --- Singleton global ---
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark sérialisation JSON, compression et validation du contexte
+
+Charges réalistes de 50 à 500 Ko : contexte de conversation renvoyé par
+/chat (messages avec code), page de /workflows, fichiers inline de
+/ultra/workflow/{id}/files?include_content=true. Compare, par charge :
+
+- encodage : jsonable_encoder + json (JSONResponse par défaut de FastAPI)
+  contre FastJSONResponse renvoyée directement (orjson) ;
+- compression : taille et durée gzip / brotli (si installé) ;
+- validation de ChatMessage.context : ancienne union Dict | ConversationContext
+  contre le dict seul.
+
+Usage (depuis backend/) :
+    python scripts/json_bench.py
+    python scripts/json_bench.py --sizes 50,500 --json
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from app.main import ChatMessage, ConversationContext  # noqa: E402
+from app.utils.responses import FastJSONResponse, brotli, compress, orjson  # noqa: E402
+
+CODE = '''def handler(request):
+    """Traite une requête et renvoie la réponse sérialisée"""
+    payload = {"id": request.id, "items": [item.to_dict() for item in request.items]}
+    return JSONResponse(payload, status_code=200)
+'''
+
+WORDS = ("requête", "réponse", "contexte", "agent", "modèle", "fichier", "erreur", "cache", "latence", "route",
+         "tâche", "utilisateur", "session", "token", "workflow", "étape", "index", "page", "compression", "valeur")
+
+# Texte varié (identifiants, mots tirés au sort) : des copies identiques se compresseraient de façon irréaliste
+rng = random.Random(42)
+
+
+def prose(words: int) -> str:
+    return " ".join(rng.choice(WORDS) + (str(rng.randrange(1000)) if rng.random() < 0.2 else "") for _ in range(words))
+
+
+def code(index: int) -> str:
+    return CODE.replace("handler", f"handler_{index}_{rng.randrange(10**6)}").replace("payload", f"payload_{prose(1)}")
+
+
+class LegacyChatMessage(BaseModel):
+    """Forme de ChatMessage avant le passage au dict seul"""
+    message: str
+    context: Optional[Union[Dict[str, Any], ConversationContext]] = None
+
+
+def chat_context(target: int) -> Dict[str, Any]:
+    messages, size, turn = [], 0, 0
+    start = datetime(2026, 1, 1)
+    while size < target:
+        content = f"Tour {turn} : {prose(60)}\n```python\n{code(turn)}```\n{prose(40)}"
+        messages.append({"role": "user" if turn % 2 == 0 else "assistant", "content": content,
+                         "timestamp": (start + timedelta(seconds=turn)).isoformat()})
+        size += len(content) + 80
+        turn += 1
+    return {
+        "summary": "Refonte du backend FastAPI",
+        "recentMessages": messages,
+        "codeContext": ["app/main.py", "app/services/llm_provider.py"],
+        "objectives": ["latence", "lisibilité"],
+        "conversationId": "conv-42", "projectId": "atelier", "messageCount": turn,
+    }
+
+
+def workflow_page(target: int) -> Dict[str, Any]:
+    workflows, size = [], 0
+    while size < target:
+        index = len(workflows)
+        workflows.append({
+            "id": f"workflow_{index:08x}", "type": "full_development", "status": "completed",
+            "user_request": prose(30),
+            "start_time": datetime(2026, 1, 1, 12, index % 60).isoformat(), "progress": 100.0,
+            "steps_completed": 4, "current_step": None,
+            "memo": {"reused_steps": index % 3, "seconds_saved": 12.5},
+        })
+        size += 420
+    return {"success": True, "workflows": workflows, "count": len(workflows), "next_cursor": "eyJrIjoiIn0="}
+
+
+def ultra_files(target: int) -> Dict[str, Any]:
+    files, size = {}, 0
+    while size < target:
+        name = f"src/components/Component{len(files)}.jsx"
+        content = f"// {prose(20)}\nexport default function Component{len(files)}() {{\n  return <div>{code(len(files))}</div>;\n}}\n" * 2
+        files[name] = {"content": content, "language": "javascript", "path": name}
+        size += len(content)
+    return {"workflow_id": "ultra_1234", "files": files, "total_files": len(files)}
+
+
+def timed(func, repeat: int) -> float:
+    """Meilleur temps (ms) sur `repeat` exécutions"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench(name: str, payload: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    body = FastJSONResponse(payload).body
+    result = {
+        "payload": name,
+        "size_kb": round(len(body) / 1024, 1),
+        "encode_default_ms": timed(lambda: JSONResponse(jsonable_encoder(payload)), repeat),
+        "encode_fast_ms": timed(lambda: FastJSONResponse(payload), repeat),
+        "gzip_kb": round(len(compress(body, "gzip")) / 1024, 1),
+        "gzip_ms": timed(lambda: compress(body, "gzip"), repeat),
+    }
+    if brotli is not None:
+        result["br_kb"] = round(len(compress(body, "br")) / 1024, 1)
+        result["br_ms"] = timed(lambda: compress(body, "br"), repeat)
+    if name == "chat_context":
+        request = {"message": "Et ensuite ?", "context": payload}
+        result["validate_union_ms"] = timed(lambda: LegacyChatMessage.model_validate(request), repeat)
+        result["validate_dict_ms"] = timed(lambda: ChatMessage.model_validate(request), repeat)
+    return {key: round(value, 3) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Sérialisation JSON, compression et validation du contexte")
+    parser.add_argument("--sizes", default="50,200,500", help="tailles cibles en Ko")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="sortie JSON")
+    args = parser.parse_args()
+
+    builders = {"chat_context": chat_context, "workflow_page": workflow_page, "ultra_files": ultra_files}
+    results = [
+        bench(name, builder(int(size) * 1024), args.repeat)
+        for size in args.sizes.split(",") for name, builder in builders.items()
+    ]
+    if args.json:
+        print(json.dumps({"orjson": orjson is not None, "brotli": brotli is not None, "results": results}, indent=2))
+        return 0
+
+    print(f"⚡ Réponses JSON (orjson: {'oui' if orjson else 'non'}, brotli: {'oui' if brotli else 'non'})")
+    for r in results:
+        speedup = r["encode_default_ms"] / r["encode_fast_ms"] if r["encode_fast_ms"] else 0
+        line = (f"   {r['payload']:<14} {r['size_kb']:>6} Ko  encodage {r['encode_default_ms']:7.2f} -> "
+                f"{r['encode_fast_ms']:6.2f} ms (x{speedup:.1f})  gzip {r['gzip_kb']:>6} Ko en {r['gzip_ms']:.2f} ms")
+        if "br_kb" in r:
+            line += f"  br {r['br_kb']} Ko en {r['br_ms']:.2f} ms"
+        print(line)
+        if "validate_union_ms" in r:
+            print(f"   {'':<14} validation du contexte {r['validate_union_ms']:.3f} -> {r['validate_dict_ms']:.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Mesure de la réutilisation de préfixe entre tours de conversation
+
+Rejoue une conversation synthétique à travers build_agent_messages et
+update_context_with_response (le chemin de /chat) et affiche, pour chaque
+tour, la part du prompt identique au prompt précédent : c'est la portion dont
+Ollama peut réutiliser le cache KV au lieu de la recalculer (prefill).
+Les messages sont rendus comme le repli texte du fournisseur, proche de ce
+que produit le gabarit de chat du modèle.
+
+Usage (depuis backend/) :
+    python scripts/prefix_reuse.py
+    python scripts/prefix_reuse.py --turns 20 --agent reviewer --json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.main import build_agent_messages, update_context_with_response  # noqa: E402
+from app.services.llm_provider import flatten_history  # noqa: E402
+from app.utils.monitoring import PrefixReuseTracker  # noqa: E402
+
+QUESTIONS = [
+    "Comment structurer une API FastAPI pour un projet de taille moyenne ?",
+    "Et pour la gestion des erreurs ?",
+    "Peux-tu montrer un exemple de middleware ?",
+    "Comment tester ce middleware ?",
+    "Quelles métriques exposer ?",
+]
+
+
+def replay(turns: int, agent: str):
+    tracker = PrefixReuseTracker()
+    context = {
+        "projectId": "atelier-demo",
+        "codeContext": ["app/main.py", "app/services/llm_provider.py"],
+        "objectives": ["latence", "lisibilité"],
+    }
+    results = []
+    for turn in range(turns):
+        question = f"{QUESTIONS[turn % len(QUESTIONS)]} (tour {turn + 1})"
+        system, history, request = build_agent_messages(agent, question, context)
+        prompt = f"{system}\n{flatten_history(request, history)}"
+        ratio = tracker.record(agent, prompt)
+        results.append({"turn": turn + 1, "prompt_chars": len(prompt), "prefix_reuse": round(ratio, 3)})
+        answer = f"Réponse détaillée au tour {turn + 1}. " * 20
+        context = update_context_with_response(context, question, answer)
+    return results, tracker.get_stats()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Réutilisation de préfixe entre tours de conversation")
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--agent", default="assistant")
+    parser.add_argument("--json", action="store_true", help="sortie JSON")
+    args = parser.parse_args()
+
+    results, stats = replay(args.turns, args.agent)
+    if args.json:
+        print(json.dumps({"turns": results, "summary": stats}, indent=2, ensure_ascii=False))
+        return 0
+
+    print(f"🧠 Réutilisation de préfixe, agent {args.agent}, {args.turns} tours")
+    for result in results:
+        bar = "█" * int(result["prefix_reuse"] * 40)
+        print(f"   tour {result['turn']:>3}  {result['prompt_chars']:>6} car.  {result['prefix_reuse']:6.1%}  {bar}")
+    print(f"📊 Ratio global: {stats['prefix_reuse_ratio']:.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Profil de démarrage du backend
+
+Mesure le temps d'import de chaque module de backend/app dans un processus
+Python neuf (python -X importtime), liste les dépendances les plus lourdes et
+compare le démarrage à froid des points d'entrée uvicorn à un budget.
+
+Usage (depuis backend/) :
+    python scripts/startup_profile.py
+    python scripts/startup_profile.py --budget-ms 800 --runs 5
+    python scripts/startup_profile.py --json > startup.json
+
+Le code de sortie vaut 1 si un point d'entrée dépasse le budget.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ENTRYPOINTS = ["app.main", "app.ultra_simple_main"]
+DEFAULT_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1000"))
+
+
+def discover_modules() -> List[str]:
+    """Modules importables de backend/app (fichiers vides exclus)"""
+    modules = []
+    for path in sorted((BACKEND_DIR / "app").rglob("*.py")):
+        if path.name == "__init__.py" or path.stat().st_size == 0:
+            continue
+        relative = path.relative_to(BACKEND_DIR).with_suffix("")
+        modules.append(".".join(relative.parts))
+    return modules
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """Sortie de -X importtime -> {module: (self_us, cumulative_us)}"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            timings[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return timings
+
+
+def run_importtime(statement: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR), PYTHONDONTWRITEBYTECODE="1")
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+
+
+_interpreter_modules = None
+
+
+def interpreter_modules() -> set:
+    """Modules déjà chargés par l'interpréteur seul (site, encodings...), exclus du classement"""
+    global _interpreter_modules
+    if _interpreter_modules is None:
+        _interpreter_modules = set(parse_importtime(run_importtime("pass").stderr))
+    return _interpreter_modules
+
+
+def profile_module(module: str) -> Dict:
+    """Importe un module dans un interpréteur neuf et retourne ses temps (ms)"""
+    result = run_importtime(f"import {module}")
+    timings = parse_importtime(result.stderr)
+    if result.returncode != 0 or module not in timings:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import échoué"
+        return {"module": module, "ok": False, "error": error}
+
+    heaviest = sorted(
+        ((name, self_us) for name, (self_us, _) in timings.items()
+         if name != module and name not in interpreter_modules()),
+        key=lambda item: item[1], reverse=True
+    )[:5]
+    return {
+        "module": module,
+        "ok": True,
+        "cumulative_ms": timings[module][1] / 1000,
+        "heaviest": [{"module": name, "self_ms": self_us / 1000} for name, self_us in heaviest],
+    }
+
+
+def profile_entrypoint(module: str, runs: int) -> Dict:
+    """Médiane sur plusieurs démarrages à froid d'un point d'entrée"""
+    samples = []
+    for _ in range(runs):
+        result = profile_module(module)
+        if not result["ok"]:
+            return result
+        samples.append(result["cumulative_ms"])
+    result["cumulative_ms"] = statistics.median(samples)
+    result["samples_ms"] = samples
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Profil de démarrage du backend")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="budget de démarrage à froid par point d'entrée (ms)")
+    parser.add_argument("--runs", type=int, default=3, help="nombre de mesures par point d'entrée")
+    parser.add_argument("--entrypoints-only", action="store_true", help="ne pas profiler chaque module")
+    parser.add_argument("--json", action="store_true", help="sortie JSON")
+    args = parser.parse_args()
+
+    modules = [] if args.entrypoints_only else [profile_module(m) for m in discover_modules()]
+    entrypoints = [profile_entrypoint(m, args.runs) for m in ENTRYPOINTS]
+    over_budget = [e["module"] for e in entrypoints if not e["ok"] or e["cumulative_ms"] > args.budget_ms]
+
+    if args.json:
+        print(json.dumps({
+            "budget_ms": args.budget_ms,
+            "entrypoints": entrypoints,
+            "modules": modules,
+            "over_budget": over_budget,
+        }, indent=2, ensure_ascii=False))
+        return 1 if over_budget else 0
+
+    if modules:
+        print("📦 Temps d'import par module (processus neuf)")
+        for result in sorted(modules, key=lambda r: r.get("cumulative_ms", -1), reverse=True):
+            if result["ok"]:
+                heaviest = ", ".join(f"{h['module']} {h['self_ms']:.0f}ms" for h in result["heaviest"][:3])
+                print(f"   {result['cumulative_ms']:8.1f} ms  {result['module']:<40} ({heaviest})")
+            else:
+                print(f"   {'échec':>8}     {result['module']:<40} {result['error']}")
+        print()
+
+    print(f"🚀 Démarrage à froid (médiane de {args.runs}, budget {args.budget_ms:.0f} ms)")
+    for result in entrypoints:
+        if not result["ok"]:
+            print(f"   ❌ {result['module']}: {result['error']}")
+            continue
+        status = "✅" if result["cumulative_ms"] <= args.budget_ms else "❌"
+        print(f"   {status} {result['module']:<25} {result['cumulative_ms']:8.1f} ms")
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Tests de /agent/batch : validation, trame NDJSON, contexte partagé et annulation
+"""
+
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.llm_provider import StubProvider
+
+
+class AgentLatencyProvider(StubProvider):
+    """Stub dont la latence dépend de l'agent (ordre d'achèvement maîtrisé)"""
+
+    def __init__(self, latencies):
+        super().__init__()
+        self.latencies = latencies
+        self.cancelled = []
+
+    async def generate(self, model, prompt, *, system=None, options=None, agent=None, history=None) -> str:
+        self.calls.append({"agent": agent, "system": system, "history": history, "prompt": prompt})
+        try:
+            await asyncio.sleep(self.latencies.get(agent, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(agent)
+            raise
+        return f"[{agent}] ok"
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    # Les répertoires créés à l'import de l'application restent dans tmp_path
+    monkeypatch.chdir(tmp_path)
+    import app.main as main
+
+    provider = AgentLatencyProvider({"reviewer": 0.05, "debugger": 0.0, "optimizer": 5.0})
+    monkeypatch.setattr(main.ollama_service, "_provider", provider)
+    monkeypatch.setattr(main, "MAX_BATCH_JOBS", 3)
+    return main
+
+
+def lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+class TestBatchValidation:
+
+    @pytest.mark.parametrize("payload,detail", [
+        ({"message": "x", "agents": ["inconnu"]}, "Agents non disponibles"),
+        ({"code": "x", "analysis_types": ["magie"]}, "Analyses inconnues"),
+        ({"analysis_types": ["review"]}, "Le code est requis"),
+        ({"message": "x"}, "Aucun agent"),
+        ({"message": "x", "agents": ["reviewer", "debugger", "optimizer", "assistant"]}, "Maximum 3"),
+        ({"message": "  ", "agents": ["reviewer"]}, "Un message ou du code"),
+    ])
+    def test_invalid_batches_are_rejected(self, main, payload, detail):
+        response = TestClient(main.app).post("/agent/batch", json=payload)
+        assert response.status_code == 400
+        assert detail in response.json()["detail"]
+
+
+class TestBatchStream:
+
+    def test_results_are_framed_in_completion_order(self, main):
+        context = {"projectId": "atelier", "recentMessages": [{"role": "user", "content": "Bonjour"}]}
+        response = TestClient(main.app).post("/agent/batch", json={
+            "message": "Qu'en penses-tu ?", "code": "print(1)",
+            "agents": ["reviewer", "debugger"], "analysis_types": ["explain"], "context": context,
+        })
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+
+        events = lines(response)
+        assert events[0] == {"type": "batch_started", "batch_id": events[0]["batch_id"], "jobs": 3}
+        assert events[-1]["type"] == "batch_completed" and events[-1]["completed"] == 3
+        results = events[1:-1]
+        # Le plus lent (reviewer) arrive en dernier
+        assert [r["agent"] for r in results][-1] == "reviewer"
+        assert {r.get("analysis_type") for r in results} == {None, "explain"}
+        assert all(r["success"] for r in results)
+
+        # Contexte partagé : même historique et même contexte projet pour chaque agent
+        calls = main.ollama_service.provider.calls
+        assert all(call["history"] == calls[0]["history"] for call in calls)
+        assert all("PROJET: atelier" in call["system"] for call in calls)
+        assert all("print(1)" in call["prompt"] for call in calls)
+
+    @pytest.mark.asyncio
+    async def test_disconnect_cancels_pending_agents(self, main):
+        """Flux fermé avant la fin (client parti) : les agents en cours sont annulés"""
+        request = main.BatchAgentRequest(message="Analyse", agents=["debugger", "optimizer"])
+        response = await main.agent_batch(request)
+        stream = response.body_iterator
+
+        assert json.loads(await stream.__anext__())["type"] == "batch_started"
+        assert json.loads(await stream.__anext__())["agent"] == "debugger"
+        await stream.aclose()
+        await asyncio.sleep(0)
+
+        assert main.ollama_service.provider.cancelled == ["optimizer"]
@@ -0,0 +1,85 @@
+"""
+Tests de la propagation des annulations (déconnexion client)
+"""
+
+import asyncio
+import pytest
+
+from app.core.cancellation import CancellationMetrics, ClientDisconnected, run_until_disconnect
+
+
+class FakeRequest:
+    """Requête Starlette minimale : déconnectée après `disconnect_after` secondes"""
+
+    def __init__(self, disconnect_after=None):
+        self.disconnect_after = disconnect_after
+        self.created = asyncio.get_running_loop().time()
+
+    async def is_disconnected(self):
+        if self.disconnect_after is None:
+            return False
+        return asyncio.get_running_loop().time() - self.created >= self.disconnect_after
+
+
+class TestRunUntilDisconnect:
+
+    @pytest.mark.asyncio
+    async def test_returns_result_and_learns_duration(self):
+        metrics = CancellationMetrics()
+
+        async def generation():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        result = await run_until_disconnect(FakeRequest(), generation(), key="assistant",
+                                            poll_interval=0.01, metrics=metrics)
+        assert result == "ok"
+        assert metrics.expected_duration("assistant") >= 0.05
+
+    @pytest.mark.asyncio
+    async def test_disconnect_cancels_generation_and_counts_saved_seconds(self):
+        metrics = CancellationMetrics()
+        metrics.record_completed("assistant", 1.0)
+        state = {"cancelled": False}
+
+        async def generation():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        with pytest.raises(ClientDisconnected):
+            await run_until_disconnect(FakeRequest(disconnect_after=0.05), generation(), key="assistant",
+                                       poll_interval=0.01, metrics=metrics)
+
+        stats = metrics.stats()
+        assert state["cancelled"]
+        assert stats["cancelled"] == 1
+        assert 0.5 < stats["generation_seconds_saved"] < 1.0
+
+
+class TestSimulatedWorkflowStop:
+
+    @pytest.mark.asyncio
+    async def test_stop_does_not_count_simulated_steps_as_generation(self, tmp_path, monkeypatch):
+        """Étapes simulées (asyncio.sleep) : arrêt enregistré sur le workflow, pas dans les métriques"""
+        monkeypatch.chdir(tmp_path)
+        import app.main as main
+
+        metrics = CancellationMetrics()
+        monkeypatch.setattr(main, "cancellation_metrics", metrics)
+        orchestrator = main.WorkflowOrchestrator()
+        orchestrator.step_delay = 0.05
+
+        workflow_id = await orchestrator.start_workflow("debugging", "bug")
+        await asyncio.sleep(0.07)
+        task = orchestrator._tasks[workflow_id]
+        assert await orchestrator.stop_workflow(workflow_id)
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        workflow = orchestrator.running_workflows[workflow_id]
+        assert workflow["status"] == "stopped"
+        assert workflow["skipped_steps"] == 3
+        assert metrics.stats()["cancelled"] == 0
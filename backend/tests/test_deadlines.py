@@ -0,0 +1,160 @@
+"""
+Tests des échéances de requête et du rejet à l'admission
+"""
+
+import asyncio
+import json
+import time
+import pytest
+
+from app.core import deadlines
+from app.core.deadlines import deadline_scope, detached_deadline, narrow_deadline
+from app.services.llm_provider import (
+    ConcurrencyLimitMiddleware, DeadlineExceeded, LLMOverloadedError, OllamaProvider, StubProvider
+)
+
+
+class TestDeadlineScope:
+
+    def test_route_defaults_and_header_parsing(self):
+        rules = deadlines.parse_route_timeouts("/chat=120, /agent=180,/agent/batch=300")
+        assert deadlines.route_timeout("/agent/batch", rules) == 300
+        assert deadlines.route_timeout("/agent/execute", rules) == 180
+        assert deadlines.route_timeout("/health", rules) is None
+        assert deadlines.parse_timeout("2.5") == 2.5
+        assert deadlines.parse_timeout("-1") is None
+        assert deadlines.parse_timeout("abc") is None
+        with pytest.raises(ValueError):
+            deadlines.parse_route_timeouts("/chat=vite")
+
+    def test_scopes_only_narrow_and_are_restored(self):
+        assert deadlines.remaining() is None
+        with deadline_scope(10):
+            with deadline_scope(60):
+                assert deadlines.remaining() <= 10
+            narrow_deadline(1)
+            assert deadlines.remaining() <= 1
+            narrow_deadline(30)
+            assert deadlines.remaining() <= 1
+            with detached_deadline():
+                assert deadlines.remaining() is None
+            assert deadlines.remaining() <= 1
+        assert deadlines.remaining() is None
+
+    @pytest.mark.asyncio
+    async def test_tasks_inherit_the_request_deadline(self):
+        with deadline_scope(5):
+            inherited = await asyncio.create_task(_remaining())
+        assert 0 < inherited <= 5
+
+
+async def _remaining():
+    return deadlines.remaining()
+
+
+class TestAdmission:
+
+    async def _occupy(self, limiter):
+        """Occupe une place du limiteur (le temps de latence du stub)"""
+        task = asyncio.create_task(limiter.generate("m", "occupant"))
+        await asyncio.sleep(0)
+        return task
+
+    @pytest.mark.asyncio
+    async def test_requests_without_deadline_wait_their_turn(self):
+        limiter = ConcurrencyLimitMiddleware(StubProvider(latency=0.02), max_concurrency=1, max_queue=0)
+        results = await asyncio.gather(*(limiter.generate("m", f"p{i}") for i in range(3)))
+        assert len(results) == 3
+        assert limiter.shed == 0
+        assert limiter.service_time is not None
+
+    @pytest.mark.asyncio
+    async def test_shed_when_expected_wait_exceeds_deadline(self):
+        limiter = ConcurrencyLimitMiddleware(StubProvider(latency=0.2), max_concurrency=1)
+        limiter.service_time = 2.0
+        occupant = await self._occupy(limiter)
+
+        start = time.perf_counter()
+        with deadline_scope(1.0):
+            with pytest.raises(LLMOverloadedError) as error:
+                await limiter.generate("m", "trop tard")
+        assert time.perf_counter() - start < 0.05
+        assert error.value.retry_after == pytest.approx(2.0)
+        assert error.value.status_code == 503
+
+        # Échéance assez longue : admise, attend sa place
+        with deadline_scope(5.0):
+            assert await limiter.generate("m", "à temps")
+        await occupant
+        assert limiter.stats()["shed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_shed_when_queue_is_full(self):
+        limiter = ConcurrencyLimitMiddleware(StubProvider(latency=0.1), max_concurrency=1, max_queue=1)
+        occupant = await self._occupy(limiter)
+        with deadline_scope(5.0):
+            waiter = asyncio.create_task(limiter.generate("m", "en file"))
+            await asyncio.sleep(0)
+            with pytest.raises(LLMOverloadedError):
+                await limiter.generate("m", "de trop")
+        await asyncio.gather(occupant, waiter)
+
+    @pytest.mark.asyncio
+    async def test_deadline_reached_in_queue(self):
+        limiter = ConcurrencyLimitMiddleware(StubProvider(latency=0.3), max_concurrency=1)
+        occupant = await self._occupy(limiter)
+
+        start = time.perf_counter()
+        with deadline_scope(0.05):
+            with pytest.raises(DeadlineExceeded) as error:
+                await limiter.generate("m", "attend trop")
+        assert time.perf_counter() - start < 0.2
+        assert error.value.status_code == 504
+        assert limiter.waiting == 0
+        assert limiter.stats()["expired_in_queue"] == 1
+        await occupant
+
+
+class TestOllamaDeadline:
+
+    def _provider(self, handler):
+        import httpx
+
+        provider = OllamaProvider("http://ollama", timeout=120)
+        provider._client = httpx.AsyncClient(base_url="http://ollama", timeout=120,
+                                             transport=httpx.MockTransport(handler))
+        return provider
+
+    @pytest.mark.asyncio
+    async def test_remaining_time_replaces_fixed_timeout(self):
+        import httpx
+
+        seen = []
+
+        def handler(request):
+            seen.append(request.extensions["timeout"]["read"])
+            return httpx.Response(200, json={"message": {"content": "ok"}, "done": True})
+
+        provider = self._provider(handler)
+        await provider.generate("m", "sans échéance")
+        with deadline_scope(3):
+            await provider.generate("m", "avec échéance")
+        assert seen[0] == 120
+        assert 2 < seen[1] <= 3
+
+    @pytest.mark.asyncio
+    async def test_expired_deadline_skips_the_call(self):
+        import httpx
+
+        calls = []
+
+        def handler(request):
+            calls.append(json.loads(request.content))
+            return httpx.Response(200, json={"message": {"content": "ok"}, "done": True})
+
+        provider = self._provider(handler)
+        with deadline_scope(0.01):
+            await asyncio.sleep(0.02)
+            with pytest.raises(DeadlineExceeded):
+                await provider.generate("m", "trop tard")
+        assert calls == []
@@ -0,0 +1,140 @@
+"""
+Tests du WorkspaceWriter (écritures atomiques, déduplication, quotas) et des lectures en flux
+"""
+
+import io
+import os
+import tarfile
+import threading
+import zipfile
+import pytest
+
+from app.services.file_service import (
+    WorkspaceWriter, iter_archive, iter_file_range, iter_workspace_files, parse_range_header
+)
+
+
+class TestWorkspaceWriter:
+
+    @pytest.mark.asyncio
+    async def test_writes_and_skips_identical_content(self, tmp_path):
+        writer = WorkspaceWriter(str(tmp_path))
+        files = [("src/App.tsx", "export default App;"), ("src/styles/app.css", ".app {}")]
+
+        first = await writer.write_files("wf", files)
+        assert all(result["written"] for result in first)
+        assert (tmp_path / "wf" / "src" / "App.tsx").read_text() == "export default App;"
+
+        second = await writer.write_files("wf", files)
+        assert not any(result["written"] for result in second)
+        assert [r["hash"] for r in first] == [r["hash"] for r in second]
+
+        # Aucun fichier temporaire ne doit subsister
+        leftovers = [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith(".tmp")]
+        assert leftovers == []
+
+    @pytest.mark.asyncio
+    async def test_quota_is_enforced_per_workflow(self, tmp_path):
+        writer = WorkspaceWriter(str(tmp_path), max_files_per_workflow=2, max_bytes_per_workflow=10)
+
+        results = await writer.write_files("wf", [("a.txt", "x" * 11)])
+        assert "Quota d'espace" in results[0]["rejected"]
+        assert not (tmp_path / "wf" / "a.txt").exists()
+
+        # Les premiers fichiers du lot tiennent dans le quota, le dernier est écarté
+        results = await writer.write_files("wf", [("a.txt", "a"), ("b.txt", "b"), ("c.txt", "c")])
+        assert [r["written"] for r in results] == [True, True, False]
+        assert "Quota de fichiers" in results[2]["rejected"]
+        assert writer.usage("wf") == {"files": 2, "bytes": 2}
+
+        # Réécrire un fichier existant ne compte pas comme un fichier de plus
+        results = await writer.write_files("wf", [("a.txt", "aaaa")])
+        assert results[0]["written"]
+
+        await writer.write_files("other", [("a.txt", "a"), ("b.txt", "b")])
+        assert writer.usage("other") == {"files": 2, "bytes": 2}
+
+    @pytest.mark.asyncio
+    async def test_quota_counts_files_already_on_disk(self, tmp_path):
+        """Après un redémarrage (ou depuis un autre worker), l'index est amorcé depuis le disque"""
+        first = WorkspaceWriter(str(tmp_path), max_files_per_workflow=2, max_bytes_per_workflow=100)
+        await first.write_files("wf", [("a.txt", "a" * 10), ("b.txt", "b" * 10)])
+
+        restarted = WorkspaceWriter(str(tmp_path), max_files_per_workflow=2, max_bytes_per_workflow=100)
+        assert restarted.usage("wf") == {"files": 2, "bytes": 20}
+        results = await restarted.write_files("wf", [("a.txt", "a" * 10), ("c.txt", "c")])
+        assert results[0]["written"] is False
+        assert "Quota de fichiers" in results[1]["rejected"]
+        assert [entry["path"] for entry in restarted.list_files("wf")] == ["a.txt", "b.txt"]
+
+    @pytest.mark.asyncio
+    async def test_paths_are_confined_to_workflow_dir(self, tmp_path):
+        writer = WorkspaceWriter(str(tmp_path / "workspace"))
+
+        results = await writer.write_files("wf", [
+            ("ok.py", "x"), ("src/../../escape.txt", "nope"), ("../../escape.txt", "nope")
+        ])
+        assert results[0]["written"] and "rejected" not in results[0]
+        assert all("hors du workspace" in r["rejected"] for r in results[1:])
+        assert (tmp_path / "workspace" / "wf" / "ok.py").read_text() == "x"
+        assert not (tmp_path / "escape.txt").exists()
+        assert not (tmp_path / "workspace" / "escape.txt").exists()
+
+        with pytest.raises(ValueError):
+            await writer.write_files("../wf", [("ok.py", "x")])
+
+
+class TestStreamingReads:
+
+    def _populate(self, base, count=20, size=200_000):
+        for i in range(count):
+            path = base / "src" / f"file_{i}.txt"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(os.urandom(size // 2).hex().encode()[:size])
+
+    def test_zip_archive_is_streamed_in_chunks(self, tmp_path):
+        self._populate(tmp_path)
+        chunks = list(iter_archive(tmp_path, "zip", chunk_size=64 * 1024))
+
+        assert max(len(chunk) for chunk in chunks) < 2 * 64 * 1024
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+        assert len(archive.namelist()) == 20
+        assert archive.read("src/file_3.txt") == (tmp_path / "src" / "file_3.txt").read_bytes()
+
+    def test_tar_gz_archive(self, tmp_path):
+        self._populate(tmp_path, count=3, size=1000)
+        data = b"".join(iter_archive(tmp_path, "tar.gz"))
+
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            assert archive.getnames() == ["src/file_0.txt", "src/file_1.txt", "src/file_2.txt"]
+
+    def test_closing_the_stream_stops_the_producer(self, tmp_path):
+        self._populate(tmp_path)
+        stream = iter_archive(tmp_path, "zip", chunk_size=1024, max_pending=1)
+        next(stream)
+        producer = next(t for t in threading.enumerate() if t.name == f"archive-{tmp_path.name}")
+        stream.close()
+        producer.join(timeout=2)
+        assert not producer.is_alive()
+
+    def test_only_writer_temp_files_are_skipped(self, tmp_path):
+        for name in ("App.tsx", ".App.tsx.k2_x9qz0.tmp", ".env.tmp", ".cache.abcdefgh.tmp", "notes.tmp"):
+            (tmp_path / name).write_text("x")
+        names = [relative_path for _, relative_path in iter_workspace_files(tmp_path)]
+        # Seul le temporaire d'une cible présente est masqué
+        assert names == [".cache.abcdefgh.tmp", ".env.tmp", "App.tsx", "notes.tmp"]
+
+    def test_range_parsing(self):
+        assert parse_range_header(None, 100) is None
+        assert parse_range_header("bytes=0-9", 100) == (0, 9)
+        assert parse_range_header("bytes=90-", 100) == (90, 99)
+        assert parse_range_header("bytes=-10", 100) == (90, 99)
+        assert parse_range_header("bytes=50-500", 100) == (50, 99)
+        for invalid in ("bytes=100-", "bytes=5-1", "items=0-1", "bytes=-"):
+            with pytest.raises(ValueError):
+                parse_range_header(invalid, 100)
+
+    def test_file_range_reads_only_requested_bytes(self, tmp_path):
+        path = tmp_path / "data.txt"
+        path.write_bytes(b"0123456789")
+        assert b"".join(iter_file_range(path, 2, 5, chunk_size=2)) == b"2345"
@@ -0,0 +1,176 @@
+"""
+Tests de la passerelle OpenAI contre un serveur local compatible (stub)
+"""
+
+import asyncio
+import json
+import pytest
+from openai import AsyncOpenAI, RateLimitError
+
+from app.services.llm_gateway import ProviderGateway, RetryBudget, TokenBucket
+
+
+class StubOpenAIServer:
+    """Serveur HTTP minimal répondant à /v1/chat/completions selon un script de statuts"""
+
+    def __init__(self, statuses, chunks=("OK",)):
+        self.statuses = list(statuses)
+        self.chunks = list(chunks)
+        self.calls = 0
+        self.requests = []
+        self.server = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def base_url(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v1"
+
+    async def _handle(self, reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in head.decode().split("\r\n"):
+            if line.lower().startswith("content-length:"):
+                length = int(line.split(":", 1)[1])
+        request = json.loads(await reader.readexactly(length))
+        self.requests.append(request)
+
+        self.calls += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200 and request.get("stream"):
+            return await self._stream(writer, request)
+        if status == 200:
+            body = {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "stub",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "OK"}}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+            }
+        else:
+            body = {"error": {"message": "rate limited", "type": "rate_limit", "code": None}}
+        payload = json.dumps(body).encode()
+        writer.write(
+            f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\nretry-after: 0\r\nConnection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+        writer.close()
+
+    async def _stream(self, writer, request):
+        """Réponse SSE : un chunk par fragment, puis l'usage si demandé"""
+        events = [
+            {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+             "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+            for chunk in self.chunks
+        ]
+        if (request.get("stream_options") or {}).get("include_usage"):
+            events.append({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0,
+                           "model": "stub", "choices": [],
+                           "usage": {"prompt_tokens": 3, "completion_tokens": 7, "total_tokens": 10}})
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n")
+        try:
+            for event in events:
+                writer.write(f"data: {json.dumps(event)}\n\n".encode())
+                await writer.drain()
+            writer.write(b"data: [DONE]\n\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+def make_gateway(base_url, **kwargs):
+    client = AsyncOpenAI(api_key="test", base_url=base_url, max_retries=0)
+    return ProviderGateway(client, base_delay=0.01, **kwargs)
+
+
+class TestProviderGateway:
+
+    @pytest.mark.asyncio
+    async def test_retries_429_then_succeeds(self):
+        async with StubOpenAIServer([429, 429, 200]) as stub:
+            gateway = make_gateway(stub.base_url)
+            response = await gateway.chat_completion(
+                "quantum_developer", model="stub", messages=[{"role": "user", "content": "hi"}]
+            )
+
+        assert response.choices[0].message.content == "OK"
+        assert stub.calls == 3
+        assert gateway.metrics["retries"] == 2
+        assert gateway.metrics["rate_limited"] == 2
+
+    @pytest.mark.asyncio
+    async def test_retry_budget_limits_retry_storms(self):
+        async with StubOpenAIServer([429] * 10) as stub:
+            budget = RetryBudget(ratio=0.0, min_per_second=0.0, capacity=1.0)
+            gateway = make_gateway(stub.base_url, retry_budget=budget)
+            with pytest.raises(RateLimitError):
+                await gateway.chat_completion("a", model="stub", messages=[{"role": "user", "content": "x"}])
+
+        # Un seul retry autorisé par le budget, puis échec immédiat
+        assert stub.calls == 2
+        assert gateway.metrics["retry_budget_exhausted"] == 1
+
+    @pytest.mark.asyncio
+    async def test_per_agent_concurrency_limit(self):
+        gateway = ProviderGateway(client=None, agent_limits={"critique": 1})
+        semaphore = gateway._semaphore("critique")
+        async with semaphore:
+            assert semaphore.locked()
+        assert not gateway._semaphore("other").locked()
+
+    @pytest.mark.asyncio
+    async def test_stream_reservation_is_reconciled_with_usage(self):
+        """La réservation max_tokens d'un flux est restituée selon l'usage du dernier chunk"""
+        async with StubOpenAIServer([200], chunks=["Bon", "jour"]) as stub:
+            gateway = make_gateway(stub.base_url, tokens_per_minute=10_000)
+            chunks = [chunk async for chunk in gateway.stream_chat_completion(
+                "a", model="stub", max_tokens=4096, messages=[{"role": "user", "content": "hi"}]
+            )]
+
+        assert stub.requests[0]["stream_options"] == {"include_usage": True}
+        assert "".join(c.choices[0].delta.content for c in chunks if c.choices) == "Bonjour"
+        # Seuls les 10 tokens réellement consommés restent décomptés
+        assert gateway.token_bucket.tokens == pytest.approx(10_000 - 10, abs=5)
+
+    @pytest.mark.asyncio
+    async def test_stream_stopped_early_is_closed_and_refunded(self):
+        """Consommateur arrêté avant la fin : flux fermé, complétion non générée restituée"""
+        async with StubOpenAIServer([200], chunks=["x" * 40] * 50) as stub:
+            gateway = make_gateway(stub.base_url, tokens_per_minute=10_000)
+            stream = gateway.stream_chat_completion(
+                "a", model="stub", max_tokens=4096, messages=[{"role": "user", "content": "hi"}]
+            )
+            async for _ in stream:
+                break
+            await stream.aclose()
+
+        assert not gateway._semaphore("a").locked()
+        # Prompt (~0) + 40 caractères générés ≈ 10 tokens décomptés, pas 4096
+        assert gateway.token_bucket.tokens == pytest.approx(10_000 - 10, abs=5)
+
+    def test_client_is_built_on_first_use(self):
+        """Le client n'est créé qu'au premier accès, puis réutilisé"""
+        created = []
+        gateway = ProviderGateway(client_factory=lambda: created.append(1) or object())
+
+        assert created == []
+        assert gateway.client is gateway.client
+        assert created == [1]
+
+
+class TestTokenBucket:
+
+    @pytest.mark.asyncio
+    async def test_waits_when_empty(self):
+        bucket = TokenBucket(per_minute=600, capacity=1)  # 10 jetons/s
+        assert await bucket.acquire() == 0
+        waited = await bucket.acquire()
+        assert 0.05 < waited < 0.2
@@ -0,0 +1,266 @@
+"""
+Tests de l'abstraction fournisseur LLM et de ses middlewares
+"""
+
+import asyncio
+import json
+import pytest
+
+from app.services.llm_provider import (
+    AdaptiveNumPredictMiddleware, ConcurrencyLimitMiddleware, GenerationResult, LLMProviderError, LLMUnavailableError,
+    ModelListCacheMiddleware, OllamaProvider, OpenAICompatibleProvider, OutputLengthTracker,
+    StubProvider, build_messages, build_provider_stack, flatten_history
+)
+from app.utils.config import get_generation_profile
+from app.utils.monitoring import PerformanceMonitor
+
+
+class CountingProvider(StubProvider):
+    def __init__(self, fail=False, **kwargs):
+        super().__init__(**kwargs)
+        self.fail = fail
+        self.list_calls = 0
+
+    async def list_models(self):
+        self.list_calls += 1
+        if self.fail:
+            raise LLMUnavailableError("down")
+        return await super().list_models()
+
+
+class TruncatingProvider(StubProvider):
+    """Chaque réponse est coupée par num_predict (compteurs façon Ollama)"""
+
+    async def generate(self, model, prompt, *, system=None, options=None, agent=None, history=None) -> str:
+        text = await super().generate(model, prompt, system=system, options=options, agent=agent, history=history)
+        return GenerationResult(text, output_tokens=options["num_predict"], truncated=True)
+
+
+class TestProviderStack:
+
+    @pytest.mark.asyncio
+    async def test_model_list_is_cached(self):
+        inner = CountingProvider()
+        provider = ModelListCacheMiddleware(inner, ttl=60)
+
+        for _ in range(5):
+            assert await provider.is_available()
+        assert inner.list_calls == 1
+
+    @pytest.mark.asyncio
+    async def test_failures_are_cached_briefly(self):
+        inner = CountingProvider(fail=True)
+        provider = ModelListCacheMiddleware(inner, ttl=60, negative_ttl=60)
+
+        assert not await provider.is_available()
+        assert not await provider.is_available()
+        assert inner.list_calls == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self):
+        inner = StubProvider(latency=0.02)
+        provider = ConcurrencyLimitMiddleware(inner, max_concurrency=2)
+
+        start = asyncio.get_running_loop().time()
+        await asyncio.gather(*(provider.generate("m", f"p{i}") for i in range(4)))
+        elapsed = asyncio.get_running_loop().time() - start
+        assert elapsed >= 0.04
+
+    @pytest.mark.asyncio
+    async def test_metrics_and_streaming_through_full_stack(self):
+        monitor = PerformanceMonitor()
+        inner = StubProvider(chunk_size=4)
+        provider = build_provider_stack(inner, monitor=monitor, max_concurrency=2)
+
+        text = await provider.generate("m", "bonjour", agent="critique")
+        chunks = [chunk async for chunk in provider.stream("m", "bonjour", agent="critique")]
+
+        assert "".join(chunks) == text
+        assert monitor.get_stats()["agent_stats"]["critique"]["call_count"] == 2
+        assert inner.calls[0]["agent"] == "critique"
+
+
+class TestGenerationProfiles:
+
+    def test_max_tokens_is_mapped_to_num_predict_for_ollama(self):
+        """Ollama ignore max_tokens : l'alias doit devenir num_predict"""
+        provider = OllamaProvider("http://localhost:11434")
+        payload = provider._payload("m", "p", None, {"max_tokens": 300, "num_ctx": 2048}, False)
+        assert payload["options"] == {"num_predict": 300, "num_ctx": 2048}
+
+    def test_profile_is_mapped_for_openai(self):
+        request = OpenAICompatibleProvider._request("gpt", "p", None, get_generation_profile("architecte"))
+        assert request["max_tokens"] == 2000
+        assert request["temperature"] == 0.3
+        assert "num_ctx" not in request
+
+    def test_default_profile_leaves_stop_sequences_to_the_model(self):
+        """Jetons de fin propres à chaque famille de modèles : aucun n'est imposé à tous les agents"""
+        for role in ("architecte", "optimiseur", "inconnu"):
+            assert "stop" not in get_generation_profile(role)
+
+    @pytest.mark.asyncio
+    async def test_adaptive_num_predict_follows_observed_lengths(self):
+        inner = StubProvider()
+        tracker = OutputLengthTracker(min_samples=5, headroom=1.5, floor=16)
+        provider = AdaptiveNumPredictMiddleware(inner, tracker)
+        options = {"num_predict": 2000}
+
+        for _ in range(5):
+            await provider.generate("m", "court", options=options, agent="visionnaire")
+        assert inner.calls[0]["options"]["num_predict"] == 2000
+
+        await provider.generate("m", "court", options=options, agent="visionnaire")
+        adapted = inner.calls[-1]["options"]["num_predict"]
+        assert 16 <= adapted < 100
+        # Le plafond du profil n'est jamais dépassé et les options d'origine restent intactes
+        assert options == {"num_predict": 2000}
+        assert tracker.suggest("autre_agent", 800) == 800
+
+
+    @pytest.mark.asyncio
+    async def test_truncated_outputs_never_lower_the_limit(self):
+        """Sorties courtes en caractères mais coupées par la limite : elle ne baisse jamais"""
+        inner = TruncatingProvider()
+        tracker = OutputLengthTracker(min_samples=3, headroom=1.25, floor=16)
+        provider = AdaptiveNumPredictMiddleware(inner, tracker)
+        options = {"num_predict": 2000}
+
+        tracker.record("critique", 400)
+        tracker.record("critique", 400)
+        tracker.record("critique", 400)
+        for _ in range(6):
+            await provider.generate("m", "court", options=options, agent="critique")
+        limits = [call["options"]["num_predict"] for call in inner.calls]
+        assert limits[0] == 500
+        assert limits == sorted(limits) and limits[-1] > limits[0]
+        assert tracker.stats()["critique"]["truncated"] == 6
+
+    def test_tracker_falls_back_to_estimates_without_provider_counts(self):
+        tracker = OutputLengthTracker()
+        tracker.record("critique", 99, limit=100)
+        tracker.record("critique", 50, limit=100, truncated=True)
+        tracker.record("critique", 100, limit=100, truncated=False)
+        tracker.record("critique", 60, limit=100)
+        assert tracker.stats()["critique"] == {"samples": 4, "max_tokens_seen": 100, "truncated": 2}
+        assert sorted(tracker._samples["critique"]) == [60, 100, 100, 100]
+
+    @pytest.mark.asyncio
+    async def test_ollama_reports_eval_count_and_done_reason(self):
+        import httpx
+
+        lines = [{"message": {"content": "Bon"}, "done": False}, {"message": {"content": "jour"}, "done": False},
+                 {"message": {"content": ""}, "done": True, "done_reason": "length", "eval_count": 2}]
+
+        def handler(request):
+            if json.loads(request.content)["stream"]:
+                return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines))
+            return httpx.Response(200, json={"message": {"content": "Bonjour"}, "done": True,
+                                             "done_reason": "stop", "eval_count": 3})
+
+        provider = OllamaProvider("http://ollama")
+        provider._client = httpx.AsyncClient(base_url="http://ollama", transport=httpx.MockTransport(handler))
+        result = await provider.generate("m", "Salut")
+        assert (result, result.output_tokens, result.truncated) == ("Bonjour", 3, False)
+
+        chunks = [chunk async for chunk in provider.stream("m", "Salut")]
+        assert chunks == ["Bon", "jour"]
+        assert (chunks[-1].output_tokens, chunks[-1].truncated) == (2, True)
+
+
+class TestChatMessages:
+
+    HISTORY = [
+        {"role": "user", "content": "Bonjour"},
+        {"role": "assistant", "content": "Salut !"},
+        {"role": "tool", "content": "rôle inconnu"},
+        {"role": "user", "content": ""},
+    ]
+
+    def test_messages_keep_roles_in_order(self):
+        messages = build_messages("Et ensuite ?", "Tu es un expert.", self.HISTORY)
+        assert [m["role"] for m in messages] == ["system", "user", "assistant", "user", "user"]
+        assert messages[-1]["content"] == "Et ensuite ?"
+        assert flatten_history("Et ensuite ?", self.HISTORY).endswith("ASSISTANT: Salut !\nUSER: rôle inconnu\n\nEt ensuite ?")
+        assert flatten_history("seul") == "seul"
+
+    def _provider(self, handler):
+        import httpx
+
+        provider = OllamaProvider("http://ollama")
+        provider._client = httpx.AsyncClient(base_url="http://ollama", transport=httpx.MockTransport(handler))
+        return provider
+
+    @pytest.mark.asyncio
+    async def test_ollama_uses_chat_endpoint(self):
+        import httpx
+
+        seen = []
+
+        def handler(request):
+            seen.append((request.url.path, json.loads(request.content)))
+            return httpx.Response(200, json={"message": {"role": "assistant", "content": "ok"}, "done": True})
+
+        provider = self._provider(handler)
+        result = await provider.generate("m", "Et ensuite ?", system="S", history=self.HISTORY[:2],
+                                         options={"max_tokens": 10})
+        assert result == "ok"
+        path, payload = seen[0]
+        assert path == "/api/chat"
+        assert [m["role"] for m in payload["messages"]] == ["system", "user", "assistant", "user"]
+        assert payload["options"] == {"num_predict": 10}
+
+    @pytest.mark.asyncio
+    async def test_ollama_falls_back_to_generate_without_chat_endpoint(self):
+        """Ancien serveur sans /api/chat : prompt aplati sur /api/generate, puis plus de tentative chat"""
+        import httpx
+
+        paths = []
+
+        def handler(request):
+            paths.append(request.url.path)
+            if request.url.path == "/api/chat":
+                return httpx.Response(404, text="404 page not found")
+            body = json.loads(request.content)
+            assert "ASSISTANT: Salut !" in body["prompt"]
+            lines = [{"response": "o", "done": False}, {"response": "k", "done": True}]
+            if body["stream"]:
+                return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines))
+            return httpx.Response(200, json={"response": "ok", "done": True})
+
+        provider = self._provider(handler)
+        assert await provider.generate("m", "Et ensuite ?", history=self.HISTORY[:2]) == "ok"
+        assert provider.use_chat is False
+        chunks = [chunk async for chunk in provider.stream("m", "Et ensuite ?", history=self.HISTORY[:2])]
+        assert "".join(chunks) == "ok"
+        assert paths == ["/api/chat", "/api/generate", "/api/generate"]
+
+    @pytest.mark.asyncio
+    async def test_missing_model_is_not_mistaken_for_missing_endpoint(self):
+        import httpx
+
+        def handler(request):
+            return httpx.Response(404, json={"error": "model 'm' not found, try pulling it first"})
+
+        provider = self._provider(handler)
+        with pytest.raises(LLMProviderError, match="404"):
+            await provider.generate("m", "p")
+        assert provider.use_chat is True
+
+    def test_history_reaches_openai_messages(self):
+        request = OpenAICompatibleProvider._request("gpt", "p", "S", None, self.HISTORY[:2])
+        assert [m["role"] for m in request["messages"]] == ["system", "user", "assistant", "user"]
+
+    @pytest.mark.asyncio
+    async def test_previous_agent_output_goes_to_system_message(self):
+        """Sortie d'un autre agent : contexte du message système, jamais un tour assistant"""
+        from app.services.ollama_service import AdvancedOllamaService
+
+        provider = StubProvider(models=["deepseek-coder:6.7b"])
+        service = AdvancedOllamaService(provider)
+
+        await service.query_agent("architecte", "Conçois l'API", {"last_output": "Vision : un blog"})
+        call = provider.calls[-1]
+        assert "Vision : un blog" in call["system"]
+        assert not call["history"]
+        assert call["prompt"] == "Conçois l'API"
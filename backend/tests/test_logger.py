@@ -0,0 +1,81 @@
+"""
+Tests du pipeline de logs structurés (file non bloquante, échantillonnage)
+"""
+
+import io
+import json
+import logging
+import time
+import pytest
+
+from app.utils.logger import LoggingPipeline, parse_sampling
+
+
+class SlowStream(io.StringIO):
+    """Flux de sortie lent : une écriture synchrone bloquerait l'appelant"""
+
+    def write(self, text):
+        time.sleep(0.002)
+        return super().write(text)
+
+
+@pytest.fixture
+def pipeline():
+    root = logging.getLogger("test-pipeline")
+    root.propagate = False
+    stream = io.StringIO()
+    pipeline = LoggingPipeline(level="INFO", fmt="json", sampling={"/health": 0.0}, stream=stream)
+    pipeline.stream = stream
+    pipeline.install(root)
+    yield pipeline, root
+    pipeline.stop()
+    root.handlers.clear()
+
+
+class TestLoggingPipeline:
+
+    def test_json_records_with_extra_fields(self, pipeline):
+        pipeline, log = pipeline
+        log.info("GET %s 200", "/chat", extra={"route": "/chat", "duration_ms": 12.5})
+        pipeline.stop()
+        record = json.loads(pipeline.stream.getvalue().splitlines()[0])
+        assert record["msg"] == "GET /chat 200"
+        assert record["route"] == "/chat" and record["duration_ms"] == 12.5
+        assert record["level"] == "INFO"
+
+    def test_sampling_keeps_errors_and_level_switches_at_runtime(self, pipeline):
+        pipeline, log = pipeline
+        log.info("santé", extra={"route": "/health"})
+        log.error("santé en échec", extra={"route": "/health"})
+        log.debug("détail")
+        pipeline.configure(level="debug")
+        log.debug("détail visible")
+        pipeline.stop()
+
+        messages = [json.loads(line)["msg"] for line in pipeline.stream.getvalue().splitlines()]
+        assert messages == ["santé en échec", "détail visible"]
+        assert pipeline.stats()["sampled_out"] == 1
+        with pytest.raises(ValueError):
+            pipeline.configure(level="BAVARD")
+
+    def test_slow_output_does_not_block_and_full_queue_drops(self):
+        log = logging.getLogger("test-pipeline-slow")
+        log.propagate = False
+        pipeline = LoggingPipeline(fmt="text", queue_size=50, stream=SlowStream()).install(log)
+        try:
+            start = time.perf_counter()
+            for i in range(500):
+                log.info("requête %d", i)
+            elapsed = time.perf_counter() - start
+        finally:
+            pipeline.stop()
+            log.handlers.clear()
+        # 500 écritures synchrones prendraient ~1 s ; la file rend la main aussitôt
+        assert elapsed < 0.2
+        assert pipeline.handler.dropped > 0
+
+    def test_parse_sampling(self):
+        assert parse_sampling("/health=0.01, /system/status=2") == {"/health": 0.01, "/system/status": 1.0}
+        assert parse_sampling("") == {}
+        with pytest.raises(ValueError):
+            parse_sampling("/health=souvent")
@@ -0,0 +1,45 @@
+"""
+Tests de la politique de routage brouillon / modèle spécialiste
+"""
+
+from app.core.model_routing import ModelRoutingPolicy, heuristic_classifier, model_size_billions
+
+
+class TestModelRouting:
+
+    def setup_method(self):
+        self.policy = ModelRoutingPolicy("qwen2.5:3b", threshold=0.5)
+
+    def test_simple_question_stays_on_draft_model(self):
+        decision = self.policy.decide("assistant", "Bonjour, tu vas bien ?", "deepseek-r1:8b")
+        assert decision["refine"] is False
+        assert decision["refine_model"] is None
+        assert decision["draft_model"] == "qwen2.5:3b"
+
+    def test_code_and_traceback_need_specialist(self):
+        message = "Pourquoi ça plante ?\n```python\ndef f(x):\n    return x / 0\n```\nZeroDivisionError"
+        decision = self.policy.decide("debugger", message, "deepseek-coder:6.7b")
+        assert decision["refine"] is True
+        assert decision["refine_model"] == "deepseek-coder:6.7b"
+        assert "contient du code" in decision["reasons"]
+
+    def test_no_refinement_without_a_bigger_model(self):
+        long_message = "Conçois l'architecture " + "détaillée " * 100
+        assert self.policy.decide("architecte", long_message, "qwen2.5:3b")["refine"] is False
+        assert self.policy.decide("architecte", long_message, "qwen2.5:1.5b")["refine"] is False
+        # Brouillon non installé : une seule génération, sur le modèle spécialiste
+        decision = self.policy.decide("architecte", long_message, "deepseek-r1:8b", available_models=["deepseek-r1:8b"])
+        assert decision["refine"] is False
+        assert decision["draft_model"] == "deepseek-r1:8b"
+
+    def test_custom_classifier_and_stats(self):
+        policy = ModelRoutingPolicy("qwen2.5:3b", classifier=lambda message, agent: (0.9, ["toujours"]))
+        assert policy.decide("assistant", "ok", "deepseek-r1:8b")["refine"] is True
+        self.policy.decide("assistant", "merci", "deepseek-r1:8b")
+        assert self.policy.stats()["draft_only_ratio"] == 1.0
+
+    def test_helpers(self):
+        assert model_size_billions("deepseek-coder:6.7b") == 6.7
+        assert model_size_billions("llama3-chatqa:latest") is None
+        score, _ = heuristic_classifier("Optimise cet algorithme ? Et la complexité ?", "optimizer")
+        assert score >= 0.5
@@ -0,0 +1,26 @@
+"""
+Tests des métriques de monitoring (réutilisation de préfixe des prompts)
+"""
+
+from app.utils.monitoring import PrefixReuseTracker, common_prefix_length
+
+
+class TestPrefixReuse:
+
+    def test_common_prefix_length(self):
+        assert common_prefix_length("abcdef", "abcxyz") == 3
+        assert common_prefix_length("abc", "abc") == 3
+        assert common_prefix_length("", "abc") == 0
+        assert common_prefix_length("xbc", "abc") == 0
+
+    def test_ratio_per_model(self):
+        tracker = PrefixReuseTracker()
+        assert tracker.record("qwen", "SYSTEM\nHISTO\nDEMANDE 1") == 0.0
+        ratio = tracker.record("qwen", "SYSTEM\nHISTO\nDEMANDE 1\nREPONSE\nDEMANDE 2")
+        assert ratio > 0.5
+        # Un autre modèle a son propre cache
+        assert tracker.record("mistral", "SYSTEM\nHISTO") == 0.0
+
+        stats = tracker.get_stats()
+        assert stats["by_model"]["qwen"]["prompts"] == 2
+        assert 0 < stats["prefix_reuse_ratio"] < 1
@@ -0,0 +1,123 @@
+"""
+Tests des réponses JSON rapides et de la compression négociée
+"""
+
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app.utils.responses import CompressionMiddleware, FastJSONResponse, dumps_json, negotiate_encoding
+
+
+class Item(BaseModel):
+    name: str
+    tags: set
+
+
+@pytest.fixture
+def client():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/large")
+    async def large():
+        return FastJSONResponse({"items": ["élément"] * 500})
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse((b"x" * 2048 for _ in range(3)), media_type="application/x-ndjson")
+
+    @app.get("/partial")
+    async def partial():
+        return FastJSONResponse({"data": "x" * 4096}, status_code=206,
+                                headers={"Content-Range": "bytes 0-4095/8192"})
+
+    return TestClient(app)
+
+
+class TestFastJSON:
+
+    def test_dumps_native_and_fallback_types(self):
+        payload = {
+            "when": datetime(2026, 1, 2, 3, 4, 5),
+            "item": Item(name="a", tags={"x"}),
+            1: "clé entière",
+            "texte": "éàü",
+        }
+        assert json.loads(dumps_json(payload)) == {
+            "when": "2026-01-02T03:04:05",
+            "item": {"name": "a", "tags": ["x"]},
+            "1": "clé entière",
+            "texte": "éàü",
+        }
+
+    def test_default_response_class_serializes_dicts(self, client):
+        response = client.get("/small")
+        assert response.json() == {"ok": True}
+        assert "content-encoding" not in response.headers
+
+
+class TestCompression:
+
+    @pytest.mark.parametrize("header,brotli_available,expected", [
+        ("gzip, deflate, br", True, "br"),
+        ("gzip, deflate, br", False, "gzip"),
+        ("br;q=0, gzip;q=0.5", True, "gzip"),
+        ("identity", True, None),
+        ("*", False, "gzip"),
+        ("gzip;q=0", False, None),
+        ("", True, None),
+    ])
+    def test_negotiation(self, header, brotli_available, expected):
+        assert negotiate_encoding(header, brotli_available) == expected
+
+    def test_large_json_is_compressed(self, client):
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert int(response.headers["content-length"]) < len(dumps_json({"items": ["élément"] * 500}))
+        assert response.json()["items"][0] == "élément"
+
+    def test_identity_request_is_untouched(self, client):
+        response = client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert len(response.json()["items"]) == 500
+
+    def test_streams_and_partial_content_are_not_compressed(self, client):
+        stream = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in stream.headers
+        assert stream.content == b"x" * 6144
+
+        partial = client.get("/partial", headers={"Accept-Encoding": "gzip"})
+        assert partial.status_code == 206
+        assert "content-encoding" not in partial.headers
+
+    @pytest.mark.asyncio
+    async def test_large_bodies_compressed_off_loop(self):
+        """Au-delà de THREAD_COMPRESSION_SIZE, corps compressé dans un thread, même résultat"""
+        body = dumps_json({"data": [f"ligne {i}" for i in range(40000)]})
+        sent = []
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": body})
+
+        async def send(message):
+            sent.append(message)
+
+        middleware = CompressionMiddleware(app)
+        await middleware({"type": "http", "headers": [(b"accept-encoding", b"gzip")]}, None, send)
+        assert len(body) > 256 * 1024
+        assert gzip.decompress(sent[1]["body"]) == body
+        assert (b"content-encoding", b"gzip") in sent[0]["headers"]
@@ -0,0 +1,134 @@
+"""
+Tests du provisionnement des modèles (téléchargements parallèles, reprise, tests par modèle)
+"""
+
+import asyncio
+import json
+import httpx
+import pytest
+
+from app.services.setup_ollama import IntegratedOllamaSetup, PullProgress
+from app.utils.config import AGENT_ROLES
+
+
+def pull_lines(model, *, success=True, layers=2, size=1000):
+    lines = [{"status": "pulling manifest"}]
+    for index in range(layers):
+        digest = f"sha256:{model}-{index}"
+        lines.append({"status": f"pulling {digest}", "digest": digest, "total": size, "completed": size // 2})
+        lines.append({"status": f"pulling {digest}", "digest": digest, "total": size, "completed": size})
+    if success:
+        lines.append({"status": "success"})
+    return "\n".join(json.dumps(line) for line in lines).encode()
+
+
+def make_setup(handler, **kwargs):
+    setup = IntegratedOllamaSetup(state={}, **kwargs)
+    setup.transport = httpx.MockTransport(handler)
+    setup.retry_delay = 0
+    return setup
+
+
+class TestModelPulls:
+
+    @pytest.mark.asyncio
+    async def test_pulls_run_in_parallel_up_to_limit(self):
+        in_flight, peak, pulled = 0, 0, []
+
+        async def handler(request):
+            nonlocal in_flight, peak
+            model = json.loads(request.content)["name"]
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.02)
+            in_flight -= 1
+            pulled.append(model)
+            return httpx.Response(200, content=pull_lines(model))
+
+        setup = make_setup(handler, pull_concurrency=2)
+        models = ["a:1b", "b:1b", "c:1b", "d:1b"]
+        success, failed = await setup.pull_models(models)
+
+        assert success and failed == []
+        assert sorted(pulled) == models
+        assert peak == 2
+        assert all(setup.state[model]["status"] == "installed" for model in models)
+
+    @pytest.mark.asyncio
+    async def test_interrupted_stream_is_retried_and_resumed(self):
+        attempts = []
+
+        def handler(request):
+            attempts.append(request)
+            return httpx.Response(200, content=pull_lines("m", success=len(attempts) > 1))
+
+        setup = make_setup(handler)
+        assert await setup.pull_model_with_progress("m:7b") is True
+        assert len(attempts) == 2
+        assert setup.state["m:7b"]["status"] == "installed"
+        assert setup.state["m:7b"]["attempts"] == 2
+
+    @pytest.mark.asyncio
+    async def test_definitive_error_is_not_retried(self):
+        attempts = []
+
+        def handler(request):
+            attempts.append(request)
+            return httpx.Response(200, content=b'{"error": "pull model manifest: file does not exist"}')
+
+        setup = make_setup(handler)
+        success, failed = await setup.pull_models(["inconnu:1b"])
+        assert (success, failed) == (False, ["inconnu:1b"])
+        assert len(attempts) == 1
+        assert setup.interrupted_pulls() == ["inconnu:1b"]
+
+    @pytest.mark.asyncio
+    async def test_interrupted_models_resume_first(self):
+        order = []
+
+        def handler(request):
+            model = json.loads(request.content)["name"]
+            order.append(model)
+            return httpx.Response(200, content=pull_lines(model))
+
+        setup = make_setup(handler, pull_concurrency=1)
+        setup.state["qwen2.5:3b"] = {"status": "pulling", "completed": 500, "total": 2000}
+        await setup.pull_models(["deepseek-r1:8b", "qwen2.5:3b", "mistral:7b"])
+
+        # Modèle entamé d'abord, puis du plus gros au plus petit
+        assert order == ["qwen2.5:3b", "deepseek-r1:8b", "mistral:7b"]
+        assert setup.interrupted_pulls() == []
+
+    def test_progress_aggregates_layers_across_models(self):
+        progress = PullProgress(["a", "b"])
+        progress.update("a", {"digest": "x", "completed": 50, "total": 100})
+        progress.update("a", {"digest": "y", "completed": 100, "total": 100})
+        progress.update("b", {"digest": "z", "completed": 0, "total": 200})
+        progress.update("b", {"status": "verifying sha256 digest"})
+
+        snapshot = progress.snapshot()
+        assert (snapshot["completed"], snapshot["total"]) == (150, 400)
+        assert snapshot["models"]["a"]["percent"] == 75.0
+        assert progress.report() is True
+        assert progress.report() is False
+
+
+class TestAgentModelTests:
+
+    @pytest.mark.asyncio
+    async def test_one_generation_per_unique_model(self):
+        generated = []
+
+        def handler(request):
+            model = json.loads(request.content)["model"]
+            generated.append(model)
+            return httpx.Response(200, json={"response": "" if model == "deepseek-r1:8b" else "OK"})
+
+        setup = make_setup(handler)
+        results = await setup.test_agent_models()
+
+        unique_models = {info["model"] for info in AGENT_ROLES.values()}
+        assert sorted(generated) == sorted(unique_models)
+        assert list(results) == list(AGENT_ROLES)
+        for role, info in AGENT_ROLES.items():
+            assert results[role] is (info["model"] != "deepseek-r1:8b")
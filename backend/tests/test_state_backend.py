@@ -0,0 +1,122 @@
+"""
+Tests du backend d'état partagé (mémoire et SQLite multi-workers)
+"""
+
+import threading
+import pytest
+
+from app.core.state_backend import MemoryStateBackend, SQLiteStateBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryStateBackend()
+    else:
+        backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+    yield backend
+    backend.close()
+
+
+class TestStateBackend:
+
+    def test_namespace_behaves_like_a_dict(self, backend):
+        workflows = backend.namespace("workflows")
+        workflows["wf1"] = {"status": "running", "steps": []}
+
+        assert "wf1" in workflows
+        assert len(workflows) == 1
+        assert workflows.get("absent") is None
+        assert workflows.update_item("wf1", status="completed")["status"] == "completed"
+        assert workflows["wf1"] == {"status": "completed", "steps": []}
+        assert workflows.update_item("absent", status="x") is None
+
+    def test_values_are_copies(self, backend):
+        """Modifier une valeur lue ne change pas l'état stocké"""
+        config = backend.namespace("config")
+        config["models"] = {"default": "a"}
+        config["models"]["default"] = "b"
+        assert config["models"]["default"] == "a"
+
+    def test_concurrent_modify_loses_no_update(self, backend):
+        counters = backend.namespace("counters")
+
+        def worker():
+            for _ in range(50):
+                counters.modify("hits", lambda value: value + 1, default=0)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert counters["hits"] == 200
+
+
+class TestSQLiteSharing:
+
+    def test_two_workers_share_state(self, tmp_path):
+        """Deux instances sur le même fichier simulent deux workers uvicorn"""
+        path = str(tmp_path / "state.db")
+        worker_a, worker_b = SQLiteStateBackend(path), SQLiteStateBackend(path)
+
+        worker_a.set("config", "default_model", "mistral:7b")
+        worker_a.set("main_workflows", "wf1", {"status": "running"})
+        worker_b.update("main_workflows", "wf1", status="stopped")
+
+        assert worker_b.get("config", "default_model") == "mistral:7b"
+        assert worker_a.get("main_workflows", "wf1") == {"status": "stopped"}
+        assert worker_b.count("main_workflows") == 1
+
+        worker_a.close()
+        worker_b.close()
+
+
+class TestSecondaryIndexes:
+
+    def fill(self, backend, count=25):
+        workflows = backend.namespace("workflows").create_index(("status", "type"), "created_at")
+        for i in range(count):
+            workflows[f"wf{i:02d}"] = {
+                "status": "completed" if i % 3 else "running",
+                "type": "backend_api" if i % 2 else "code_review",
+                "created_at": f"2026-01-01T00:{i:02d}:00",
+            }
+        return workflows
+
+    def test_cursor_pages_cover_everything_once(self, backend):
+        workflows = self.fill(backend)
+        seen, cursor = [], None
+        while True:
+            page, cursor = workflows.query(cursor=cursor, limit=10)
+            seen += [key for key, _ in page]
+            if cursor is None:
+                break
+        assert seen == [f"wf{i:02d}" for i in reversed(range(25))]
+
+    def test_filters_and_time_range(self, backend):
+        workflows = self.fill(backend)
+        page, cursor = workflows.query({"status": "running", "type": "code_review"}, limit=50)
+        assert [key for key, _ in page] == ["wf24", "wf18", "wf12", "wf06", "wf00"]
+        assert cursor is None
+
+        page, _ = workflows.query({"status": "running"}, since="2026-01-01T00:06:00", until="2026-01-01T00:18:00")
+        assert [key for key, _ in page] == ["wf15", "wf12", "wf09", "wf06"]
+
+    def test_index_follows_updates_and_deletes(self, backend):
+        workflows = self.fill(backend, count=3)
+        workflows.update_item("wf00", status="completed")
+        del workflows["wf01"]
+        assert [key for key, _ in workflows.query({"status": "running"})[0]] == []
+        assert [key for key, _ in workflows.query({"status": "completed"})[0]] == ["wf02", "wf00"]
+
+    def test_existing_values_are_indexed_and_bad_queries_rejected(self, backend):
+        legacy = backend.namespace("legacy")
+        legacy["a"] = {"status": "failed", "created_at": "1"}
+        legacy.create_index(("status",))
+        assert [key for key, _ in legacy.query({"status": "failed"})[0]] == ["a"]
+        with pytest.raises(ValueError):
+            legacy.query({"type": "x"})
+        with pytest.raises(ValueError):
+            legacy.query(cursor="pas-un-curseur")
@@ -0,0 +1,80 @@
+"""
+Tests du superviseur de tâches (concurrence bornée, timeouts, annulation)
+"""
+
+import asyncio
+import pytest
+
+from app.core.task_supervisor import TaskSupervisor, CANCELLED, COMPLETED, TIMEOUT
+
+
+class TestTaskSupervisor:
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self):
+        supervisor = TaskSupervisor(max_workers=2)
+        active, peak = 0, 0
+
+        async def job():
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+        for i in range(6):
+            assert supervisor.submit(f"job-{i}", job)
+        await asyncio.sleep(0.1)
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_duplicate_submission_is_ignored(self):
+        supervisor = TaskSupervisor()
+        runs = []
+
+        async def job():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+
+        assert supervisor.submit("wf", job)
+        assert not supervisor.submit("wf", job)
+        await asyncio.sleep(0.05)
+        assert len(runs) == 1
+
+    @pytest.mark.asyncio
+    async def test_timeout_and_cancel_reach_callback(self):
+        supervisor = TaskSupervisor(default_timeout=0.01)
+        outcomes = {}
+
+        async def forever():
+            await asyncio.sleep(10)
+
+        def finished(task_id, status, error):
+            outcomes[task_id] = status
+
+        supervisor.submit("slow", forever, on_finished=finished)
+        supervisor.submit("stopped", forever, timeout=10, on_finished=finished)
+        supervisor.submit("quick", lambda: asyncio.sleep(0), on_finished=finished)
+        await asyncio.sleep(0)
+        assert supervisor.cancel("stopped")
+        await asyncio.sleep(0.05)
+
+        assert outcomes == {"slow": TIMEOUT, "stopped": CANCELLED, "quick": COMPLETED}
+        assert supervisor.stats()["active"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cancellation_is_recorded_then_propagated(self):
+        """Arrêt du superviseur : callback avec CANCELLED, et la tâche finit bien annulée"""
+        supervisor = TaskSupervisor()
+        outcomes = {}
+
+        async def forever():
+            await asyncio.sleep(10)
+
+        supervisor.submit("wf", forever, on_finished=lambda task_id, status, error: outcomes.update({task_id: status}))
+        task = supervisor._tasks["wf"]
+        await asyncio.sleep(0)
+        await supervisor.shutdown()
+
+        assert task.cancelled()
+        assert outcomes == {"wf": CANCELLED}
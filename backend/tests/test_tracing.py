@@ -0,0 +1,144 @@
+"""
+Tests du traçage par requête (spans par phase, traces lentes, export)
+"""
+
+import asyncio
+import json
+import time
+import pytest
+
+from app.utils.tracing import JsonlExporter, Tracer, parse_traceparent, to_otlp, valid_trace_id
+
+
+class TestTracer:
+
+    def test_nested_spans_share_trace_and_parents(self):
+        tracer = Tracer(slow_ms=0)
+        with tracer.trace("POST /chat", trace_id="a" * 32) as root:
+            with tracer.span("prompt.build") as build:
+                assert tracer.current_trace_id() == "a" * 32
+            with tracer.span("llm.generate") as generate:
+                with tracer.span("ollama.request") as request:
+                    pass
+
+        trace = tracer.recent_traces(min_duration_ms=0)[0]
+        spans = {span["name"]: span for span in trace["spans"]}
+        assert trace["trace_id"] == "a" * 32
+        assert spans["prompt.build"]["parent_id"] == root.span_id
+        assert spans["ollama.request"]["parent_id"] == generate.span_id
+        assert build.span_id != request.span_id
+        assert tracer.current_trace_id() is None
+
+    def test_error_recorded_and_trace_finished(self):
+        tracer = Tracer()
+        with pytest.raises(ValueError):
+            with tracer.trace("GET /boom"):
+                with tracer.span("step"):
+                    raise ValueError("échec")
+
+        trace = tracer.recent_traces(min_duration_ms=0)[0]
+        assert trace["error"] == "ValueError: échec"
+        assert trace["spans"][1]["error"] == "ValueError: échec"
+
+    def test_ollama_timings_split_into_phases(self):
+        tracer = Tracer()
+        with tracer.trace("llm"):
+            tracer.record_ollama_timings({
+                "total_duration": 3_000_000_000, "load_duration": 1_000_000_000,
+                "prompt_eval_duration": 500_000_000, "prompt_eval_count": 120,
+                "eval_duration": 1_500_000_000, "eval_count": 80,
+            })
+
+        spans = {span["name"]: span for span in tracer.recent_traces(min_duration_ms=0)[0]["spans"]}
+        assert spans["ollama.load"]["duration_ms"] == pytest.approx(1000, abs=1)
+        assert spans["ollama.prefill"]["attributes"] == {"tokens": 120}
+        assert spans["ollama.decode"]["duration_ms"] == pytest.approx(1500, abs=1)
+        assert spans["ollama.decode"]["offset_ms"] > spans["ollama.prefill"]["offset_ms"]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_keep_separate_traces(self):
+        """Chaque tâche asyncio a son propre span courant"""
+        tracer = Tracer()
+
+        async def handle(name):
+            with tracer.trace(name):
+                with tracer.span("agent.query"):
+                    await asyncio.sleep(0.01)
+                return tracer.current_trace_id()
+
+        first, second = await asyncio.gather(handle("a"), handle("b"))
+        assert first != second
+        assert all(len(trace["spans"]) == 2 for trace in tracer.recent_traces(min_duration_ms=0))
+
+    def test_recent_traces_slowest_first_above_threshold(self):
+        tracer = Tracer(slow_ms=20)
+        with tracer.trace("fast"):
+            pass
+        with tracer.trace("slow"):
+            time.sleep(0.03)
+
+        assert [trace["name"] for trace in tracer.recent_traces()] == ["slow"]
+        assert [trace["name"] for trace in tracer.recent_traces(min_duration_ms=0)] == ["slow", "fast"]
+        assert tracer.recent_traces(min_duration_ms=0, name="fast")[0]["name"] == "fast"
+        assert tracer.get_stats()["slow_traces"] == 1
+
+    def test_unsampled_requests_are_noops(self):
+        tracer = Tracer(sample_rate=0.0)
+        with tracer.trace("GET /health") as root:
+            with tracer.span("inner") as span:
+                span.set(ignored=True)
+            tracer.record("phase", 0.0, 1.0)
+        assert root.trace_id is None
+        assert tracer.get_stats()["traces"] == 0
+
+    def test_late_spans_are_counted_not_exported(self):
+        tracer = Tracer()
+        with tracer.trace("POST /workflows") as root:
+            pass
+        tracer._close(type(root)(root.trace, "background", root.span_id))
+        assert tracer.get_stats()["late_spans"] == 1
+        assert len(tracer.recent_traces(min_duration_ms=0)[0]["spans"]) == 1
+
+
+class TestTraceExport:
+
+    def test_traceparent_parsing(self):
+        assert parse_traceparent("00-" + "b" * 32 + "-" + "c" * 16 + "-01") == "b" * 32
+        assert parse_traceparent("00-" + "0" * 32 + "-" + "c" * 16 + "-01") is None
+        assert parse_traceparent("invalide") is None
+        assert parse_traceparent(None) is None
+        assert parse_traceparent("00-" + "b_" * 16 + "-" + "c" * 16 + "-01") is None
+
+    def test_client_trace_ids_must_be_otlp_compatible(self):
+        """X-Trace-Id arbitraire refusé : il ferait rejeter tout le lot par le collecteur"""
+        assert valid_trace_id("A" * 32) == "a" * 32
+        for invalid in ("abc", "g" * 32, "a" * 33, "0" * 32, "+" + "a" * 31, "", None):
+            assert valid_trace_id(invalid) is None
+
+    def test_jsonl_exporter_writes_one_line_per_trace(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        exporter = JsonlExporter(str(path))
+        tracer = Tracer([exporter])
+        for name in ("a", "b"):
+            with tracer.trace(name):
+                with tracer.span("step"):
+                    pass
+        exporter.flush()
+
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line["name"] for line in lines] == ["a", "b"]
+        assert exporter.exported == 2
+
+    def test_otlp_payload_shape(self):
+        tracer = Tracer()
+        with tracer.trace("POST /chat", agent="codeur"):
+            with tracer.span("llm.generate", model="llama3"):
+                pass
+
+        payload = to_otlp(tracer.recent_traces(min_duration_ms=0))
+        spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        root, child = spans
+        assert child["parentSpanId"] == root["spanId"]
+        assert child["traceId"] == root["traceId"]
+        assert int(child["endTimeUnixNano"]) >= int(child["startTimeUnixNano"])
+        assert {"key": "model", "value": {"stringValue": "llama3"}} in child["attributes"]
@@ -0,0 +1,118 @@
+"""
+Tests du hub pub/sub des workflows (fan-out et rejeu)
+"""
+
+import asyncio
+import pytest
+
+from app.core.websocket_manager import WorkflowEventHub
+
+
+async def collect(iterator, limit: int = 100):
+    events = []
+    async for event in iterator:
+        events.append(event)
+        if len(events) >= limit:
+            break
+    return events
+
+
+class TestWorkflowEventHub:
+
+    @pytest.mark.asyncio
+    async def test_fan_out_to_multiple_subscribers(self):
+        """Deux abonnés reçoivent le même flux sans double génération"""
+        hub = WorkflowEventHub()
+        first = asyncio.create_task(collect(hub.subscribe("wf")))
+        second = asyncio.create_task(collect(hub.subscribe("wf")))
+        await asyncio.sleep(0)
+
+        hub.publish("wf", {"type": "agent_streaming", "content": "a"})
+        hub.publish("wf", {"type": "agent_streaming", "content": "b"})
+        hub.publish("wf", {"type": "workflow_completed"})
+
+        for events in await asyncio.gather(first, second):
+            assert [e["seq"] for e in events] == [1, 2, 3]
+            assert events[-1]["type"] == "workflow_completed"
+
+    @pytest.mark.asyncio
+    async def test_late_subscriber_gets_replay(self):
+        """Un abonné tardif reçoit tout le buffer puis la fin du flux"""
+        hub = WorkflowEventHub()
+        hub.publish("wf", {"type": "workflow_started"})
+        hub.publish("wf", {"type": "agent_streaming", "content": "a"})
+
+        late = asyncio.create_task(collect(hub.subscribe("wf")))
+        await asyncio.sleep(0)
+        hub.publish("wf", {"type": "workflow_completed"})
+
+        events = await late
+        assert [e["type"] for e in events] == ["workflow_started", "agent_streaming", "workflow_completed"]
+
+    @pytest.mark.asyncio
+    async def test_resume_from_offset(self):
+        """Reprise après last_seq : seuls les événements manquants sont rejoués"""
+        hub = WorkflowEventHub()
+        for i in range(5):
+            hub.publish("wf", {"type": "agent_streaming", "content": str(i)})
+        hub.publish("wf", {"type": "workflow_completed"})
+
+        events = await collect(hub.subscribe("wf", last_seq=3))
+        assert [e["seq"] for e in events] == [4, 5, 6]
+
+    @pytest.mark.asyncio
+    async def test_truncated_stream_is_replayed_as_snapshot(self):
+        """Fragments évincés du buffer : l'abonné tardif reçoit le texte complet en un instantané"""
+        hub = WorkflowEventHub(replay_size=3)
+        hub.publish("wf", {"type": "workflow_started"})
+        for i in range(5):
+            hub.publish("wf", {"type": "agent_streaming", "agent": "dev", "content": str(i)})
+        hub.publish("wf", {"type": "workflow_completed"})
+
+        events = await collect(hub.subscribe("wf", last_seq=0))
+        assert [e["type"] for e in events] == ["replay_truncated", "agent_snapshot", "workflow_completed"]
+        assert events[1]["content"] == "01234"
+        assert events[1]["seq"] == 6
+
+        # Reprise sans trou : rejeu normal des fragments
+        events = await collect(hub.subscribe("wf", last_seq=5))
+        assert [e["seq"] for e in events] == [6, 7]
+
+    @pytest.mark.asyncio
+    async def test_long_stream_alone_is_not_truncated(self):
+        """Seul l'éviction d'événements hors flux est signalée"""
+        hub = WorkflowEventHub(replay_size=2)
+        for i in range(4):
+            hub.publish("wf", {"type": "agent_streaming", "agent": "dev", "content": str(i)})
+        hub.close("wf")
+
+        events = await collect(hub.subscribe("wf", last_seq=1))
+        assert [(e["type"], e["content"], e["seq"]) for e in events] == [("agent_snapshot", "0123", 4)]
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_is_dropped(self):
+        """Un abonné dont la file déborde est déconnecté au lieu de bloquer l'émetteur"""
+        hub = WorkflowEventHub(max_pending=2)
+        task = asyncio.create_task(collect(hub.subscribe("wf")))
+        await asyncio.sleep(0)
+
+        # La tâche n'a pas encore consommé : la file se remplit
+        for i in range(5):
+            hub.publish("wf", {"type": "agent_streaming", "content": str(i)})
+
+        events = await task
+        assert events[-1]["type"] == "subscriber_lagged"
+        assert hub.subscriber_count("wf") == 0
+
+    @pytest.mark.asyncio
+    async def test_reopened_channel_continues_sequence(self):
+        """Un workflow relancé publie à nouveau, à la suite de l'ancien flux"""
+        hub = WorkflowEventHub()
+        hub.publish("wf", {"type": "step"})
+        hub.publish("wf", {"type": "workflow_cancelled"})
+        assert hub.channel("wf").closed
+
+        hub.reopen("wf")
+        hub.publish("wf", {"type": "workflow_completed"})
+        events = await collect(hub.subscribe("wf", last_seq=2))
+        assert [(e["seq"], e["type"]) for e in events] == [(3, "workflow_completed")]
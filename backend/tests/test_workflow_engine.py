@@ -0,0 +1,348 @@
+"""
+Tests du moteur de workflows d'agents : points de reprise, reprise, cache
+d'étapes, réexécution incrémentale et progression poussée
+"""
+
+import asyncio
+import pytest
+
+from app.core.state_backend import SQLiteStateBackend
+from app.core.step_memo import StepMemoStore, step_key
+from app.core.workflow_engine import WorkflowOrchestrator, first_affected_step
+from app.services.ai_service import SimpleOllamaService
+from app.services.llm_provider import FallbackResponse, LLMUnavailableError, StubProvider
+
+
+class FlakyRunner:
+    """Agent de test : échoue une fois sur les rôles indiqués, puis répond"""
+
+    def __init__(self, fail_on=(), delay=0.0):
+        self.fail_on = set(fail_on)
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, agent_role, message, context, on_delta=None):
+        self.calls.append((agent_role, context.get("last_output")))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if on_delta is not None:
+            on_delta(f"{agent_role}…")
+        if agent_role in self.fail_on:
+            self.fail_on.discard(agent_role)
+            raise RuntimeError(f"{agent_role} indisponible")
+        return f"sortie {agent_role}"
+
+
+class OfflineProvider(StubProvider):
+    """Ollama arrêté : aucune génération possible"""
+
+    async def list_models(self):
+        raise LLMUnavailableError("Ollama injoignable")
+
+    async def generate(self, model, prompt, **kwargs):
+        raise LLMUnavailableError("Ollama injoignable")
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteStateBackend(str(tmp_path / "workflows.db"))
+    yield backend
+    backend.close()
+
+
+class TestWorkflowCheckpoints:
+
+    @pytest.mark.asyncio
+    async def test_failed_step_keeps_completed_work_and_resumes(self, backend):
+        runner = FlakyRunner(fail_on={"backend_engineer"})
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=runner, memo=False)
+
+        workflow_id = await engine.execute_workflow("backend_api", "API de blog")
+        workflow = engine.get_workflow_status(workflow_id)
+        assert workflow["status"] == "failed"
+        assert workflow["next_step"] == 2
+        assert list(workflow["results"]) == ["visionnaire", "architecte"]
+        assert workflow["context"]["last_output"] == "sortie architecte"
+
+        # Redémarrage simulé : nouveau moteur, même stockage
+        runner.calls.clear()
+        restarted = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=runner, memo=False)
+        await restarted.resume_workflow(workflow_id)
+        workflow = restarted.get_workflow_status(workflow_id)
+        assert workflow["status"] == "completed"
+        assert workflow["resumed"] == 1
+        # Seules les étapes incomplètes sont rejouées, avec le contexte sauvegardé
+        assert runner.calls[0] == ("backend_engineer", "sortie architecte")
+        assert [role for role, _ in runner.calls] == ["backend_engineer", "database_specialist", "critique"]
+        assert [step["index"] for step in workflow["steps"]] == [0, 1, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_interrupted_workflow_resumes_after_stop(self, backend):
+        runner = FlakyRunner(delay=0.05)
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=runner, memo=False)
+
+        workflow_id = engine.create_workflow("code_review", "Revois ce module")
+        task = engine.run_in_background(workflow_id)
+        await asyncio.sleep(0.07)
+        assert engine.stop_workflow(workflow_id)
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        workflow = engine.get_workflow_status(workflow_id)
+        assert workflow["status"] == "interrupted"
+        assert workflow["next_step"] == 1
+
+        await engine.resume_workflow(workflow_id)
+        assert engine.get_workflow_status(workflow_id)["status"] == "completed"
+        assert [role for role, _ in runner.calls].count("critique") == 1
+
+    @pytest.mark.asyncio
+    async def test_fallback_step_is_retried_on_resume(self, backend):
+        """Un texte de repli n'est pas une étape terminée : la reprise la rejoue"""
+        runner = FlakyRunner()
+        replies = iter([FallbackResponse("❌ Erreur avec architecte: deepseek-coder:6.7b non disponible",
+                                         reason="deepseek-coder:6.7b: délai dépassé")])
+
+        async def recovering_runner(agent_role, message, context, on_delta=None):
+            if agent_role == "architecte":
+                fallback = next(replies, None)
+                if fallback is not None:
+                    return fallback
+            return await runner(agent_role, message, context, on_delta)
+
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=recovering_runner, memo=False)
+        workflow_id = await engine.execute_workflow("backend_api", "API de blog")
+        workflow = engine.get_workflow_status(workflow_id)
+        assert workflow["status"] == "failed"
+        assert workflow["next_step"] == 1
+        assert list(workflow["results"]) == ["visionnaire"]
+
+        runner.calls.clear()
+        await engine.resume_workflow(workflow_id)
+        workflow = engine.get_workflow_status(workflow_id)
+        assert workflow["status"] == "completed"
+        assert runner.calls[0] == ("architecte", "sortie visionnaire")
+        assert workflow["results"]["architecte"] == "sortie architecte"
+
+    @pytest.mark.asyncio
+    async def test_resume_guards(self, backend):
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=FlakyRunner(), memo=False)
+        with pytest.raises(KeyError):
+            engine.prepare_resume("inconnu")
+
+        workflow_id = engine.create_workflow("code_review", "x")
+        engine.running_workflows.update_item(workflow_id, status="running")
+        # Marqué en cours par un processus disparu : reprise explicite seulement
+        with pytest.raises(ValueError):
+            engine.prepare_resume(workflow_id)
+        assert engine.prepare_resume(workflow_id, force=True)["status"] == "pending"
+
+
+class TestStepMemo:
+
+    def test_key_ignores_whitespace_but_tracks_upstream(self):
+        base = step_key("architecte", "qwen2.5:3b", "API de blog", {"last_output": "vision"})
+        assert step_key("architecte", "qwen2.5:3b", "  API   de\nblog ", {"last_output": "vision"}) == base
+        assert step_key("architecte", "qwen2.5:3b", "API de blog", {"last_output": "autre"}) != base
+        assert step_key("architecte", "llama3.1:8b", "API de blog", {"last_output": "vision"}) != base
+
+    def test_entries_expire(self, backend):
+        memo = StepMemoStore(backend.namespace("memo"), ttl=10)
+        memo.put("k", "critique", "m", "sortie", 2.0)
+        assert memo.get("k")["output"] == "sortie"
+        backend.namespace("memo").update_item("k", created_at=0)
+        assert memo.get("k") is None
+        assert memo.stats()["hits"] == 1 and memo.stats()["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_shared_prefix_reused_across_workflows(self, backend):
+        runner = FlakyRunner()
+        memo = StepMemoStore(backend.namespace("memo"))
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=runner, memo=memo)
+
+        await engine.execute_workflow("backend_api", "API de blog")
+        runner.calls.clear()
+        workflow_id = await engine.execute_workflow("full_development", "API  de blog")
+        workflow = engine.get_workflow_status(workflow_id)
+
+        assert workflow["status"] == "completed"
+        # visionnaire et architecte sont communs : servis par le cache. Les sorties
+        # de test ne dépendant que du rôle, database_specialist et critique
+        # reçoivent aussi une entrée déjà vue et sont réutilisés.
+        assert [role for role, _ in runner.calls] == ["frontend_engineer", "backend_engineer", "optimiseur"]
+        assert [step["memoized"] for step in workflow["steps"][:3]] == [True, True, False]
+        assert workflow["memo"]["reused_steps"] == 4
+        # L'étape suivante reçoit bien la sortie mémoïsée
+        assert runner.calls[0] == ("frontend_engineer", "sortie architecte")
+
+    @pytest.mark.asyncio
+    async def test_fallback_output_fails_step_and_is_not_memoized(self, backend):
+        """Ollama absent : le texte de simulation n'est ni une sortie terminée ni mis en cache"""
+        service = SimpleOllamaService(OfflineProvider())
+        memo_store = backend.namespace("memo")
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=service.query_agent,
+                                      memo=StepMemoStore(memo_store))
+
+        workflow_id = await engine.execute_workflow("code_review", "Revois ce module")
+        workflow = engine.get_workflow_status(workflow_id)
+        assert workflow["status"] == "failed"
+        assert workflow["steps"][0]["status"] == "failed"
+        assert "Ollama non disponible" in workflow["steps"][0]["error_message"]
+        assert workflow["results"] == {}
+        assert "last_output" not in workflow["context"]
+        assert len(memo_store) == 0
+
+    @pytest.mark.asyncio
+    async def test_force_refresh_bypasses_memo(self, backend):
+        runner = FlakyRunner()
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=runner,
+                                      memo=StepMemoStore(backend.namespace("memo")))
+
+        await engine.execute_workflow("code_review", "Revois ce module")
+        await engine.execute_workflow("code_review", "Revois ce module")
+        assert len(runner.calls) == 2
+
+        workflow_id = await engine.execute_workflow("code_review", "Revois ce module", force_refresh=True)
+        assert len(runner.calls) == 4
+        assert engine.get_workflow_status(workflow_id)["memo"]["reused_steps"] == 0
+
+
+class TestIncrementalRerun:
+
+    def test_affected_steps(self):
+        steps = ["visionnaire", "architecte", "backend_engineer", "critique"]
+        assert first_affected_step(steps, request_changed=True, edited_roles={"critique"}) == 0
+        assert first_affected_step(steps, False, {"architecte", "critique"}) == 2
+        assert first_affected_step(steps, False) == len(steps)
+
+    @pytest.mark.asyncio
+    async def test_edited_output_reruns_downstream_only(self, backend):
+        runner = FlakyRunner()
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=runner, memo=False)
+        parent_id = await engine.execute_workflow("backend_api", "API de blog", {"projectId": "p1"})
+
+        runner.calls.clear()
+        rerun_id = await engine.rerun_workflow(parent_id, edits={"architecte": "architecture revue"})
+        rerun = engine.get_workflow_status(rerun_id)
+
+        assert rerun["status"] == "completed"
+        assert rerun["parent_id"] == parent_id
+        assert runner.calls[0] == ("backend_engineer", "architecture revue")
+        assert [role for role, _ in runner.calls] == ["backend_engineer", "database_specialist", "critique"]
+        assert rerun["results"]["architecte"] == "architecture revue"
+        assert [step.get("reused", False) for step in rerun["steps"]] == [True, True, False, False, False]
+        assert rerun["steps"][1]["edited"]
+        assert rerun["context"]["projectId"] == "p1"
+        # Le passage précédent reste intact
+        assert engine.get_workflow_status(parent_id)["results"]["architecte"] == "sortie architecte"
+
+    @pytest.mark.asyncio
+    async def test_request_change_and_guards(self, backend):
+        runner = FlakyRunner()
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=runner, memo=False)
+        parent_id = await engine.execute_workflow("code_review", "Revois ce module")
+
+        # Espaces seuls : rien à recalculer
+        runner.calls.clear()
+        await engine.rerun_workflow(parent_id, user_request="Revois  ce module ")
+        assert runner.calls == []
+
+        await engine.rerun_workflow(parent_id, user_request="Revois le module de paiement")
+        assert [role for role, _ in runner.calls] == ["critique", "optimiseur"]
+
+        with pytest.raises(ValueError):
+            engine.prepare_rerun(parent_id, edits={"designer_ui_ux": "maquette"})
+        with pytest.raises(KeyError):
+            engine.prepare_rerun("inconnu")
+        engine.running_workflows.update_item(parent_id, status="running")
+        with pytest.raises(RuntimeError):
+            engine.prepare_rerun(parent_id)
+
+
+class TestWorkflowEvents:
+
+    @pytest.mark.asyncio
+    async def test_step_events_are_pushed(self, backend):
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=FlakyRunner(), memo=False)
+        workflow_id = engine.create_workflow("code_review", "Revois ce module")
+        events = []
+
+        async def listen():
+            async for event in engine.stream_events(workflow_id):
+                events.append(event)
+
+        listener = asyncio.create_task(listen())
+        await asyncio.sleep(0)
+        await engine.resume_workflow(workflow_id)
+        await asyncio.wait_for(listener, 1)
+
+        assert [event["type"] for event in events] == [
+            "workflow_started",
+            "step_started", "step_progress", "step_completed",
+            "step_started", "step_progress", "step_completed",
+            "workflow_completed",
+        ]
+        assert events[2]["delta"] == "critique…"
+        assert events[3]["output"] == "sortie critique"
+        assert [event["seq"] for event in events] == list(range(1, 9))
+        assert events[-1]["version"] == engine.get_workflow_status(workflow_id)["version"]
+
+    @pytest.mark.asyncio
+    async def test_long_poll_wakes_on_change(self, backend):
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=FlakyRunner(delay=0.05), memo=False)
+        workflow_id = engine.create_workflow("code_review", "Revois ce module")
+        version = engine.get_workflow_status(workflow_id)["version"]
+
+        # Rien ne change : l'attente expire et rend l'état courant
+        unchanged = await engine.wait_for_change(workflow_id, version, timeout=0.05)
+        assert unchanged["version"] == version
+
+        engine.run_in_background(workflow_id)
+        changed = await asyncio.wait_for(engine.wait_for_change(workflow_id, version, timeout=5), 0.5)
+        assert changed["version"] > version
+        assert changed["status"] == "running"
+        assert await engine.wait_for_change("inconnu", 0, timeout=0) is None
+
+    @pytest.mark.asyncio
+    async def test_long_polls_leave_no_waiter_behind(self, backend):
+        """Long-polls sur un workflow qui ne bouge plus : événement retiré après le dernier"""
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=FlakyRunner(), memo=False)
+        workflow_id = engine.create_workflow("code_review", "Revois ce module")
+        version = engine.get_workflow_status(workflow_id)["version"]
+
+        first = asyncio.create_task(engine.wait_for_change(workflow_id, version, timeout=0.1))
+        await asyncio.sleep(0.02)
+        second = asyncio.create_task(engine.wait_for_change(workflow_id, version, timeout=0.05))
+        await second
+        # Le premier attend toujours sur le même événement
+        assert workflow_id in engine._waiters
+        await first
+        assert engine._waiters == {} and engine._pollers == {}
+
+    @pytest.mark.asyncio
+    async def test_unknown_to_process_yields_snapshot(self, backend):
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=FlakyRunner(), memo=False)
+        workflow_id = await engine.execute_workflow("code_review", "Revois ce module")
+
+        restarted = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=FlakyRunner(), memo=False)
+        events = [event async for event in restarted.stream_events(workflow_id)]
+        assert [(e["type"], e["status"]) for e in events] == [("workflow_snapshot", "completed")]
+
+
+class TestWorkflowListing:
+
+    @pytest.mark.asyncio
+    async def test_paginated_summaries_by_status_and_type(self, backend):
+        engine = WorkflowOrchestrator(store=backend.namespace("wf"), agent_runner=FlakyRunner(), memo=False)
+        completed = [await engine.execute_workflow("code_review", f"Revue {i}") for i in range(3)]
+        pending = engine.create_workflow("backend_api", "API")
+
+        page, cursor = engine.list_workflows(status="completed", limit=2)
+        assert len(page) == 2 and cursor is not None
+        rest, cursor = engine.list_workflows(status="completed", cursor=cursor, limit=2)
+        assert cursor is None
+        assert {workflow["id"] for workflow in page + rest} == set(completed)
+        # Projection : ni étapes ni sorties
+        assert "results" not in page[0] and "steps" not in page[0]
+
+        page, _ = engine.list_workflows(workflow_type="backend_api")
+        assert [(workflow["id"], workflow["status"]) for workflow in page] == [(pending, "pending")]
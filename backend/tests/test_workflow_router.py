@@ -0,0 +1,75 @@
+"""
+Tests du routage des demandes vers workflows et agents
+"""
+
+import pytest
+
+from app.core.workflow_engine import WorkflowOrchestrator
+from app.core.workflow_router import KeywordTrie, WorkflowRouter, tokenize
+
+
+def make_router(**kwargs):
+    return WorkflowRouter(
+        WorkflowOrchestrator().workflow_templates,
+        agent_models={"visionnaire": "qwen2.5:3b", "frontend_engineer": "deepseek-coder:6.7b",
+                      "backend_engineer": "deepseek-coder:6.7b", "critique": "deepseek-r1:8b",
+                      "optimiseur": "deepseek-coder:6.7b"},
+        **kwargs
+    )
+
+
+class TestKeywordTrie:
+
+    def test_phrases_prefixes_and_accents(self):
+        trie = KeywordTrie({"base de donnees": ["database"], "optimis*": ["optimization"], "api": ["backend"]})
+        matches = trie.match(tokenize("Optimiser la base de données et l'API"))
+        assert {phrase for phrase, _ in matches} == {"base de donnees", "optimis*", "api"}
+        assert trie.match(tokenize("une base solide")) == []
+
+
+class TestWorkflowRouter:
+
+    def test_full_development_only_for_full_stack_requests(self):
+        router = make_router()
+        assert router.route("Crée une application complète frontend et backend")["workflow"] == "full_development"
+        assert router.route("Crée une API REST avec PostgreSQL")["workflow"] == "backend_api"
+        assert router.route("Crée une page React")["workflow"] == "frontend_only"
+        # Construction sans domaine reconnu : plus jamais full_development par défaut
+        decision = router.route("Crée un jeu de morpion")
+        assert decision["source"] == "default"
+        assert decision["workflow"] != "full_development"
+
+    def test_single_agent_when_it_suffices(self):
+        router = make_router()
+        decision = router.route("Optimise cette fonction, elle est lente")
+        assert decision["kind"] == "agent"
+        assert decision["agent"] == "optimiseur"
+        assert router.route("Optimise cette fonction", allow_agents=False)["workflow"] == "code_review"
+        assert router.route("Bonjour !")["agent"] == "assistant"
+
+    def test_cost_uses_history_before_model_size(self):
+        latencies = {"critique": 2.0, "optimiseur": 1.0}
+        router = make_router(latency_source=latencies.get)
+        cost = router.route("Fais une review et optimise", allow_agents=False)["estimated_cost"]
+        assert cost == {"steps": 2, "estimated_seconds": 3.0, "by_agent": {"critique": 2.0, "optimiseur": 1.0},
+                        "latency_source": "history"}
+        assert make_router().estimate_cost(["critique"])["estimated_seconds"] == 16.0
+
+    @pytest.mark.asyncio
+    async def test_classifier_decisions_are_cached(self):
+        calls = []
+
+        async def classifier(request, labels):
+            calls.append(request)
+            return "frontend_only"
+
+        router = make_router(classifier=classifier)
+        for _ in range(2):
+            decision = await router.aroute("Crée un jeu de morpion")
+            assert decision["source"] == "classifier"
+            assert decision["workflow"] == "frontend_only"
+        assert len(calls) == 1
+        assert router.get_stats()["classifier_cache_hits"] == 1
+        # Une règle qui tranche ne consulte pas le modèle
+        assert (await router.aroute("Crée une API REST"))["source"] == "rules"
+        assert len(calls) == 1
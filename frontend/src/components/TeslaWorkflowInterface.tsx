@@ -156,6 +156,8 @@ export default MonApplication;`);
   // Système de fichiers du projet
   const [projectFiles, setProjectFiles] = useState<Record<string, any>>({});
   const [selectedFile, setSelectedFile] = useState<string>('');
+  const [archiveUrl, setArchiveUrl] = useState<string | null>(null);
+  const openingFileRef = useRef('');
   const [generatedFiles, setGeneratedFiles] = useState<Array<{name: string, content: string, language: string}>>([]);
   const [showFileExplorer, setShowFileExplorer] = useState(true);
 
@@ -211,6 +213,65 @@ export default MonApplication;`);
     return response.json();
   };
 
+  // Fichiers générés : la liste ne contient que les métadonnées (chemin, taille,
+  // langage, url), le contenu est servi fichier par fichier par /files/{path}
+  const PREVIEW_EXTENSIONS = ['tsx', 'jsx', 'ts', 'js', 'css', 'html'];
+
+  const fetchFileContent = async (url: string): Promise<string> => {
+    const response = await fetch(`http://localhost:8011${url}`);
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    return response.text();
+  };
+
+  const loadWorkflowFiles = async (
+    workflowId: string,
+    { includeContent = false }: { includeContent?: boolean } = {}
+  ): Promise<Record<string, any>> => {
+    if (includeContent) {
+      // Ancien format : tout le contenu inline (compatibilité uniquement)
+      const legacy = await request(`/ultra/workflow/${workflowId}/files?include_content=true`);
+      return legacy.files || {};
+    }
+
+    const listing = await request(`/ultra/workflow/${workflowId}/files`);
+    setArchiveUrl(listing.archive_url || null);
+    const files: Record<string, any> = {};
+    (listing.files || []).forEach((entry: any) => {
+      files[entry.path] = entry;
+    });
+
+    // Seules les sources utiles à la preview sont chargées d'emblée
+    await Promise.all(Object.values(files)
+      .filter((file: any) => PREVIEW_EXTENSIONS.includes(file.path.split('.').pop() || ''))
+      .map(async (file: any) => {
+        file.content = await fetchFileContent(file.url);
+      }));
+    return files;
+  };
+
+  // Ouvre un fichier dans l'éditeur, en chargeant son contenu au besoin
+  const openProjectFile = async (filepath: string, fileData: any) => {
+    openingFileRef.current = filepath;
+    setSelectedFile(filepath);
+    setCodeLanguage(fileData.language || 'typescript');
+    if (fileData.content === undefined && fileData.url) {
+      try {
+        const content = await fetchFileContent(fileData.url);
+        setProjectFiles(prev => ({ ...prev, [filepath]: { ...prev[filepath], content } }));
+        // Un autre fichier a pu être ouvert pendant le chargement
+        if (openingFileRef.current === filepath) {
+          setGeneratedCode(content);
+        }
+      } catch (error) {
+        console.error('❌ Erreur chargement fichier:', error);
+      }
+      return;
+    }
+    setGeneratedCode(fileData.content || '');
+  };
+
   const agents: Agent[] = [
     {
       id: 'frontend',
@@ -570,22 +631,22 @@ export default MonApplication;`);
               // Récupérer les fichiers
               setTimeout(async () => {
                 try {
-                  const filesResponse = await request(`/ultra/workflow/${wsData.workflow_id}/files`);
-                  
-                  if (filesResponse.files && Object.keys(filesResponse.files).length > 0) {
-                    const filesList = Object.entries(filesResponse.files).map(([path, file]) => ({
-                      path,
-                      content: file.content,
+                  const files = await loadWorkflowFiles(wsData.workflow_id);
+
+                  if (Object.keys(files).length > 0) {
+                    const filesList = Object.entries(files).map(([path, file]: [string, any]) => ({
+                      name: path,
+                      content: file.content || '',
                       language: file.language
                     }));
-                    
+
                     setGeneratedFiles(filesList);
-                    
-                    if (filesList.length > 0) {
-                      setSelectedFile(filesList[0]);
-                    }
-                    
-                    const previewHtml = generatePreviewFromFiles(filesList);
+                    setProjectFiles(files);
+
+                    const firstFile = Object.keys(files)[0];
+                    await openProjectFile(firstFile, files[firstFile]);
+
+                    const previewHtml = generatePreviewFromFiles(files);
                     setPreviewContent(previewHtml);
                     
                     const completionMessage: Message = {
@@ -827,35 +888,23 @@ export default MonApplication;`);
                   setTimeout(async () => {
                     try {
                       console.log('🎬 Récupération automatique des fichiers pour preview...');
-                      const filesResponse = await request(`/ultra/workflow/${data.workflow_id}/files`);
-                      
-                      if (filesResponse?.files && Object.keys(filesResponse.files).length > 0) {
+                      const files = await loadWorkflowFiles(data.workflow_id);
+
+                      if (Object.keys(files).length > 0) {
                         console.log('🎬 Génération preview automatique...');
-                        const previewHtml = generatePreviewHTMLFromFiles(filesResponse.files);
+                        const previewHtml = generatePreviewHTMLFromFiles(files);
                         setPreviewContent(previewHtml);
                         setShowPreview(true);
-                        
+
                         // Basculer automatiquement vers l'onglet Preview
                         setEditorView('preview');
-                        
+
                         // Ajouter les fichiers à l'éditeur et au file explorer
-                        const allFiles: Record<string, any> = {};
-                        Object.entries(filesResponse.files).forEach(([path, file]: [string, any]) => {
-                          allFiles[path] = {
-                            content: file.content,
-                            language: file.language
-                          };
-                        });
-                        
-                        setProjectFiles(allFiles);
-                        
+                        setProjectFiles(files);
+
                         // Sélectionner le premier fichier par défaut
-                        const firstFile = Object.keys(filesResponse.files)[0];
-                        if (firstFile) {
-                          setSelectedFile(firstFile);
-                          setGeneratedCode(filesResponse.files[firstFile].content);
-                          setCodeLanguage(filesResponse.files[firstFile].language);
-                        }
+                        const firstFile = Object.keys(files)[0];
+                        await openProjectFile(firstFile, files[firstFile]);
                         
                         console.log('✅ Preview automatique générée et affichée !');
                         
@@ -1081,39 +1130,29 @@ export default MonApplication;`);
             
             // Récupérer les fichiers générés et générer la preview
             try {
-              const filesResponse = await request(`/ultra/workflow/${workflowId}/files`);
-              if (filesResponse.files && Object.keys(filesResponse.files).length > 0) {
-                console.log('📁 Fichiers récupérés:', Object.keys(filesResponse.files));
-                
-                // Combiner tous les fichiers avec des séparateurs clairs pour Monaco
-                const allCode = Object.entries(filesResponse.files)
-                  .map(([filename, fileData]: [string, any]) => 
-                    `// =================== ${filename} ===================\n${fileData.content || ''}`
-                  ).join('\n\n');
-                
-                setGeneratedCode(allCode);
+              const files = await loadWorkflowFiles(workflowId);
+              if (Object.keys(files).length > 0) {
+                console.log('📁 Fichiers récupérés:', Object.keys(files));
+
                 setShowCodeEditor(true);
-                
+
                 // Stocker les fichiers du projet pour l'explorateur
-                setProjectFiles(filesResponse.files);
-                
-                // Générer automatiquement la preview avec tous les fichiers
+                setProjectFiles(files);
+
+                // Générer automatiquement la preview avec les sources chargées
                 console.log('🎬 Génération preview automatique...');
-                const previewHtml = generatePreviewHTMLFromFiles(filesResponse.files);
+                const previewHtml = generatePreviewHTMLFromFiles(files);
                 setPreviewContent(previewHtml);
                 setShowPreview(true);
-                
-                // Sélectionner le premier fichier par défaut
-                const firstFile = Object.keys(filesResponse.files)[0];
-                if (firstFile) {
-                  setSelectedFile(firstFile);
-                  setGeneratedCode(filesResponse.files[firstFile].content);
-                }
-                
+
+                // Ouvrir le premier fichier par défaut
+                const firstFile = Object.keys(files)[0];
+                await openProjectFile(firstFile, files[firstFile]);
+
                 const filesMessage: Message = {
                   id: `files_${workflowId}`,
                   type: 'system',
-                  content: `📁 ${Object.keys(filesResponse.files).length} fichiers générés ! Code affiché dans l'éditeur et preview générée.`,
+                  content: `📁 ${Object.keys(files).length} fichiers générés ! Code affiché dans l'éditeur et preview générée.`,
                   timestamp: new Date()
                 };
                 
@@ -1224,30 +1263,16 @@ export default MonApplication;`);
           
           const fetchFilesWithRetry = async () => {
             try {
-              const filesResponse = await request(`/ultra/workflow/${workflowId}/files`);
-              console.log('📁 Fichiers générés par les agents:', filesResponse);
-              
-              if (filesResponse.files && Object.keys(filesResponse.files).length > 0) {
+              const files = await loadWorkflowFiles(workflowId);
+              console.log('📁 Fichiers générés par les agents:', Object.keys(files));
+
+              if (Object.keys(files).length > 0) {
                 // Stocker les fichiers du projet pour l'explorateur
-                setProjectFiles(filesResponse.files);
-                
-                // Utiliser le vrai code généré - TOUS LES FICHIERS
-                const files = filesResponse.files;
-                
-                // Combiner tous les fichiers avec séparateurs clairs pour l'affichage général
-                const allCode = Object.entries(files)
-                  .map(([filename, fileData]: [string, any]) => 
-                    `// =================== ${filename} ===================\n${fileData.content || ''}`
-                  ).join('\n\n');
-                
-                setGeneratedCode(allCode);
-                setCodeLanguage('typescript');
-                
-                // Sélectionner le premier fichier par défaut dans l'explorateur
+                setProjectFiles(files);
+
+                // Ouvrir le premier fichier par défaut dans l'explorateur
                 const firstFile = Object.keys(files)[0];
-                if (firstFile) {
-                  setSelectedFile(firstFile);
-                }
+                await openProjectFile(firstFile, files[firstFile]);
                 
                 // Générer automatiquement la preview
                 console.log('🎬 Génération preview automatique...');
@@ -1678,17 +1703,12 @@ export default SnakeGame;`;
           
           // Récupérer les fichiers si disponibles
           try {
-            const filesResponse = await request(`/ultra/workflow/${workflowId}/files`);
-            if (filesResponse.files) {
-              const allCode = Object.entries(filesResponse.files)
-                .map(([filename, fileData]: [string, any]) => 
-                  `// ${filename}\n${fileData.content || ''}`
-                ).join('\n\n');
-              
-              if (allCode.trim()) {
-                setGeneratedCode(allCode);
-                setShowCodeEditor(true);
-              }
+            const files = await loadWorkflowFiles(workflowId);
+            const firstFile = Object.keys(files)[0];
+            if (firstFile) {
+              setProjectFiles(files);
+              await openProjectFile(firstFile, files[firstFile]);
+              setShowCodeEditor(true);
             }
           } catch (e) {
             console.warn('Erreur fichiers:', e);
@@ -4006,11 +4026,7 @@ ${createDiscoverySummary(context)}
                                     }`}
                                     whileHover={{ x: 4 }}
                                     whileTap={{ scale: 0.98 }}
-                                    onClick={() => {
-                                      setSelectedFile(filepath);
-                                      setGeneratedCode(fileData.content);
-                                      setCodeLanguage(fileData.language || 'typescript');
-                                    }}
+                                    onClick={() => openProjectFile(filepath, fileData)}
                                   >
                                     <div className="flex items-center space-x-2">
                                       <span className="text-lg">{getFileIcon(fileExtension)}</span>
@@ -4081,7 +4097,19 @@ ${createDiscoverySummary(context)}
                               >
                                 <Copy className="w-4 h-4" />
                               </motion.button>
-                              
+
+                              {archiveUrl && (
+                                <motion.button
+                                  className="p-1 text-gray-400 hover:text-white transition-colors"
+                                  whileHover={{ scale: 1.1 }}
+                                  whileTap={{ scale: 0.9 }}
+                                  onClick={() => window.open(`http://localhost:8011${archiveUrl}?format=zip`, '_blank')}
+                                  title="Télécharger le projet (zip)"
+                                >
+                                  <Download className="w-4 h-4" />
+                                </motion.button>
+                              )}
+
                               <select 
                                 value={codeLanguage} 
                                 onChange={(e) => setCodeLanguage(e.target.value)}